@@ -1,3 +1,5 @@
 #!/usr/bin/env python
 #pylint: skip-file
 import summaryrank.__main__
+
+summaryrank.__main__.main()
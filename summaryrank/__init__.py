@@ -1,4 +1,11 @@
 """
 The root package
 """
-from summaryrank.base import Feature, FeatureSet, Model, open
+from summaryrank.base import Feature, FeatureSet, MemoryModel, Model, SQLiteModel, get_model, open
+
+
+def score(query, sentences, features, **kwargs):
+    """ Compute features of sentences against a query in memory (see summaryrank.scoring) """
+    # imported here, as the feature modules take a while to load
+    from summaryrank.scoring import score as _score
+    return _score(query, sentences, features, **kwargs)
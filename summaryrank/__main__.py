@@ -2,9 +2,12 @@
 The main script
 """
 import argparse
+import sys
 
 import summaryrank.features
 import summaryrank.importers
+import summaryrank.pipeline
+import summaryrank.shard
 import summaryrank.tools
 
 DESCRIPTION = '''
@@ -44,7 +47,14 @@ GENERAL_FUNCTIONS = [
     ("join", summaryrank.tools.join),
     ("shuffle", summaryrank.tools.shuffle),
     ("split", summaryrank.tools.split),
+    ("select", summaryrank.tools.select),
+    ("index", summaryrank.tools.index),
     ("normalize", summaryrank.tools.normalize),
+    ("convert", summaryrank.tools.convert),
+    ("pipeline", summaryrank.pipeline.pipeline),
+    ("shard", summaryrank.shard.shard),
+    ("merge", summaryrank.shard.merge),
+    ("work", summaryrank.shard.work),
 ]
 
 
@@ -54,7 +64,8 @@ def _make_command_list(functions):
             for name, func in functions]
 
 
-if __name__.endswith('__main__'):
+def main():
+    """ Run a command given on the command line """
     importer_commands = ''.join(_make_command_list(IMPORTER_FUNCTIONS))
     feature_commands = ''.join(_make_command_list(FEATURE_FUNCTIONS))
     general_commands = ''.join(_make_command_list(GENERAL_FUNCTIONS))
@@ -78,9 +89,15 @@ if __name__.endswith('__main__'):
     commands.update(GENERAL_FUNCTIONS)
 
     if args.command in commands:
-        commands[args.command](args.argv)
+        status = commands[args.command](args.argv)
+        if isinstance(status, int) and status:
+            sys.exit(status)
     else:
         if args.command is not None:
             parser.error("invalid command '{}'".format(args.command))
         else:
             parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,83 +1,310 @@
 """
 Basic components
 """
-import bz2
-import gzip
+import collections
+import fcntl
+import hashlib
+import json
+import os
 import os.path
+import re
+import sqlite3
+import tempfile
 
-from summaryrank.util import SaveFileLineIndicator
+from summaryrank import compression
+from summaryrank.util import RowWriter, SaveFileLineIndicator, unique
 
 
-def open(filename, *args):
+def open(filename, *args, **kwargs):
     """ Return a file-like object for various compressed format. """
-    if filename.endswith('.gz'):
-        opener = gzip.open
-    elif filename.endswith('.bz2'):
-        opener = bz2.BZ2File
-    else:
-        opener = file
-    return opener(filename, *args)
+    return compression.open(filename, *args, **kwargs)
+
+
+def get_key_columns(name):
+    """ Return the positions of the qid, docno and id columns of a representation """
+    if name.startswith('topics_'):
+        return {'qid': 0}
+    elif name.startswith('sentences_') or name == 'qrels':
+        return {'docno': 0, 'id': 1, 'qid': 2}
+    return dict()
+
+
+def get_model(path, backend=None):
+    """ Return the model in path, with the given storage backend or else the recorded one """
+    if backend is None:
+        backend = Model(path).backend
+    return BACKENDS[backend](path)
 
 
 class Model(object):
-    """ A facade for various within-model data operations """
+    """ A facade for various within-model data operations
+
+    The model manifest (manifest.json) records the codec of the model files,
+    which defaults to gzip, and the storage backend (see SQLiteModel).
+
+    A representation can be made up of several segments, NAME (segment 0),
+    NAME.1, NAME.2 and so on, which are read as one.  Segments are added by
+    importing in append mode, and segment k of every representation covers the
+    same topics, so that generators only need to process the missing ones.
+
+    If qids is set, load_representation() (and thus load_topics() and so on)
+    only returns the rows of these qids.
+    """
+
+    MANIFEST = 'manifest.json'
+    MANIFEST_LOCK = '.manifest.lock'
+    IMPORT_NAMES = ('topics_text', 'sentences_text', 'qrels')
+    BACKEND = 'files'
 
     def __init__(self, path):
         self.path = path
+        self.qids = None
 
     def create(self):
         """ Create the model directory """
         if not os.path.exists(self.path):
             os.mkdir(self.path)
 
-    def get_path(self, name):
-        """ Return the path to the given file """
-        return os.path.join(self.path, '{}.gz'.format(name))
+    def load_manifest(self):
+        """ Return the model manifest (a dict) """
+        path = os.path.join(self.path, self.MANIFEST)
+        if not os.path.exists(path):
+            return dict()
+        with file(path) as in_:
+            return json.load(in_)
 
-    def open(self, name, *args):
-        """ Open a within-model gzip'ed file """
-        return gzip.open(self.get_path(name), *args)
+    def save_manifest(self, manifest):
+        """ Save the model manifest """
+        self.create()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.manifest-')
+        with os.fdopen(fd, 'w') as out:
+            json.dump(manifest, out, indent=2, sort_keys=True)
+        os.rename(tmp_path, os.path.join(self.path, self.MANIFEST))
+
+    def update_manifest(self, update):
+        """ Update the model manifest in place with update(manifest)
+
+        The manifest is read, updated and saved under a lock, so that other
+        processes updating it at the same time (e.g., pipeline steps) do not
+        lose each other's changes.
+        """
+        self.create()
+        with file(os.path.join(self.path, self.MANIFEST_LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self.load_manifest()
+            update(manifest)
+            self.save_manifest(manifest)
+
+    @property
+    def codec(self):
+        """ The codec of the model files """
+        return self.load_manifest().get('codec', compression.DEFAULT_CODEC)
+
+    def set_codec(self, codec):
+        """ Set the codec for the model files written from now on """
+        compression.parse_codec(codec)
+        self.update_manifest(lambda manifest: manifest.update(codec=codec))
+
+    @property
+    def backend(self):
+        """ The recorded storage backend of the model """
+        return self.load_manifest().get('backend', Model.BACKEND)
+
+    def save_backend(self):
+        """ Record the storage backend of this model object in the manifest """
+        self.update_manifest(lambda manifest: manifest.update(backend=self.BACKEND))
+
+    @staticmethod
+    def _get_segment_name(name, segment):
+        return '{}.{}'.format(name, segment) if segment else name
+
+    def _get_paths(self, name):
+        extensions = unique(codec.extension for codec in compression.CODECS.values())
+        return [os.path.join(self.path, name + extension) for extension in extensions]
+
+    def get_path(self, name, segment=0):
+        """ Return the path to the given file (existing, or to be written) """
+        name = self._get_segment_name(name, segment)
+        path = os.path.join(self.path, name + compression.get_extension(self.codec))
+        if os.path.exists(path):
+            return path
+        for other_path in self._get_paths(name):
+            if os.path.exists(other_path):
+                return other_path
+        return path
+
+    def get_output_path(self, name, segment=0):
+        """ Return the path to write the given file to, removing stale copies """
+        self.create()
+        name = self._get_segment_name(name, segment)
+        path = os.path.join(self.path, name + compression.get_extension(self.codec))
+        for other_path in self._get_paths(name):
+            if other_path != path and os.path.exists(other_path):
+                os.remove(other_path)
+        return path
+
+    def open(self, name, mode='rb', segment=0):
+        """ Open a within-model file, compressed with the model codec if written """
+        if 'r' in mode:
+            return open(self.get_path(name, segment), mode)
+        return open(self.get_output_path(name, segment), mode, codec=self.codec)
+
+    def writer(self, name, segment=0):
+        """ Return a FileWriter to a within-model file
+
+        Rows are formatted and compressed on a background thread, and any
+        error in doing so is raised on close (or the next write).
+        """
+        return FileWriter(self.get_output_path(name, segment), self.codec)
+
+    def get_segments(self, name):
+        """ Return the (sorted) numbers of the existing segments of a representation """
+        if not os.path.isdir(self.path):
+            return []
+        extensions = unique(codec.extension for codec in compression.CODECS.values())
+        pattern = re.compile(r'^{}(?:\.(\d+))?(?:{})$'.format(
+            re.escape(name), '|'.join(re.escape(extension) for extension in extensions)))
+        matches = [pattern.match(filename) for filename in os.listdir(self.path)]
+        return sorted(set(int(m.group(1) or 0) for m in matches if m))
+
+    def get_files(self, name):
+        """ Return the paths to the existing segments of a representation """
+        return [self.get_path(name, segment) for segment in self.get_segments(name)]
+
+    def next_segment(self, names):
+        """ Return the number of the next segment to add to all the given representations """
+        return max([self.get_segments(name)[-1] + 1 for name in names
+                    if self.get_segments(name)] or [0])
+
+    def remove_segments(self, name, keep=()):
+        """ Remove the segments of a representation (except for those to keep) """
+        for segment in self.get_segments(name):
+            if segment not in keep:
+                for path in self._get_paths(self._get_segment_name(name, segment)):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def get_segments_to_generate(self, source, targets, append=False):
+        """ Return the segments of the source representation to generate the targets from
+
+        In append mode, these are the segments that some target is missing;
+        otherwise, all of them, and the target segments with no counterpart in
+        the source are removed.
+        """
+        segments = self.get_segments(source)
+        if append:
+            return [segment for segment in segments
+                    if not all(segment in self.get_segments(target) for target in targets)]
+        for target in targets:
+            self.remove_segments(target, keep=segments)
+        return segments
 
     def list_files(self):
-        """ List all the gzip'ed files """
+        """ List all the model files """
+        extensions = tuple(codec.extension for codec in compression.CODECS.values())
         return [name for name in os.listdir(self.path)
-                if name.endswith('.gz') and os.path.isfile(os.path.join(self.path, name))]
-
-    def save_representation(self, name, data):
+                if name.endswith(extensions) and os.path.isfile(os.path.join(self.path, name))]
+
+    def list_representations(self):
+        """ List the names of all the representations (and other files) in the model """
+        extensions = unique(codec.extension for codec in compression.CODECS.values())
+        pattern = re.compile(r'^(.*?)(?:\.\d+)?(?:{})$'.format(
+            '|'.join(re.escape(extension) for extension in extensions)))
+        return sorted(unique(pattern.match(name).group(1) for name in self.list_files()))
+
+    def get_stamp(self, name):
+        """ Return a value (JSON-serializable) that changes whenever a representation
+        is modified, or None if it is missing """
+        return [[os.path.basename(path), os.path.getsize(path), os.path.getmtime(path)]
+                for path in self.get_files(name)] or None
+
+    def hash_representation(self, name):
+        """ Return the SHA-1 hex digest of the uncompressed content of a representation """
+        digest = hashlib.sha1()
+        for segment in self.get_segments(name):
+            with self.open(name, segment=segment) as in_:
+                for data in iter(lambda: in_.read(1024 * 1024), ''):
+                    digest.update(data)
+        return digest.hexdigest()
+
+    def save_representation(self, name, data, segment=0):
         """ Save representation """
         self.create()
 
-        with self.open(name, 'wb') as out, SaveFileLineIndicator(name) as indicator:
+        with self.writer(name, segment) as out, \
+                SaveFileLineIndicator(self._get_segment_name(name, segment)) as indicator:
             for entry in data:
-                out.write('\t'.join(entry) + '\n')
+                out.write_row(entry)
                 indicator.update()
 
-    def load_representation(self, name, maxsplit=-1):
-        """ Load representation """
-        with self.open(name) as in_:
+    def load_segment(self, name, segment, maxsplit=-1):
+        """ Load a segment of a representation """
+        with self.open(name, segment=segment) as in_:
             for line in in_:
                 yield line.rstrip('\n').split('\t', maxsplit)
 
-    def save_topics(self, topics):
+    def load_representation(self, name, maxsplit=-1):
+        """ Load representation (all the segments in order) """
+        column = get_key_columns(name).get('qid')
+        for segment in self.get_segments(name) or [0]:
+            for row in self.load_segment(name, segment, maxsplit):
+                if self.qids is None or column is None or row[column] in self.qids:
+                    yield row
+
+    def lookup(self, name, qid=None, docno=None, id_=None, maxsplit=-1):
+        """ Return the rows of a representation with the given qid, docno and/or id
+
+        This is a scan over the representation; see SQLiteModel for indexed
+        lookups.
+        """
+        conditions = _get_conditions(name, qid=qid, docno=docno, id=id_)
+        nkeys = max([column + 1 for column, _ in conditions] or [0])
+        for row in self.load_representation(name, nkeys):
+            if all(row[column] == value for column, value in conditions):
+                yield '\t'.join(row).split('\t', maxsplit)
+
+    def start_import(self, topics, append=False):
+        """ Prepare to import topics (and their sentences and qrels)
+
+        Return the segment to save them into, along with the topics to import.
+        In append mode, these are a new segment and the topics whose qids are
+        not in the model yet; otherwise, segment 0 of a cleared model (which
+        is then set to the backend of this model object).  Clearing removes
+        the representations generated from the topics and sentences as well,
+        so that generators in append mode do not take them as current.
+        """
+        if not append:
+            names = self.list_representations() if os.path.isdir(self.path) else []
+            for name in unique(list(self.IMPORT_NAMES) + names):
+                if 'qid' in get_key_columns(name):
+                    self.remove_segments(name)
+            self.save_backend()
+            return 0, topics
+        if self.backend != self.BACKEND and get_model(self.path).contains(['topics_text']):
+            raise ValueError('the model uses the {} backend'.format(self.backend))
+        existing = set(qid for qid, _ in self.load_representation('topics_text', 1)) \
+            if self.get_segments('topics_text') else set()
+        return self.next_segment(self.IMPORT_NAMES), \
+            [(topic, m) for topic, m in topics if m['qid'] not in existing]
+
+    def save_topics(self, topics, segment=0):
         """ Save topics """
         self.save_representation('topics_text',
-                                 [(m['qid'], topic) for topic, m in topics])
+                                 [(m['qid'], topic) for topic, m in topics], segment)
 
-    def save_sentences_qrels(self, sentences, qids=None):
+    def save_sentences_qrels(self, sentences, qids=None, segment=0):
         """ Save sentences and qrels """
         self.create()
 
-        out_text = self.open('sentences_text', 'wb')
-        out_m = self.open('qrels', 'wb')
-        with SaveFileLineIndicator('sentence_text and qrels') as indicator:
+        with self.writer('sentences_text', segment) as out_text, \
+                self.writer('qrels', segment) as out_m, \
+                SaveFileLineIndicator('sentence_text and qrels') as indicator:
             for sentence, m in sentences:
                 if qids and m['qid'] not in qids:
                     continue
                 assert isinstance(sentence, unicode)
-                out_text.write(
-                    '\t'.join([m['docno'], m['id'], m['qid'], sentence.encode('utf8')]) + '\n')
-                out_m.write(
-                    '\t'.join([m['docno'], m['id'], m['qid'], m['rel']]) + '\n')
+                out_text.write_row((m['docno'], m['id'], m['qid'], sentence.encode('utf8')))
+                out_m.write_row((m['docno'], m['id'], m['qid'], m['rel']))
                 indicator.update()
 
     def load_topics(self, repr_name='topics_text'):
@@ -100,9 +327,455 @@ class Model(object):
 
     def contains(self, names):
         """ Return true if all the component names are in the model """
-        files = ['{}.gz'.format(name) for name in names]
-        model_files = self.list_files()
-        return all([filename in model_files for filename in files])
+        return all([bool(self.get_segments(name)) for name in names])
+
+
+class FileWriter(RowWriter):
+    """ A RowWriter to a within-model file
+
+    The rows go to a temporary file, which replaces the file once the writer
+    is closed; until then, the old file stays in place.  If the writer exits
+    on an exception, the temporary file is removed.
+    """
+
+    def __init__(self, path, codec, **kwargs):
+        self.path = path
+        self.temp_path = '{}.tmp{}'.format(path, os.getpid())
+        super(FileWriter, self).__init__(open(self.temp_path, 'wb', codec=codec), **kwargs)
+
+    def close(self):
+        """ Write out everything and replace the file """
+        if self.closed:
+            super(FileWriter, self).close()
+            return
+        try:
+            super(FileWriter, self).close()
+        except Exception:
+            os.remove(self.temp_path)
+            raise
+        os.rename(self.temp_path, self.path)
+
+    def discard(self):
+        """ Discard the rows written, leaving the file as it was """
+        if self.closed:
+            return
+        try:
+            super(FileWriter, self).close()
+        except Exception:
+            pass
+        os.remove(self.temp_path)
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class SQLiteModel(Model):
+    """ A model that keeps its representations in an SQLite database
+
+    Each representation is a table in model.db holding the lines of the
+    representation along with their segment and their qid, docno and id
+    columns, which are indexed: the rows of a qid or a sentence can then be
+    looked up without scanning (see lookup() and the qids attribute).  Other
+    files, such as freq_stats, are kept as files in the model directory.
+
+    Rows are bulk-loaded in batches of one transaction each, through a
+    separate connection, so that generators can read one table while writing
+    another, and several processes can write to the database at a time.
+    """
+
+    DATABASE = 'model.db'
+    BACKEND = 'sqlite'
+    TIMEOUT = 600
+
+    def __init__(self, path):
+        super(SQLiteModel, self).__init__(path)
+        self._connection = None
+        self._loaded_qids = None
+
+    def connect(self, isolation_level=''):
+        """ Return a new connection to the database, creating it if necessary """
+        self.create()
+        connection = sqlite3.connect(os.path.join(self.path, self.DATABASE),
+                                     timeout=self.TIMEOUT, isolation_level=isolation_level)
+        connection.text_factory = str
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS segments '
+                           '(name TEXT, segment INTEGER, version INTEGER, '
+                           'PRIMARY KEY (name, segment))')
+        # versions are never reused, even after the newest segments are removed
+        connection.execute('CREATE TABLE IF NOT EXISTS versions '
+                           '(version INTEGER PRIMARY KEY AUTOINCREMENT)')
+        return connection
+
+    @staticmethod
+    def new_version(connection):
+        """ Return a new segment version (within a transaction) """
+        version = connection.execute('INSERT INTO versions DEFAULT VALUES').lastrowid
+        connection.execute('DELETE FROM versions WHERE version < ?', (version,))
+        return version
+
+    @property
+    def connection(self):
+        """ The (autocommit) connection for reading """
+        if self._connection is None:
+            self._connection = self.connect(isolation_level=None)
+        return self._connection
+
+    @staticmethod
+    def _quote(name):
+        return '"{}"'.format(name.replace('"', '""'))
+
+    @classmethod
+    def get_table(cls, name):
+        """ Return the quoted name of the table of a representation """
+        return cls._quote('repr_' + name)
+
+    @classmethod
+    def create_table(cls, connection, name):
+        """ Create the table of a representation and its indexes """
+        table = cls.get_table(name)
+        connection.execute('CREATE TABLE IF NOT EXISTS {} (segment INTEGER NOT NULL, '
+                           'qid TEXT, docno TEXT, id TEXT, line TEXT NOT NULL)'.format(table))
+        indexes = [('segment', ['segment'])]
+        columns = get_key_columns(name)
+        if 'qid' in columns:
+            indexes.append(('qid', [key for key in ('qid', 'docno', 'id') if key in columns]))
+        if 'docno' in columns:
+            indexes.append(('docno', ['docno', 'id']))
+        for suffix, keys in indexes:
+            connection.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                cls._quote('repr_{}:{}'.format(name, suffix)), table, ', '.join(keys)))
+
+    def is_stored(self, name):
+        """ Return true if the representation is stored in the database """
+        return self.connection.execute('SELECT 1 FROM segments WHERE name = ? LIMIT 1',
+                                       (name,)).fetchone() is not None
+
+    def get_segments(self, name):
+        if not self.is_stored(name):
+            return super(SQLiteModel, self).get_segments(name)
+        return [segment for segment, in self.connection.execute(
+            'SELECT segment FROM segments WHERE name = ? ORDER BY segment', (name,))]
+
+    def get_files(self, name):
+        return [] if self.is_stored(name) else super(SQLiteModel, self).get_files(name)
+
+    def remove_segments(self, name, keep=()):
+        if self.is_stored(name):
+            keep = list(keep)
+            condition = 'segment NOT IN ({})'.format(', '.join('?' * len(keep)))
+            connection = self.connect()
+            with connection:
+                connection.execute('DELETE FROM {} WHERE {}'.format(
+                    self.get_table(name), condition), keep)
+                connection.execute('DELETE FROM segments WHERE name = ? AND ' + condition,
+                                   [name] + keep)
+            connection.close()
+        super(SQLiteModel, self).remove_segments(name, keep=keep)
+
+    def writer(self, name, segment=0):
+        """ Return a TableWriter to (a segment of) a representation """
+        return TableWriter(self, name, segment)
+
+    def list_representations(self):
+        names = [name for name, in self.connection.execute('SELECT DISTINCT name FROM segments')]
+        return sorted(unique(names + super(SQLiteModel, self).list_representations()))
+
+    def get_stamp(self, name):
+        if not self.is_stored(name):
+            return super(SQLiteModel, self).get_stamp(name)
+        return [list(row) for row in self.connection.execute(
+            'SELECT segment, version FROM segments WHERE name = ? ORDER BY segment', (name,))]
+
+    def hash_representation(self, name):
+        if not self.is_stored(name):
+            return super(SQLiteModel, self).hash_representation(name)
+        digest = hashlib.sha1()
+        for segment in self.get_segments(name):
+            for line, in self._select(name, 'segment = ?', [segment]):
+                digest.update(line + '\n')
+        return digest.hexdigest()
+
+    def _select(self, name, condition, params):
+        if self.qids is not None and 'qid' in get_key_columns(name):
+            if self._loaded_qids != self.qids:
+                self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS selected_qids '
+                                        '(qid TEXT PRIMARY KEY)')
+                self.connection.execute('DELETE FROM selected_qids')
+                self.connection.executemany('INSERT OR IGNORE INTO selected_qids VALUES (?)',
+                                            [(qid,) for qid in self.qids])
+                self._loaded_qids = frozenset(self.qids)
+            condition += ' AND qid IN (SELECT qid FROM selected_qids)'
+        return self.connection.execute(
+            'SELECT line FROM {} WHERE {} ORDER BY segment, rowid'.format(
+                self.get_table(name), condition), params)
+
+    def load_segment(self, name, segment, maxsplit=-1):
+        if not self.is_stored(name):
+            for row in super(SQLiteModel, self).load_segment(name, segment, maxsplit):
+                yield row
+            return
+        qids, self.qids = self.qids, None
+        try:
+            rows = self._select(name, 'segment = ?', [segment])
+        finally:
+            self.qids = qids
+        for line, in rows:
+            yield line.split('\t', maxsplit)
+
+    def load_representation(self, name, maxsplit=-1):
+        if not self.is_stored(name):
+            for row in super(SQLiteModel, self).load_representation(name, maxsplit):
+                yield row
+            return
+        for line, in self._select(
+                name, 'segment IN (SELECT segment FROM segments WHERE name = ?)', [name]):
+            yield line.split('\t', maxsplit)
+
+    def lookup(self, name, qid=None, docno=None, id_=None, maxsplit=-1):
+        """ Return the rows of a representation with the given qid, docno and/or id """
+        if not self.is_stored(name):
+            for row in super(SQLiteModel, self).lookup(name, qid, docno, id_, maxsplit):
+                yield row
+            return
+        keys = [(key, value) for key, value in (('qid', qid), ('docno', docno), ('id', id_))
+                if value is not None]
+        _get_conditions(name, **dict(keys))
+        condition = ' AND '.join(['segment IN (SELECT segment FROM segments WHERE name = ?)'] +
+                                 ['{} = ?'.format(key) for key, _ in keys])
+        for line, in self._select(name, condition, [name] + [value for _, value in keys]):
+            yield line.split('\t', maxsplit)
+
+
+class TableWriter(object):
+    """ A writer of rows into (a segment of) a representation in an SQLiteModel
+
+    The rows are staged in a temporary table, and replace the segment in one
+    transaction once the writer is closed; until then, the old segment stays
+    in place.  If the writer exits on an exception, the rows are discarded.
+    """
+
+    def __init__(self, model, name, segment=0, batch_size=10000):
+        self.model = model
+        self.name = name
+        self.segment = segment
+        self.batch_size = batch_size
+        self.closed = False
+        self._connection = model.connect()
+        self._rows = []
+        self._statement = 'INSERT INTO temp.staging (qid, docno, id, line) VALUES (?, ?, ?, ?)'
+
+        columns = get_key_columns(name)
+        self._key_columns = [columns.get(key) for key in ('qid', 'docno', 'id')]
+        with self._connection:
+            model.create_table(self._connection, name)
+            self._connection.execute('CREATE TEMP TABLE staging '
+                                     '(qid TEXT, docno TEXT, id TEXT, line TEXT NOT NULL)')
+
+    def _get_values(self, row):
+        keys = [row[column] if column is not None and column < len(row) else None
+                for column in self._key_columns]
+        return keys + ['\t'.join(row)]
+
+    def _flush_rows(self):
+        if self._rows:
+            with self._connection:
+                self._connection.executemany(
+                    self._statement, [self._get_values(row) for row in self._rows])
+            self._rows = []
+
+    def write_row(self, row):
+        """ Write a sequence of strings as a row """
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._flush_rows()
+
+    def write_rows(self, rows):
+        """ Write a sequence of rows """
+        for row in rows:
+            self.write_row(row)
+
+    def close(self):
+        """ Write out the remaining rows and replace the segment with them """
+        if self.closed:
+            return
+        self.closed = True
+        table = self.model.get_table(self.name)
+        try:
+            self._flush_rows()
+            with self._connection:
+                self._connection.execute('DELETE FROM {} WHERE segment = ?'.format(table),
+                                         (self.segment,))
+                self._connection.execute(
+                    'INSERT INTO {} (segment, qid, docno, id, line) '
+                    'SELECT ?, qid, docno, id, line FROM temp.staging ORDER BY rowid'.format(table),
+                    (self.segment,))
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO segments VALUES (?, ?, ?)',
+                    (self.name, self.segment, SQLiteModel.new_version(self._connection)))
+        finally:
+            self._connection.close()
+
+        # the segment may have been stored in a file before
+        for path in self.model._get_paths(self.model._get_segment_name(self.name, self.segment)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def discard(self):
+        """ Discard the rows written, leaving the segment as it was """
+        if not self.closed:
+            self.closed = True
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class MemoryModel(Model):
+    """ A model that holds its representations in memory
+
+    The rows of each segment are kept as lists, as they were written, and
+    nothing is written to disk.  Other files, such as freq_stats, are read
+    from path if given (e.g., the directory of a model on disk).
+    """
+
+    BACKEND = 'memory'
+
+    def __init__(self, path=None):
+        super(MemoryModel, self).__init__(path)
+        self.representations = dict()
+        self._manifest = dict()
+
+    def create(self):
+        pass
+
+    def load_manifest(self):
+        return dict(self._manifest)
+
+    def save_manifest(self, manifest):
+        self._manifest = dict(manifest)
+
+    def update_manifest(self, update):
+        update(self._manifest)
+
+    def get_path(self, name, segment=0):
+        if self.path is None:
+            raise IOError('no such file in memory: {}'.format(name))
+        return super(MemoryModel, self).get_path(name, segment)
+
+    def get_output_path(self, name, segment=0):
+        raise IOError('cannot write files into a model in memory: {}'.format(name))
+
+    def get_segments(self, name):
+        if name in self.representations:
+            return sorted(self.representations[name])
+        return super(MemoryModel, self).get_segments(name) if self.path else []
+
+    def get_files(self, name):
+        if name in self.representations or self.path is None:
+            return []
+        return super(MemoryModel, self).get_files(name)
+
+    def remove_segments(self, name, keep=()):
+        segments = self.representations.get(name, dict())
+        for segment in list(segments):
+            if segment not in keep:
+                del segments[segment]
+        if name in self.representations and not segments:
+            del self.representations[name]
+
+    def writer(self, name, segment=0):
+        """ Return a MemoryWriter to (a segment of) a representation """
+        return MemoryWriter(self.representations, name, segment)
+
+    def list_files(self):
+        return super(MemoryModel, self).list_files() if self.path else []
+
+    def list_representations(self):
+        return sorted(unique(list(self.representations) +
+                             super(MemoryModel, self).list_representations()))
+
+    def load_segment(self, name, segment, maxsplit=-1):
+        if name not in self.representations:
+            for row in super(MemoryModel, self).load_segment(name, segment, maxsplit):
+                yield row
+            return
+        for row in self.representations[name].get(segment, []):
+            if 0 <= maxsplit < len(row) - 1:
+                yield row[:maxsplit] + ['\t'.join(row[maxsplit:])]
+            else:
+                yield list(row)
+
+
+class MemoryWriter(object):
+    """ A writer of rows into (a segment of) a representation in a MemoryModel
+
+    The segment is replaced once the writer is closed (unless it exits on an
+    exception).
+    """
+
+    def __init__(self, representations, name, segment=0):
+        self.representations = representations
+        self.name = name
+        self.segment = segment
+        self.closed = False
+        self._rows = []
+
+    def write_row(self, row):
+        """ Write a sequence of strings as a row """
+        self._rows.append(list(row))
+
+    def write_rows(self, rows):
+        """ Write a sequence of rows """
+        for row in rows:
+            self.write_row(row)
+
+    def close(self):
+        """ Add the rows as the segment """
+        if not self.closed:
+            self.closed = True
+            self.representations.setdefault(self.name, dict())[self.segment] = self._rows
+
+    def discard(self):
+        """ Discard the rows written, leaving the segment as it was """
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+BACKENDS = collections.OrderedDict([
+    ('files', Model),
+    ('sqlite', SQLiteModel),
+])
+
+
+def _get_conditions(name, **keys):
+    """ Return the (column, value) pairs to match the given keys of a representation """
+    columns = get_key_columns(name)
+    conditions = []
+    for key, value in sorted(keys.items()):
+        if value is None:
+            continue
+        if key not in columns:
+            raise ValueError('{} has no {} column'.format(name, key))
+        conditions.append((columns[key], value))
+    return conditions
 
 
 class Feature(object):
@@ -0,0 +1,363 @@
+"""
+Block gzip (BGZF)
+
+A BGZF file is a series of gzip members, each holding at most 64 KB of data
+and recording its own compressed size in a 'BC' extra field (as in SAMtools).
+The result is a valid gzip file, but the blocks can be compressed and
+decompressed independently, and therefore in parallel: zlib releases the GIL,
+so a thread pool is enough.
+
+Since every block starts at a known compressed offset, a file can be read
+from any (uncompressed) position with a block index: the compressed and
+uncompressed offsets of the blocks, as kept in a '.gzi' file next to it
+(in the format of 'bgzip -i').  The index is built by scanning the block
+headers if missing or out of date.
+"""
+from __future__ import absolute_import
+
+import __builtin__
+import bisect
+import collections
+import io
+import multiprocessing
+import os
+import struct
+import zlib
+
+from multiprocessing.pool import ThreadPool
+
+
+BLOCK_SIZE = 0xff00
+DEFAULT_LEVEL = 6
+
+_HEADER = struct.Struct('<4sI2sH')
+_SUBFIELD = struct.Struct('<2sH')
+_TRAILER = struct.Struct('<II')
+_MAGIC = '\x1f\x8b\x08\x04'
+_COUNT = struct.Struct('<Q')
+_ENTRY = struct.Struct('<QQ')
+
+EOF_BLOCK = '\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00' \
+            '\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+
+def get_default_threads():
+    """ Return the default number of compression/decompression threads """
+    return min(multiprocessing.cpu_count(), 8)
+
+
+def is_bgzf(filename):
+    """ Return true if the file starts with a BGZF block """
+    with __builtin__.open(filename, 'rb') as in_:
+        header = in_.read(_HEADER.size + 6)
+    return len(header) == _HEADER.size + 6 and header.startswith(_MAGIC) and \
+        _get_block_size(header[_HEADER.size - 2:]) is not None
+
+
+def _get_block_size(extra):
+    """ Return the block size recorded in the extra field (XLEN + subfields), or None """
+    xlen = struct.unpack('<H', extra[:2])[0]
+    i = 2
+    while i + _SUBFIELD.size <= min(len(extra), xlen + 2):
+        tag, length = _SUBFIELD.unpack(extra[i:i + _SUBFIELD.size])
+        if tag == 'BC' and length == 2:
+            return struct.unpack('<H', extra[i + 4:i + 6])[0] + 1
+        i += _SUBFIELD.size + length
+    return None
+
+
+def compress_block(data, level=DEFAULT_LEVEL):
+    """ Return a BGZF block of the data (of at most BLOCK_SIZE bytes) """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = _HEADER.pack(_MAGIC, 0, '\x00\xff', 6) + \
+        _SUBFIELD.pack('BC', 2) + struct.pack('<H', len(cdata) + 25)
+    return header + cdata + _TRAILER.pack(zlib.crc32(data) & 0xffffffff, len(data))
+
+
+def decompress_block(block):
+    """ Return the data of a BGZF block """
+    xlen = struct.unpack('<H', block[10:12])[0]
+    data = zlib.decompress(block[12 + xlen:-_TRAILER.size], -15)
+    crc, size = _TRAILER.unpack(block[-_TRAILER.size:])
+    if size != len(data) or crc != zlib.crc32(data) & 0xffffffff:
+        raise IOError('corrupted BGZF block')
+    return data
+
+
+def _read_block_sizes(in_, coffset):
+    """ Return the compressed and uncompressed sizes of the block at the offset, or None at EOF """
+    in_.seek(coffset)
+    header = in_.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size or not header.startswith(_MAGIC):
+        raise IOError('not a BGZF file: {}'.format(in_.name))
+    size = _get_block_size(header[-2:] + in_.read(_HEADER.unpack(header)[3]))
+    if size is None:
+        raise IOError('not a BGZF file: {}'.format(in_.name))
+    in_.seek(coffset + size - 4)
+    return size, struct.unpack('<I', in_.read(4))[0]
+
+
+class BlockIndex(object):
+    """ The (compressed, uncompressed) offsets of the blocks of a BGZF file """
+
+    EXTENSION = '.gzi'
+
+    def __init__(self, offsets, size):
+        self.offsets = offsets
+        self.size = size
+        self._uoffsets = [uoffset for _, uoffset in offsets]
+
+    def find(self, position):
+        """ Return the (compressed, uncompressed) offsets of the block holding the position """
+        return self.offsets[max(0, bisect.bisect_right(self._uoffsets, position) - 1)]
+
+    def save(self, path):
+        """ Save the index as a .gzi file """
+        with __builtin__.open(path, 'wb') as out:
+            # as in bgzip, the first block (at 0, 0) is implied
+            out.write(_COUNT.pack(len(self.offsets) - 1))
+            for coffset, uoffset in self.offsets[1:]:
+                out.write(_ENTRY.pack(coffset, uoffset))
+
+    @classmethod
+    def load(cls, path, filename):
+        """ Load the .gzi file of a BGZF file """
+        with __builtin__.open(path, 'rb') as in_:
+            count = _COUNT.unpack(in_.read(_COUNT.size))[0]
+            data = in_.read(count * _ENTRY.size)
+        if len(data) != count * _ENTRY.size:
+            raise IOError('truncated BGZF index: {}'.format(path))
+        offsets = [(0, 0)] + [_ENTRY.unpack_from(data, i * _ENTRY.size) for i in range(count)]
+
+        # the total size is not recorded: add up the size of the last block
+        with __builtin__.open(filename, 'rb') as in_:
+            sizes = _read_block_sizes(in_, offsets[-1][0])
+        return cls(offsets, offsets[-1][1] + (sizes[1] if sizes else 0))
+
+    @classmethod
+    def build(cls, filename):
+        """ Build the index by scanning the block headers """
+        offsets = []
+        coffset, uoffset = 0, 0
+        with __builtin__.open(filename, 'rb') as in_:
+            while True:
+                sizes = _read_block_sizes(in_, coffset)
+                if sizes is None:
+                    break
+                if sizes[1]:
+                    offsets.append((coffset, uoffset))
+                coffset += sizes[0]
+                uoffset += sizes[1]
+        return cls(offsets or [(0, 0)], uoffset)
+
+
+def get_index(filename, save=True):
+    """ Return the up-to-date block index of the BGZF file, building it if necessary """
+    path = filename + BlockIndex.EXTENSION
+    if os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(filename):
+        try:
+            return BlockIndex.load(path, filename)
+        except (IOError, struct.error):
+            pass
+    index = BlockIndex.build(filename)
+    if save:
+        try:
+            index.save(path)
+        except IOError:
+            pass
+    return index
+
+
+class BgzfWriter(object):
+    """ A BGZF writer that compresses batches of blocks in a thread pool """
+
+    def __init__(self, filename, level=DEFAULT_LEVEL, threads=None):
+        self.name = filename
+        self.level = level
+        self.threads = threads or get_default_threads()
+        self.softspace = 0
+        self.closed = False
+
+        self._file = __builtin__.open(filename, 'wb')
+        self._buffer, self._buffered = [], 0
+        self._batch_size = BLOCK_SIZE * self.threads * 4
+        self._pool = ThreadPool(self.threads) if self.threads > 1 else None
+
+    def _compress(self, blocks):
+        if self._pool:
+            return self._pool.map(lambda block: compress_block(block, self.level), blocks)
+        return [compress_block(block, self.level) for block in blocks]
+
+    def _write_blocks(self, final=False):
+        data = ''.join(self._buffer)
+        end = len(data) if final else len(data) - len(data) % BLOCK_SIZE
+        blocks = [data[i:i + BLOCK_SIZE] for i in range(0, end, BLOCK_SIZE)]
+        for block in self._compress(blocks):
+            self._file.write(block)
+        self._buffer = [data[end:]]
+        self._buffered = len(data) - end
+
+    def write(self, data):
+        """ Write a string """
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._batch_size:
+            self._write_blocks()
+
+    def writelines(self, lines):
+        """ Write a sequence of strings """
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """ Compress and write out the full blocks """
+        self._write_blocks()
+        self._file.flush()
+
+    def close(self):
+        """ Write out all the data and the EOF block """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._write_blocks(final=True)
+            self._file.write(EOF_BLOCK)
+        finally:
+            self._file.close()
+            if self._pool:
+                self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+
+class BgzfRawReader(io.RawIOBase):
+    """ A raw BGZF reader that decompresses the blocks ahead in a thread pool
+
+    Seeking goes through the block index, which is loaded on the first seek.
+    """
+
+    def __init__(self, filename, threads=None):
+        super(BgzfRawReader, self).__init__()
+        self.name = filename
+        self.threads = threads or get_default_threads()
+
+        self._file = __builtin__.open(filename, 'rb')
+        self._pool = ThreadPool(self.threads) if self.threads > 1 else None
+        self._pending = collections.deque()
+        self._data, self._offset = '', 0
+        self._position = 0
+        self._eof = False
+        self._index = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._get_index().size
+        if offset < 0:
+            raise IOError('negative seek position {}'.format(offset))
+        if offset == self._position:
+            return offset
+
+        # seeking ahead within the current block needs no index
+        if 0 <= offset - self._position <= len(self._data) - self._offset:
+            self._offset += offset - self._position
+            self._position = offset
+            return offset
+
+        coffset, uoffset = self._get_index().find(offset)
+        self._file.seek(coffset)
+        self._pending.clear()
+        self._data, self._offset = '', 0
+        self._position = uoffset
+        self._eof = False
+        self._skip(offset - uoffset)
+        return self._position
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = get_index(self.name)
+        return self._index
+
+    def _next_block(self):
+        self._fill()
+        if not self._pending:
+            return False
+        result = self._pending.popleft()
+        self._data = result if isinstance(result, str) else result.get()
+        self._offset = 0
+        return True
+
+    def _read_block(self):
+        header = self._file.read(_HEADER.size)
+        if not header:
+            return None
+        if len(header) < _HEADER.size or not header.startswith(_MAGIC):
+            raise IOError('not a BGZF file: {}'.format(self.name))
+        xlen = _HEADER.unpack(header)[3]
+        extra = self._file.read(xlen)
+        size = _get_block_size(header[-2:] + extra)
+        if size is None:
+            raise IOError('not a BGZF file: {}'.format(self.name))
+        rest = self._file.read(size - len(header) - len(extra))
+        return header + extra + rest
+
+    def _fill(self):
+        while not self._eof and len(self._pending) < self.threads * 4:
+            block = self._read_block()
+            if block is None:
+                self._eof = True
+            elif self._pool:
+                self._pending.append(self._pool.apply_async(decompress_block, (block,)))
+            else:
+                self._pending.append(decompress_block(block))
+
+    def _skip(self, n):
+        while n > 0:
+            if self._offset >= len(self._data) and not self._next_block():
+                break
+            step = min(n, len(self._data) - self._offset)
+            self._offset += step
+            self._position += step
+            n -= step
+
+    def readinto(self, b):
+        while self._offset >= len(self._data):
+            if not self._next_block():
+                return 0
+
+        n = min(len(b), len(self._data) - self._offset)
+        b[:n] = self._data[self._offset:self._offset + n]
+        self._offset += n
+        self._position += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+            if self._pool:
+                self._pool.terminate()
+        super(BgzfRawReader, self).close()
+
+
+def open(filename, mode='rb', level=DEFAULT_LEVEL, threads=None):
+    """ Open a BGZF file for reading or writing """
+    if 'w' in mode:
+        return BgzfWriter(filename, level=level, threads=threads)
+    return io.BufferedReader(BgzfRawReader(filename, threads=threads), 1024 * 1024)
@@ -0,0 +1,136 @@
+"""
+Binary vector file format
+
+A binary vector file holds the same data as a (SummaryRank-flavored)
+SVMLight file: the feature names, a dense feature matrix, and the qid, rel
+and docno columns.  The arrays are laid out so that they can be memory-mapped:
+
+    MAGIC | matrix | qids | rels | docnos | header (JSON) | trailer
+
+The trailer packs the offset and length of the JSON header, followed by
+MAGIC again.  Since the header comes last, a file can be written in one
+streaming pass without knowing the number of rows in advance.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = 'SRBVEC01'
+TRAILER = struct.Struct('<QQ8s')
+ALIGNMENT = 64
+EXTENSION = '.bvec'
+
+
+def is_binary(filename):
+    """ Return true if the file is a binary vector file. """
+    if filename == '-' or not os.path.isfile(filename):
+        return False
+    with open(filename, 'rb') as in_:
+        return in_.read(len(MAGIC)) == MAGIC
+
+
+def is_binary_name(filename):
+    """ Return true if the file name calls for a binary vector file. """
+    return filename is not None and filename.endswith(EXTENSION)
+
+
+class Writer(object):
+    """ A streaming writer of binary vector files """
+
+    def __init__(self, path, features, dtype=np.float64):
+        self.path = path
+        self.features = [str(name) for name in features]
+        self.dtype = np.dtype(dtype)
+        self.nrows = 0
+
+        self._qids, self._rels, self._docnos = [], [], []
+        self._out = open(path, 'wb')
+        self._out.write(MAGIC)
+        self._align()
+        self._matrix_offset = self._out.tell()
+
+    def _align(self):
+        padding = -self._out.tell() % ALIGNMENT
+        self._out.write('\0' * padding)
+
+    def _write_array(self, array):
+        self._align()
+        offset = self._out.tell()
+        self._out.write(np.ascontiguousarray(array).tobytes())
+        return {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    def write(self, matrix, qids, rels, docnos):
+        """ Append a chunk of rows """
+        matrix = np.asarray(matrix, dtype=self.dtype)
+        assert matrix.ndim == 2 and matrix.shape[1] == len(self.features)
+        assert matrix.shape[0] == len(qids) == len(rels) == len(docnos)
+
+        self._out.write(np.ascontiguousarray(matrix).tobytes())
+        self._qids.extend(qids)
+        self._rels.extend(rels)
+        self._docnos.extend(docnos)
+        self.nrows += matrix.shape[0]
+
+    def close(self):
+        """ Write the metadata columns and the header """
+        arrays = {
+            'matrix': {'offset': self._matrix_offset, 'dtype': self.dtype.str,
+                       'shape': [self.nrows, len(self.features)]},
+            'qids': self._write_array(np.array(self._qids, dtype=str)),
+            'rels': self._write_array(np.array(self._rels, dtype=np.int64)),
+            'docnos': self._write_array(np.array(self._docnos, dtype=str)),
+        }
+
+        header = json.dumps({'version': 1, 'features': self.features,
+                             'nrows': self.nrows, 'arrays': arrays})
+        header_offset = self._out.tell()
+        self._out.write(header)
+        self._out.write(TRAILER.pack(header_offset, len(header), MAGIC))
+        self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self._out.close()
+
+
+class VectorFile(object):
+    """ A memory-mapped binary vector file """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as in_:
+            in_.seek(-TRAILER.size, os.SEEK_END)
+            header_offset, header_length, magic = TRAILER.unpack(in_.read(TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError('not a binary vector file: {}'.format(path))
+            in_.seek(header_offset)
+            header = json.loads(in_.read(header_length))
+
+        self.features = [str(name) for name in header['features']]
+        self.nrows = header['nrows']
+        arrays = header['arrays']
+        self.matrix = self._map(arrays['matrix'])
+        self.qids = self._map(arrays['qids'])
+        self.rels = self._map(arrays['rels'])
+        self.docnos = self._map(arrays['docnos'])
+
+    def _map(self, spec):
+        shape = tuple(spec['shape'])
+        if np.prod(shape) == 0:
+            return np.zeros(shape, dtype=spec['dtype'])
+        return np.memmap(self.path, dtype=spec['dtype'], mode='r',
+                         offset=spec['offset'], shape=shape)
+
+
+def write(path, features, matrix, qids, rels, docnos, dtype=np.float64):
+    """ Write a binary vector file in one go """
+    with Writer(path, features, dtype=dtype) as writer:
+        writer.write(matrix, qids, rels, docnos)
@@ -0,0 +1,93 @@
+"""
+Compression codecs
+
+A codec is given as NAME or NAME:LEVEL, with NAME being one of:
+
+    none    no compression
+    gzip    gzip (default level 9)
+    bz2     bzip2 (default level 9)
+    bgzf    block gzip, compressed and decompressed in threads (default level 6)
+
+Files are read according to their extension (and content, since BGZF files
+are gzip files as well).
+"""
+import __builtin__
+import argparse
+import bz2
+import collections
+import gzip
+
+from summaryrank import bgzf
+
+
+Codec = collections.namedtuple('Codec', ['extension', 'default_level'])
+
+CODECS = collections.OrderedDict([
+    ('none', Codec('.tsv', None)),
+    ('gzip', Codec('.gz', 9)),
+    ('bz2', Codec('.bz2', 9)),
+    ('bgzf', Codec('.gz', bgzf.DEFAULT_LEVEL)),
+])
+
+DEFAULT_CODEC = 'gzip'
+
+
+def parse_codec(spec):
+    """ Return the (name, level) of a codec spec such as 'gzip:6' """
+    name, _, level = spec.partition(':')
+    if name not in CODECS:
+        raise ValueError('unknown codec: {}'.format(name))
+    if not level:
+        return name, CODECS[name].default_level
+    if CODECS[name].default_level is None:
+        raise ValueError('codec {} takes no level'.format(name))
+    if not level.isdigit() or not 1 <= int(level) <= 9:
+        raise ValueError('invalid compression level: {}'.format(level))
+    return name, int(level)
+
+
+def codec_argument(spec):
+    """ Validate a codec spec given as a command-line argument """
+    try:
+        parse_codec(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+
+def get_extension(spec):
+    """ Return the file extension of the codec """
+    return CODECS[parse_codec(spec)[0]].extension
+
+
+def detect_codec(filename):
+    """ Return the name of the codec that a file is supposed to be read with """
+    if filename.endswith('.gz'):
+        return 'bgzf' if bgzf.is_bgzf(filename) else 'gzip'
+    elif filename.endswith('.bz2'):
+        return 'bz2'
+    return 'none'
+
+
+def open(filename, mode='rb', codec=None):
+    """ Return a file-like object for reading or writing with the given codec
+
+    For reading, the codec is detected if not given; for writing, it defaults
+    to the one implied by the file extension.
+    """
+    if codec is None:
+        if 'w' in mode or 'a' in mode:
+            codec = {'.gz': 'gzip', '.bz2': 'bz2'}.get(
+                filename[filename.rfind('.'):], 'none')
+        else:
+            codec = detect_codec(filename)
+    name, level = parse_codec(codec)
+
+    if name == 'gzip':
+        return gzip.open(filename, mode, level) if 'w' in mode else gzip.open(filename, mode)
+    elif name == 'bz2':
+        return bz2.BZ2File(filename, mode, compresslevel=level) if 'w' in mode \
+            else bz2.BZ2File(filename, mode)
+    elif name == 'bgzf':
+        return bgzf.open(filename, mode, level=level)
+    return __builtin__.open(filename, mode)
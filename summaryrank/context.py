@@ -0,0 +1,82 @@
+"""
+Context features
+
+Context features describe the neighborhood of a sentence within its document:
+the feature values of the k sentences before and after it, and aggregates
+(mean or max) over the window of +/- k sentences around it.  Positions that
+fall outside the document are taken as 0 (and are left out of aggregates).
+"""
+import collections
+
+import numpy as np
+
+
+AGGREGATES = collections.OrderedDict([
+    ('mean', ('WindowMean', np.nanmean)),
+    ('max', ('WindowMax', np.nanmax)),
+])
+
+
+def get_doc_ids(docnos):
+    """ Return the document part of sentence docnos (DOC:ID) as an array """
+    return np.array([docno.rsplit(':', 1)[0] for docno in docnos])
+
+
+def get_context_names(names, k=1, aggregates=()):
+    """ Return the names of the context features for the given features """
+    result = []
+    for name in names:
+        for d in range(1, k + 1):
+            suffix = str(d) if d > 1 else ''
+            result.append('SentenceBefore{}[{}]'.format(suffix, name))
+            result.append('SentenceAfter{}[{}]'.format(suffix, name))
+        for aggregate in aggregates:
+            result.append('{}{}[{}]'.format(AGGREGATES[aggregate][0], k, name))
+    return result
+
+
+def context_matrix(matrix, k=1, aggregates=(), doc_ids=None):
+    """ Return the context features of a block of sentences (in document order)
+
+    The rows can span several documents, as given by doc_ids (one document by
+    default); a window never crosses a document boundary.  The columns are laid
+    out as in get_context_names().
+    """
+    nrows, nfeatures = matrix.shape
+    padded = np.full((nrows + 2 * k, nfeatures), np.nan)
+    padded[k:k + nrows] = matrix
+
+    # number the documents so that positions from other documents can be masked out
+    docs = np.full(nrows + 2 * k, -1, dtype=np.int64)
+    if doc_ids is None or nrows == 0:
+        docs[k:k + nrows] = 0
+    else:
+        docs[k:k + nrows] = np.concatenate([[0], np.cumsum(doc_ids[1:] != doc_ids[:-1])])
+    current = docs[k:k + nrows]
+
+    def _get_shifted(offset):
+        shifted = padded[k + offset:k + offset + nrows].copy()
+        shifted[docs[k + offset:k + offset + nrows] != current] = np.nan
+        return shifted
+
+    columns = []
+    for d in range(1, k + 1):
+        columns.append(_get_shifted(-d))
+        columns.append(_get_shifted(d))
+    if aggregates:
+        windows = np.stack(columns + [matrix])
+        for aggregate in aggregates:
+            columns.append(AGGREGATES[aggregate][1](windows, axis=0))
+
+    # interleave the columns of the context features of each feature
+    width = len(columns)
+    result = np.empty((nrows, nfeatures * width))
+    for i, column in enumerate(columns):
+        result[:, i::width] = column
+    result[np.isnan(result)] = 0
+    return result
+
+
+def context_columns(matrix, docnos, k=1, aggregates=()):
+    """ Return the context features of a whole matrix of sentences (in document order) """
+    return context_matrix(matrix, k=k, aggregates=aggregates, doc_ids=get_doc_ids(docnos))
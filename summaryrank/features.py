@@ -5,9 +5,13 @@ import argparse
 import itertools
 import sys
 
+import numpy as np
+
 from . import svmlight_tools
 
 import summaryrank
+import summaryrank.binvec
+import summaryrank.context
 import summaryrank.io
 
 import summaryrank.mk
@@ -77,6 +81,33 @@ def load_feature_classes(name):
     return []
 
 
+class _FeatureArgumentParser(argparse.ArgumentParser):
+    """ An ArgumentParser that raises ValueError on errors (for library use) """
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def get_features(names, argv=()):
+    """ Return the features of the given classnames (of features or feature sets)
+
+    Feature-related options are given as in extract, e.g., ['--lm-mu', '100'];
+    the others take their default values.
+    """
+    feature_classes = []
+    for name in names:
+        feature_classes.extend(load_feature_classes(name))
+
+    parser = _FeatureArgumentParser(prog='features')
+    group = parser.add_argument_group('feature-related options')
+    for cls in feature_classes:
+        cls.init_parser(parser, group)
+    args = parser.parse_args(list(argv))
+    for cls in feature_classes:
+        cls.check_parser_args(parser, args)
+    return [cls(args) for cls in feature_classes]
+
+
 def extract(argv):
     """ Extract features """
     parser = argparse.ArgumentParser(
@@ -94,8 +125,28 @@ def extract(argv):
                          help='show this help message and exit')
     options.add_argument('-m', dest='model', metavar='DIR',
                          help='store the processed data in DIR')
+    options.add_argument('-o', dest='output', metavar='FILE',
+                         help='write the vectors to FILE (binary if FILE ends with .bvec)')
+    options.add_argument('--dtype', choices=('float32', 'float64'),
+                         help='floating-point type of binary output (default: %(default)s)')
+    options.add_argument('--sparse', action='store_true',
+                         help='leave out zero-valued features in text output')
+    options.add_argument('--precision', metavar='N', type=int,
+                         help='write values with N significant digits in text output')
+    options.add_argument('--context', metavar='K', type=int,
+                         help='add context features over a window of K sentences')
+    options.add_argument('--context-aggregates', metavar='LIST', default='',
+                         help='add context aggregates over the window: ' +
+                         ', '.join(summaryrank.context.AGGREGATES))
+    options.add_argument('--qids', metavar='LIST',
+                         help='only extract the vectors of these (comma-separated) qids')
+    options.add_argument('--normalize', metavar='METHOD',
+                         choices=svmlight_tools.NORMALIZERS.keys(),
+                         help='normalize the features within queries: ' +
+                         ', '.join(svmlight_tools.NORMALIZERS))
     options.add_argument('names', metavar='CLASSNAME', nargs='*',
                          help='feature classname')
+    options.set_defaults(dtype='float64')
     args, _ = parser.parse_known_args(argv)
 
     if not args.names:
@@ -125,7 +176,16 @@ def extract(argv):
         parser.error('must specify the model directory')
         return 1
 
-    model = summaryrank.Model(args.model)
+    aggregates = [name for name in args.context_aggregates.split(',') if name]
+    for name in aggregates:
+        if name not in summaryrank.context.AGGREGATES:
+            parser.error('unknown aggregate: {}'.format(name))
+    if aggregates and not args.context:
+        parser.error('--context-aggregates requires --context')
+
+    model = summaryrank.get_model(args.model)
+    if args.qids:
+        model.qids = set(args.qids.split(','))
 
     features = [cls(args) for cls in feature_classes]
     for feature in features:
@@ -136,19 +196,63 @@ def extract(argv):
         print >>sys.stderr, 'process {}'.format(feature)
         columns.append(feature.compute(model))
 
-    qrels = model.load_qrels()
-    summaryrank.io.SVMLight.write_columnwise(sys.stdout, features, columns, qrels)
+    qrels = list(model.load_qrels())
+    if args.context or args.normalize:
+        features, columns = _postprocess(features, columns, qrels, args.context,
+                                         aggregates, args.normalize)
+
+    if summaryrank.binvec.is_binary_name(args.output):
+        summaryrank.io.BinaryVectors.write_columnwise(
+            args.output, features, columns, qrels, dtype=args.dtype)
+    else:
+        out = svmlight_tools.open_output(args.output)
+        summaryrank.io.SVMLight.write_columnwise(out, features, columns, qrels,
+                                                 sparse=args.sparse, precision=args.precision)
+        if out is not sys.stdout:
+            out.close()
+            if svmlight_tools.is_indexable(args.output):
+                svmlight_tools.get_index(args.output)
+
+
+def _postprocess(features, columns, qrels, k=None, aggregates=(), method=None):
+    """ Add context features and/or normalize the columns in memory
+
+    Return the new list of features and the new columns.
+    """
+    matrix = np.column_stack(columns) if columns else np.zeros((len(qrels), 0))
+    if k:
+        docnos = ['{}:{}'.format(qrel['docno'], qrel['id']) for qrel in qrels]
+        context = summaryrank.context.context_columns(matrix, docnos, k=k,
+                                                      aggregates=aggregates)
+        features = features + summaryrank.context.get_context_names(
+            [str(feature) for feature in features], k=k, aggregates=aggregates)
+        matrix = np.hstack([matrix, context])
+    if method:
+        matrix = svmlight_tools.normalize_groups(
+            matrix, [qrel['qid'] for qrel in qrels], method)
+    return features, list(matrix.T)
 
 
 def contextualize(argv):
     """ Generate context features
 
     Generate two context features SentenceBefore[XYZ] and SentenceAfter[XYZ] for
-    each feature XYZ in the given set.
+    each feature XYZ in the given set.  With -k K, features of the sentences up to
+    K positions away are generated as well (SentenceBefore2[XYZ], etc.), and
+    --aggregates adds the mean/max of XYZ over the window of +/- K sentences
+    (WindowMeanK[XYZ], WindowMaxK[XYZ]).
     """
     parser = AutoHelpArgumentParser(prog='contextualize')
     parser.add_argument('-f', dest='fields', metavar='LIST',
                         help='select only these fields')
+    parser.add_argument('-k', type=int, default=1,
+                        help='window size (default: 1)')
+    parser.add_argument('--aggregates', metavar='LIST', default='',
+                        help='aggregates over the window: ' +
+                        ', '.join(summaryrank.context.AGGREGATES))
+    parser.add_argument('-o', dest='output', metavar='FILE',
+                        help='write the output to FILE (binary if FILE ends with .bvec)')
+    svmlight_tools.add_text_output_arguments(parser)
     parser.add_argument('vector_file',
                         help='the input vector file')
     args = parser.parse_args(argv)
@@ -162,116 +266,35 @@ def contextualize(argv):
             else:
                 selector.add(int(comp))
 
-    rows = svmlight_tools.get_rows(summaryrank.open(args.vector_file), with_preamble=True)
-    preamble = next(rows)
-
-    features = []
-    for fid, name in svmlight_tools.get_preamble_features(preamble):
-        if not args.fields:
-            selector.add(fid)
-        if fid in selector:
-            features.append('SentenceBefore[{}]'.format(name))
-            features.append('SentenceAfter[{}]'.format(name))
-
-    print '# Features in use'
-    for fid, name in enumerate(features, 1):
-        print '# {}: {}'.format(fid, name)
-
-    new_fids = len(features) + 1
-
-    # From here onwards is Damiano's contribution
-    pointer1 = None
-    pointer2 = None
-    pointer3 = None
-
-    for line in rows:
-        pointer1 = pointer2
-        pointer2 = pointer3
-        pointer3 = line
-
-        new_features = {}
-        if pointer2:
-            current_head, current_comment = pointer2.split('# ')
-            _, current_docid, _ = current_comment.split(':')
-            current_fields = current_head.split()
-            #SentenceBefore context feature:
-            if not pointer1: # first sentence
-                for fid in range(1, new_fids):
-                    if fid % 2 != 0:
-                        new_features[fid] = 0
-            else:
-                #is it from the same document?
-                previous_head, previous_comment = pointer1.split('# ')
-                _, previous_docid, _ = previous_comment.split(':')
-                previous_fields = dict([f.split(':') for f in previous_head.split()[2:]])
-
-                if previous_docid != current_docid:
-                    for fid in range(1, new_fids):
-                        if fid % 2 != 0:
-                            new_features[fid] = 0
-                else:
-                    new_fid = 1
-                    for fid in selector:
-                        before_value = previous_fields[str(fid)]
-                        new_features[new_fid] = before_value
-                        new_fid += 2
-
-            #SencenceAfter context feature:
-
-            next_head, _ = pointer3.split('# ')
-            _, next_docid, _ = current_comment.split(':')
-            next_fields = dict([f.split(':') for f in next_head.split()[2:]])
-            if next_docid != current_docid:
-                for fid in range(1, new_fids):
-                    if fid % 2 == 0:
-                        new_features[fid] = 0
-            else:
-                new_fid = 2
-                for fid in selector:
-                    after_value = next_fields[str(fid)]
-                    new_features[new_fid] = after_value
-                    new_fid += 2
-
-            #Print before and after:
-            buffer_ = [current_fields[0], current_fields[1]]
-
-            # print new_fids
-            for k, v in new_features.iteritems():
-                buffer_.append('{}:{}'.format(k, v))
-            # print ' '.join(buffer_)
-            print ' '.join(buffer_), '#', current_comment,
-
-    # Special case: end of file
-    current_head, current_comment = pointer3.split('# ')
-    _, current_docid, _ = current_comment.split(':')
-    current_fields = current_head.split()
-
-    previous_head, previous_comment = pointer2.split('# ')
-    _, previous_docid, _ = previous_comment.split(':')
-    previous_fields = dict([f.split(':') for f in previous_head.split()[2:]])
-
-    new_features = {}
-
-    #add BeforeSentence features
-    if previous_docid != current_docid:
-        for fid in range(1, new_fids):
-            if fid % 2 != 0:
-                new_features[fid] = 0
+    aggregates = [name for name in args.aggregates.split(',') if name]
+    for name in aggregates:
+        if name not in summaryrank.context.AGGREGATES:
+            print >>sys.stderr, 'unknown aggregate: {}'.format(name)
+            return 1
+
+    if summaryrank.binvec.is_binary(args.vector_file):
+        names, arrays = svmlight_tools.load_arrays(args.vector_file)
+        fids = range(1, len(names) + 1)
+        chunks = [arrays]
     else:
-        new_fid = 1
-        for fid in selector:
-            before_value = previous_fields[str(fid)]
-            new_features[new_fid] = before_value
-            new_fid += 2
-
-    #Add AfterSentence features
-    for fid in range(1, new_fids):
-        if fid % 2 == 0:
-            new_features[fid] = 0
-    buffer_ = [current_fields[0], current_fields[1]]
-
-    # print new_fids
-    for k, v in new_features.iteritems():
-        buffer_.append('{}:{}'.format(k, v))
-    # print ' '.join(buffer_)
-    print ' '.join(buffer_), '#', current_comment,
+        features = dict(svmlight_tools.get_text_features(args.vector_file))
+        fids = sorted(features)
+        names = [features[fid] for fid in fids]
+        _, blocks = svmlight_tools.get_preamble_and_blocks(summaryrank.open(args.vector_file))
+        chunks = svmlight_tools.get_array_chunks(blocks, nfeatures=max(fids) if fids else 0)
+
+    selected = [(fid, name) for fid, name in zip(fids, names) if not selector or fid in selector]
+    columns = [fid - 1 for fid, _ in selected]
+    context_names = summaryrank.context.get_context_names(
+        [name for _, name in selected], k=args.k, aggregates=aggregates)
+
+    # documents are kept whole within a chunk
+    get_keys = lambda chunk: summaryrank.context.get_doc_ids(chunk.docnos)
+    with svmlight_tools.ArrayWriter(args.output, context_names,
+                                    sparse=args.sparse, precision=args.precision) as writer:
+        for chunk in svmlight_tools.iter_whole_groups(chunks, get_keys=get_keys):
+            matrix = summaryrank.context.context_matrix(
+                np.asarray(chunk.matrix[:, columns], dtype=np.float64),
+                k=args.k, aggregates=aggregates, doc_ids=get_keys(chunk))
+            writer.write(chunk._replace(matrix=matrix))
+
@@ -1,6 +1,9 @@
 """
 Input/output data format
 """
+import numpy as np
+
+from . import binvec
 from . import svmlight_tools
 
 
@@ -17,7 +20,29 @@ class SVMLight(object):
         return features, vectors
 
     @classmethod
-    def write_columnwise(cls, out, features, columns, qrels):
+    def iter_arrays(cls, iterable, dtype=np.float64, sparse=False,
+                    blocksize=svmlight_tools.BLOCKSIZE, processes=1):
+        """ Return feature descriptions and a sequence of VectorArrays chunks
+
+        Each chunk holds the vectors parsed from about `blocksize` bytes of
+        input, so that memory use stays bounded.  Chunks can be parsed in
+        parallel by a select number of worker processes.
+        """
+        preamble, blocks = svmlight_tools.get_preamble_and_blocks(iterable, blocksize)
+        features = dict(svmlight_tools.get_preamble_features(preamble))
+        nfeatures = max(features) if features else None
+        chunks = svmlight_tools.get_array_chunks(
+            blocks, nfeatures=nfeatures, dtype=dtype, sparse=sparse, processes=processes)
+        return features, chunks
+
+    @classmethod
+    def parse_arrays(cls, iterable, dtype=np.float64, sparse=False, processes=1):
+        """ Return feature descriptions and all the vectors as VectorArrays """
+        return svmlight_tools.read_arrays(iterable, dtype=dtype, sparse=sparse,
+                                          processes=processes)
+
+    @classmethod
+    def write_columnwise(cls, out, features, columns, qrels, sparse=False, precision=None):
         """ Generate SVMLight format output with data in columns """
         qrels = list(qrels)
         qids = [qrel['qid'] for qrel in qrels]
@@ -25,4 +50,27 @@ class SVMLight(object):
         docnos = ['{}:{}'.format(qrel['docno'], qrel['id']) for qrel in qrels]
 
         svmlight_tools.write_preamble(out, features)
-        svmlight_tools.write_vectors_columnwise(out, qids, rels, docnos, columns)
+        svmlight_tools.write_vectors_columnwise(out, qids, rels, docnos, columns,
+                                                sparse=sparse, precision=precision)
+
+
+class BinaryVectors(object):
+    """ Binary vector file format, memory-mapped on read """
+
+    @classmethod
+    def load(cls, path):
+        """ Return feature names and VectorArrays """
+        vector_file = binvec.VectorFile(path)
+        return vector_file.features, svmlight_tools.VectorArrays(
+            vector_file.matrix, vector_file.qids, vector_file.rels, vector_file.docnos)
+
+    @classmethod
+    def write_columnwise(cls, path, features, columns, qrels, dtype=np.float64):
+        """ Generate binary output with data in columns """
+        qrels = list(qrels)
+        qids = [qrel['qid'] for qrel in qrels]
+        rels = [qrel['rel'] for qrel in qrels]
+        docnos = ['{}:{}'.format(qrel['docno'], qrel['id']) for qrel in qrels]
+
+        matrix = np.column_stack(columns) if columns else np.zeros((len(qrels), 0))
+        binvec.write(path, features, matrix, qids, rels, docnos, dtype=dtype)
@@ -261,6 +261,50 @@ FEATURE_SETS = [
 ]
 
 
+STEMMERS = collections.OrderedDict([
+    ('krovetz', KrovetzStemmer),
+    ('porter', PorterStemmer),
+])
+
+_PUNCTUATION_TRANS = string.maketrans(string.punctuation, ' ' * len(string.punctuation))
+
+
+def get_stemmer(name):
+    """ Return a stemmer (a callable) by name: krovetz or porter """
+    if name not in STEMMERS:
+        raise ValueError('unknown stemmer: {}'.format(name))
+    return STEMMERS[name]()
+
+
+def get_terms(text):
+    """ Return the terms of a text: lowercased, without punctuation and stopwords """
+    cleaned = str(text.lower()).translate(_PUNCTUATION_TRANS).split()
+    return [t for t in cleaned if t not in INQUERY_STOPLIST]
+
+
+def get_term_rows(rows, stemmer):
+    """ Generate the term and stem rows of text rows (whose last column is the text) """
+    for row in rows:
+        terms = get_terms(row[-1])
+        yield list(row[:-1]) + [' '.join(terms)], \
+            list(row[:-1]) + [' '.join([stemmer(t) for t in terms])]
+
+
+def generate_terms(model, stemmer, append=False):
+    """ Generate the term/stem representations of the topics and sentences in a model """
+    for kind in ('topics', 'sentences'):
+        names = [kind + '_term', kind + '_stem']
+        for segment in model.get_segments_to_generate(kind + '_text', names, append=append):
+            rows = model.load_segment(kind + '_text', segment)
+            with model.writer(names[0], segment) as out_t, \
+                    model.writer(names[1], segment) as out_s, \
+                    SaveFileLineIndicator(' and '.join(names)) as indicator:
+                for term_row, stem_row in get_term_rows(rows, stemmer):
+                    out_t.write_row(term_row)
+                    out_s.write_row(stem_row)
+                    indicator.update()
+
+
 def gen_term(argv):
     """ Generate basic term/stem representations """
     parser = argparse.ArgumentParser(
@@ -268,47 +312,18 @@ def gen_term(argv):
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
 
-    parser.add_argument('--stemmer',
+    parser.add_argument('--stemmer', choices=STEMMERS.keys(),
                         help='use the specified stemmer: porter or krovetz (default)')
     parser.add_argument('-m', dest='model', metavar='DIR', required=True,
                         help='store the processed data in DIR')
+    parser.add_argument('--append', action='store_true',
+                        help='only process the segments missing from the representations')
     parser.set_defaults(stemmer='krovetz')
     args = parser.parse_args(argv)
 
-    model = summaryrank.Model(args.model)
-
-    if args.stemmer == 'porter':
-        stemmer = PorterStemmer()
-        print >>sys.stderr, 'use Porter stemmer'
-    elif args.stemmer == 'krovetz':
-        stemmer = KrovetzStemmer() # this is default
-        print >>sys.stderr, 'use Krovetz stemmer'
-    else:
-        parser.error('must specify the stemmer with --stemmer')
-
-    trans = string.maketrans(string.punctuation, ' ' * len(string.punctuation))
-
-    topics = model.load_representation('topics_text')
-    with model.open('topics_term', 'wb') as out_t, model.open('topics_stem', 'wb') as out_s:
-        with SaveFileLineIndicator('topics_term and topics_stem') as indicator:
-            for qid, text in topics:
-                cleaned = str(text.lower()).translate(trans).split()
-                terms = [t for t in cleaned if t not in INQUERY_STOPLIST]
-                out_t.write(qid + '\t' + ' '.join(terms) + '\n')
-                stems = [stemmer(t) for t in terms]
-                out_s.write(qid + '\t' + ' '.join(stems) + '\n')
-                indicator.update()
-
-    sentences = model.load_representation('sentences_text')
-    with model.open('sentences_term', 'wb') as out_t, model.open('sentences_stem', 'wb') as out_s:
-        with SaveFileLineIndicator('sentences_term and sentences_stem') as indicator:
-            for docno, id_, qid, text in sentences:
-                cleaned = str(text.lower()).translate(trans).split()
-                terms = [t for t in cleaned if t not in INQUERY_STOPLIST]
-                out_t.write('\t'.join([docno, id_, qid, ' '.join(terms)]) + '\n')
-                stems = [stemmer(t) for t in terms]
-                out_s.write('\t'.join([docno, id_, qid, ' '.join(stems)]) + '\n')
-                indicator.update()
+    model = summaryrank.get_model(args.model)
+    print >>sys.stderr, 'use {} stemmer'.format(args.stemmer.capitalize())
+    generate_terms(model, get_stemmer(args.stemmer), append=args.append)
 
 
 def gen_freqstats(argv):
@@ -327,7 +342,7 @@ def gen_freqstats(argv):
                         help='(Galago only) index part: postings.krovetz or postings.porter')
     args = parser.parse_args(argv)
 
-    model = summaryrank.Model(args.model)
+    model = summaryrank.get_model(args.model)
 
     if IndriIndex.is_valid_path(args.index_path):
         index = IndriIndex(args.index_path)
@@ -346,4 +361,4 @@ def gen_freqstats(argv):
 
     print >>sys.stderr, 'found {} stems'.format(len(term_set))
 
-    IndexDump.dump(model.get_path('freq_stats'), index, term_set)
+    IndexDump.dump(model.get_output_path('freq_stats'), index, term_set, codec=model.codec)
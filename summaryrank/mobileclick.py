@@ -3,9 +3,11 @@ Tools for importing MobileClick-2 data
 """
 import argparse
 import re
+import sys
 import tarfile
 
 import summaryrank
+import summaryrank.compression
 
 
 IMPORTER_DESCRIPTION = r'''
@@ -30,16 +32,33 @@ def import_mobileclick(argv):
 
     parser.add_argument('-m', dest='model', metavar='DIR', required=True,
                         help='store the processed data in DIR')
+    parser.add_argument('--codec', type=summaryrank.compression.codec_argument,
+                        help='compress the model files with CODEC, e.g., gzip:6, bgzf, '
+                        'bz2 or none (default: gzip)')
+    parser.add_argument('--append', action='store_true',
+                        help='add the topics that are not in the model yet as a new segment')
+    parser.add_argument('--backend', choices=summaryrank.base.BACKENDS.keys(),
+                        help='store the representations as files or in an SQLite database '
+                        '(default: as the model already does, or files)')
     parser.add_argument('queries_file')
     parser.add_argument('iunits_file')
     parser.add_argument('weights_file', nargs='?')
     args = parser.parse_args(argv)
 
-    model = summaryrank.Model(args.model)
+    model = summaryrank.get_model(args.model, args.backend)
+    if args.codec:
+        model.set_codec(args.codec)
 
     # process and save query topics
     topics = list(get_topics(summaryrank.open(args.queries_file)))
-    model.save_topics(topics)
+    try:
+        segment, topics = model.start_import(topics, append=args.append)
+    except ValueError as e:
+        parser.error(str(e))
+    if not topics:
+        print >>sys.stderr, 'no new topics to import'
+        return
+    model.save_topics(topics, segment)
     qids = [m['qid'] for _, m in topics]
 
     # process corpus data and save sentences
@@ -48,7 +67,7 @@ def import_mobileclick(argv):
     else:
         qrels = {}
     sentences = get_sentences(summaryrank.open(args.iunits_file), qrels=qrels, charset='utf8')
-    model.save_sentences_qrels(sentences, qids=set(qids))
+    model.save_sentences_qrels(sentences, qids=set(qids), segment=segment)
 
 
 def get_topics(iterable):
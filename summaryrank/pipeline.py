@@ -0,0 +1,333 @@
+"""
+Pipeline runner
+
+A pipeline is a JSON spec of the steps that build a model, e.g.:
+
+    {
+      "model": "webap",
+      "steps": [
+        {"name": "term", "command": "gen_term", "args": ["--stemmer", "krovetz"],
+         "inputs": ["topics_text", "sentences_text"],
+         "outputs": ["topics_term", "topics_stem", "sentences_term", "sentences_stem"]},
+        ...
+      ]
+    }
+
+Each step runs a SummaryRank command on the model (`-m MODEL` is added to the
+arguments).  Its `inputs` and `outputs` are representations in the model, and
+`input_files` and `output_files` are any other files (or directories, such as
+indexes) it reads or writes; the standard output of a step can be sent to a
+file via `stdout`, which then counts as an output file.  The steps depend on
+each other through their inputs and outputs.
+
+For every output, the model manifest records the step, the command line, the
+hashes of the inputs and of the output itself, and the timing of the run.  A
+step is run only if some output is missing, or its record does not match the
+current command line and inputs (hashes of uncompressed content, so that
+recompression does not count as a change); a step without outputs always runs.  Steps whose dependencies are done
+run in parallel, in separate processes.
+"""
+import argparse
+import collections
+import hashlib
+import json
+import os
+import Queue
+import subprocess
+import sys
+import threading
+import time
+
+import summaryrank
+
+
+BLOCKSIZE = 1024 * 1024
+
+Step = collections.namedtuple('Step', ['name', 'command', 'args', 'inputs', 'outputs',
+                                       'input_files', 'output_files', 'stdout'])
+
+
+def load_spec(iterable):
+    """ Return the model path and the steps of a pipeline spec """
+    spec = json.load(iterable)
+    steps = []
+    for entry in spec.get('steps', []):
+        if 'name' not in entry or 'command' not in entry:
+            raise ValueError('each step needs a name and a command')
+        output_files = list(entry.get('output_files', []))
+        if entry.get('stdout'):
+            output_files.append(entry['stdout'])
+        steps.append(Step(entry['name'], entry['command'],
+                          [str(arg) for arg in entry.get('args', [])],
+                          list(entry.get('inputs', [])), list(entry.get('outputs', [])),
+                          list(entry.get('input_files', [])), output_files,
+                          entry.get('stdout')))
+    return spec.get('model'), steps
+
+
+def _get_input_keys(step):
+    return [('representation', name) for name in step.inputs] + \
+        [('file', path) for path in step.input_files]
+
+
+def _get_output_keys(step):
+    return [('representation', name) for name in step.outputs] + \
+        [('file', path) for path in step.output_files]
+
+
+def get_dependencies(steps):
+    """ Return the steps in a dependency order and the dependencies of each step
+
+    The dependencies are the names of the steps that produce the inputs of a
+    step.  A ValueError is raised on duplicate names or outputs and on cycles.
+    """
+    producers = dict()
+    for step in steps:
+        if step.name in [other.name for other in steps if other is not step]:
+            raise ValueError('duplicate step: {}'.format(step.name))
+        for key in _get_output_keys(step):
+            if key in producers:
+                raise ValueError('{} is the output of both {} and {}'.format(
+                    key[1], producers[key], step.name))
+            producers[key] = step.name
+
+    dependencies = dict((step.name, set(producers[key] for key in _get_input_keys(step)
+                                        if key in producers))
+                        for step in steps)
+
+    ordered, done = [], set()
+    remaining = list(steps)
+    while remaining:
+        ready = [step for step in remaining if dependencies[step.name] <= done]
+        if not ready:
+            raise ValueError('cyclic dependencies among steps: {}'.format(
+                ', '.join(step.name for step in remaining)))
+        ordered.extend(ready)
+        done.update(step.name for step in ready)
+        remaining = [step for step in remaining if step.name not in done]
+    return ordered, dependencies
+
+
+def _get_stat(paths):
+    return [[os.path.basename(path), os.path.getsize(path), os.path.getmtime(path)]
+            for path in paths]
+
+
+def hash_files(paths, opener=open):
+    """ Return the SHA-1 hex digest of the content of the files (in order) """
+    digest = hashlib.sha1()
+    for path in paths:
+        with opener(path, 'rb') as in_:
+            for data in iter(lambda: in_.read(BLOCKSIZE), ''):
+                digest.update(data)
+    return digest.hexdigest()
+
+
+def hash_tree(path):
+    """ Return a digest of a directory from the names, sizes and mtimes of its files """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            digest.update(json.dumps([os.path.relpath(filename, path),
+                                      os.path.getsize(filename),
+                                      os.path.getmtime(filename)]))
+    return digest.hexdigest()
+
+
+class Runner(object):
+    """ Run the out-of-date steps of a pipeline on a model """
+
+    def __init__(self, model, steps, processes=1, force=False, dry_run=False):
+        self.model = model
+        self.steps, self.dependencies = get_dependencies(steps)
+        self.processes = max(1, processes)
+        self.force = force
+        self.dry_run = dry_run
+
+    def get_hash(self, key):
+        """ Return the content hash of an input/output (None if missing) """
+        kind, name = key
+        if kind == 'file':
+            if os.path.isdir(name):
+                return hash_tree(name)
+            elif not os.path.isfile(name):
+                return None
+            stat = _get_stat([name])
+            compute = lambda: hash_files([name])
+        else:
+            # an earlier step may have (re)created the model with another backend
+            model = summaryrank.get_model(self.model.path)
+            stat = model.get_stamp(name)
+            if stat is None:
+                return None
+            compute = lambda: model.hash_representation(name)
+
+        # the hashes are cached along with the file stats
+        manifest = self.model.load_manifest()
+        cache_key = '{}:{}'.format(kind, os.path.abspath(name) if kind == 'file' else name)
+        cached = manifest.get('hashes', dict()).get(cache_key)
+        if cached and cached['stat'] == stat:
+            return cached['sha1']
+        sha1 = compute()
+
+        def _update(manifest):
+            manifest.setdefault('hashes', dict())[cache_key] = {'stat': stat, 'sha1': sha1}
+
+        self.model.update_manifest(_update)
+        return sha1
+
+    def get_argv(self, step):
+        """ Return the command line arguments of a step """
+        return [step.command, '-m', self.model.path] + step.args
+
+    def _get_record(self, manifest, key):
+        section = 'representations' if key[0] == 'representation' else 'files'
+        return manifest.get(section, dict()).get(key[1])
+
+    def is_up_to_date(self, step, inputs):
+        """ Return true if the recorded outputs of the step match the argv and inputs
+
+        A step without outputs has nothing to check, and is never up to date.
+        """
+        keys = _get_output_keys(step)
+        if not keys:
+            return False
+        manifest = self.model.load_manifest()
+        for key in keys:
+            record = self._get_record(manifest, key)
+            if record is None or record['step'] != step.name or \
+                    record['argv'] != self.get_argv(step) or record['inputs'] != inputs or \
+                    record['sha1'] != self.get_hash(key):
+                return False
+        return True
+
+    def record(self, step, inputs, started, elapsed):
+        """ Record the outputs of a step that has run """
+        hashes = [(key, self.get_hash(key)) for key in _get_output_keys(step)]
+
+        def _update(manifest):
+            for key, sha1 in hashes:
+                section = 'representations' if key[0] == 'representation' else 'files'
+                manifest.setdefault(section, dict())[key[1]] = {
+                    'step': step.name,
+                    'command': step.command,
+                    'argv': self.get_argv(step),
+                    'inputs': inputs,
+                    'sha1': sha1,
+                    'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+                    'elapsed': round(elapsed, 3),
+                }
+
+        # steps still running may update the manifest as well
+        self.model.update_manifest(_update)
+
+    def _start(self, step, results):
+        """ Run a step in a subprocess, putting its exit status into the results """
+        env = dict(os.environ)
+        path = os.path.dirname(os.path.dirname(os.path.abspath(summaryrank.__file__)))
+        env['PYTHONPATH'] = os.pathsep.join([path] + filter(None, [env.get('PYTHONPATH')]))
+        stdout = open(step.stdout, 'wb') if step.stdout else None
+        started = time.time()
+        process = subprocess.Popen([sys.executable, '-m', 'summaryrank'] + self.get_argv(step),
+                                   stdout=stdout, env=env)
+
+        def _wait():
+            returncode = process.wait()
+            if stdout:
+                stdout.close()
+            results.put((step, returncode, started, time.time() - started))
+
+        thread = threading.Thread(target=_wait)
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        """ Run the steps; return the names of the steps that failed or were not run """
+        self.model.create()
+        pending = list(self.steps)
+        done, changed, failed = set(), set(), set()
+        running = dict()
+        results = Queue.Queue()
+
+        while pending or running:
+            progress = True
+            while progress and len(running) < self.processes:
+                progress = False
+                for step in pending:
+                    if not self.dependencies[step.name] <= done:
+                        continue
+                    pending.remove(step)
+                    progress = True
+
+                    inputs = dict(('{}:{}'.format(*key), self.get_hash(key))
+                                  for key in _get_input_keys(step))
+                    stale = self.force or self.dependencies[step.name] & changed or \
+                        not self.is_up_to_date(step, inputs)
+                    if not stale:
+                        print >>sys.stderr, '[{}] up to date'.format(step.name)
+                        done.add(step.name)
+                    elif self.dry_run:
+                        print >>sys.stderr, '[{}] would run: {}'.format(
+                            step.name, ' '.join(self.get_argv(step)))
+                        done.add(step.name)
+                        changed.add(step.name)
+                    else:
+                        print >>sys.stderr, '[{}] run: {}'.format(
+                            step.name, ' '.join(self.get_argv(step)))
+                        self._start(step, results)
+                        running[step.name] = inputs
+                    break
+
+            if not running:
+                break
+            step, returncode, started, elapsed = results.get()
+            inputs = running.pop(step.name)
+            if returncode == 0:
+                self.record(step, inputs, started, elapsed)
+                print >>sys.stderr, '[{}] done in {:.1f}s'.format(step.name, elapsed)
+                done.add(step.name)
+            else:
+                print >>sys.stderr, '[{}] failed with exit status {}'.format(
+                    step.name, returncode)
+                failed.add(step.name)
+
+        return sorted(failed) + [step.name for step in pending]
+
+
+def pipeline(argv):
+    """ Run the out-of-date steps of a pipeline """
+    parser = argparse.ArgumentParser(
+        prog='pipeline',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__.strip().split('\n', 1)[1],
+    )
+
+    parser.add_argument('-m', dest='model', metavar='DIR',
+                        help='build the model in DIR (default: the model in the spec)')
+    parser.add_argument('-j', dest='processes', metavar='N', type=int, default=1,
+                        help='run up to N steps at a time (default: %(default)s)')
+    parser.add_argument('-B', dest='force', action='store_true',
+                        help='run all the steps, whether up to date or not')
+    parser.add_argument('-n', dest='dry_run', action='store_true',
+                        help='only print the steps that would run')
+    parser.add_argument('spec_file',
+                        help='pipeline spec, in JSON format')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.spec_file) as in_:
+            model_path, steps = load_spec(in_)
+        if not (args.model or model_path):
+            raise ValueError('no model given in the spec or via -m')
+        runner = Runner(summaryrank.get_model(args.model or model_path), steps,
+                        processes=args.processes, force=args.force, dry_run=args.dry_run)
+    except (ValueError, IOError, TypeError) as e:
+        print >>sys.stderr, 'error: {}'.format(e)
+        return 1
+
+    unfinished = runner.run()
+    if unfinished:
+        print >>sys.stderr, 'steps not completed: {}'.format(', '.join(unfinished))
+        return 1
@@ -1,17 +1,19 @@
 """
 Resources
 """
-import gzip
+import itertools
 import json
 import os.path
 import redis
 import subprocess
 import sys
+import threading
 import time
 import csv
 from gensim.models.word2vec import Word2Vec as W2V
 
-from summaryrank.util import memoize, SaveFileLineIndicator, LoadFileLineIndicator
+import summaryrank.base
+from summaryrank.util import unique, memoize, LRUCache, SaveFileLineIndicator, LoadFileLineIndicator
 
 from porterstemmer import Stemmer as PorterStemmer
 from krovetzstemmer import Stemmer as KrovetzStemmer
@@ -114,14 +116,15 @@ class IndexDump(FrequencyStats):
         return self._num_docs
 
     @classmethod
-    def dump(cls, path, index, term_set=None):
+    def dump(cls, path, index, term_set=None, codec=None):
         """ Retrieve/filter term stats and save to file """
         if term_set:
             to_include = lambda x: x in term_set
         else:
             to_include = lambda x: True
 
-        with gzip.open(path, 'wb') as out, SaveFileLineIndicator(path) as indicator:
+        with summaryrank.base.open(path, 'wb', codec=codec) as out, \
+                SaveFileLineIndicator(path) as indicator:
             out.write('\t'.join(['__INDEX__', str(index.collection_length()),
                                  str(index.num_docs())]) + '\n')
             indicator.update()
@@ -134,7 +137,7 @@ class IndexDump(FrequencyStats):
     @classmethod
     def load(cls, path):
         """ Load saved term stats """
-        with gzip.open(path) as in_, LoadFileLineIndicator(path) as indicator:
+        with summaryrank.base.open(path) as in_, LoadFileLineIndicator(path) as indicator:
             firstline = next(in_)
             _, collection_length, num_docs = firstline.rstrip('\n').split('\t', 2)
             indicator.update()
@@ -334,8 +337,25 @@ class GalagoIndex(Index):
 
 class RedisStrings(object):
     """ a dict-like wrapper for redis strings  """
-    def __init__(self, *args, **kwargs):
-        self.redis = redis.StrictRedis(*args, **kwargs)
+
+    _connection_pools = dict()
+    _connection_pools_lock = threading.Lock()
+
+    def __init__(self, host='localhost', port=6379, db=0, client=None, chunk_size=1000, **kwargs):
+        if client is None:
+            pool = self.get_connection_pool(host=host, port=port, db=db, **kwargs)
+            client = redis.StrictRedis(connection_pool=pool)
+        self.redis = client
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def get_connection_pool(cls, **kwargs):
+        """ Return a connection pool shared by all the instances on the same server """
+        key = tuple(sorted(kwargs.items()))
+        with cls._connection_pools_lock:
+            if key not in cls._connection_pools:
+                cls._connection_pools[key] = redis.ConnectionPool(**kwargs)
+            return cls._connection_pools[key]
 
     def __contains__(self, key):
         return self.redis.exists(key)
@@ -350,6 +370,15 @@ class RedisStrings(object):
     def get(self, key, default=None):
         return self.redis.get(key) or default
 
+    def get_many(self, keys, default=None):
+        """ Return the values for a list of keys, fetched by pipelined MGETs """
+        chunks = [keys[i:i + self.chunk_size] for i in range(0, len(keys), self.chunk_size)]
+        pipe = self.redis.pipeline(transaction=False)
+        for chunk in chunks:
+            pipe.mget(chunk)
+        values = itertools.chain.from_iterable(pipe.execute()) if chunks else []
+        return [default if value is None else value for value in values]
+
     def has_key(self, key):
         return self.redis.exists(key)
 
@@ -365,28 +394,47 @@ def parse_value(value, k=None):
 
 
 class ESARedisStrings(RedisStrings):
-    def __init__(self, *args, **kwargs):
-        if 'k' in kwargs:
-            self.k = kwargs['k']
-            del kwargs['k']
-        else:
-            self.k = None
+    """ a dict-like wrapper for ESA vectors in redis, with parsed vectors cached """
 
+    def __init__(self, *args, **kwargs):
+        self.k = kwargs.pop('k', None)
+        self._cache = LRUCache(kwargs.pop('cache_size', 100000))
         super(ESARedisStrings, self).__init__(*args, **kwargs)
 
+    def __contains__(self, key):
+        # a GET rather than an EXISTS, so that the vector is cached for later use
+        return self.get(key) is not None
+
     def __getitem__(self, key):
-        value = self.redis.__getitem__(key)
+        value = self.get(key)
         if value is None:
             raise KeyError
         else:
-            return parse_value(value, self.k)
+            return value
 
     def get(self, key, default=None):
-        value = self.redis.get(key)
-        if value is None:
-            return default
-        else:
-            return parse_value(value, self.k)
+        vector = self._cache.get(key)
+        if vector is None:
+            value = self.redis.get(key)
+            if value is None:
+                return default
+            vector = parse_value(value, self.k)
+            self._cache[key] = vector
+        return vector
+
+    def get_many(self, keys, default=None):
+        """ Return the vectors for a list of keys, fetching only uncached ones """
+        vectors = [self._cache.get(key) for key in keys]
+        missing = unique([key for key, vector in zip(keys, vectors) if vector is None])
+
+        fetched = dict()
+        for key, value in zip(missing, super(ESARedisStrings, self).get_many(missing)):
+            if value is not None:
+                fetched[key] = parse_value(value, self.k)
+                self._cache[key] = fetched[key]
+
+        return [fetched.get(key, default) if vector is None else vector
+                for key, vector in zip(keys, vectors)]
 
 
 class ESAVectors:
@@ -396,9 +444,8 @@ class ESAVectors:
 
     def _load(self, esa, k=None):
         if os.path.isfile(esa):
-            opener = gzip.open if esa.endswith('.gz') else open
             vectors = dict()
-            with opener(esa) as file_input:
+            with summaryrank.base.open(esa) as file_input:
                 for line in file_input:
                     components = line.split()
                     name = components[0]
@@ -433,9 +480,8 @@ class TAGME:
         self.weight = weight
 
     def _load_file(self, filename):
-        opener = gzip.open if filename.endswith('.gz') else open
         entities = dict()
-        with opener(filename) as csvfile:
+        with summaryrank.base.open(filename) as csvfile:
                 reader = csv.reader(csvfile, delimiter='\t',quoting=csv.QUOTE_NONE)
                 for row in reader:
                         qid = row[0].strip()
@@ -445,9 +491,8 @@ class TAGME:
 
     def _load_sentence_file(self, filename):
         csv.field_size_limit(sys.maxsize)
-        opener = gzip.open if filename.endswith('.gz') else open
         entities = dict()
-        with opener(filename) as csvfile:
+        with summaryrank.base.open(filename) as csvfile:
                 reader = csv.reader(csvfile, delimiter='\t',quoting=csv.QUOTE_NONE)
                 for row in reader:
                         qid = row[0].strip()
@@ -0,0 +1,84 @@
+"""
+In-memory scoring
+
+Features can be computed for a query and a list of sentences without any
+model on disk: the texts and their term/stem representations are put into a
+MemoryModel, which the features read from.
+
+    >>> summaryrank.score('solar panels', sentences, ['SentenceLength', 'TermOverlap'])
+
+Features that need term statistics (e.g., LanguageModelScore) read freq_stats
+from the model directory given as path, or take an index via their options.
+A Scorer keeps its features (and any resources they have loaded) across
+calls, and so does score() for the same arguments.
+"""
+import numpy as np
+
+import summaryrank
+from summaryrank.features import get_features
+from summaryrank.mk import get_stemmer, get_term_rows
+
+
+QID = '0'
+DOCNO = 'D'
+
+
+def _encode(text):
+    return text.encode('utf8') if isinstance(text, unicode) else text
+
+
+def build_model(query, sentences, stemmer, path=None):
+    """ Return a MemoryModel holding the query and the sentences (of one document) """
+    model = summaryrank.MemoryModel(path)
+    topics = [[QID, _encode(query)]]
+    sentences = [[DOCNO, str(i), QID, _encode(text)] for i, text in enumerate(sentences, 1)]
+
+    for kind, rows in (('topics', topics), ('sentences', sentences)):
+        with model.writer(kind + '_text') as out:
+            out.write_rows(rows)
+        with model.writer(kind + '_term') as out_t, model.writer(kind + '_stem') as out_s:
+            for term_row, stem_row in get_term_rows(rows, stemmer):
+                out_t.write_row(term_row)
+                out_s.write_row(stem_row)
+    with model.writer('qrels') as out:
+        out.write_rows([row[:3] + ['0'] for row in sentences])
+    return model
+
+
+class Scorer(object):
+    """ Compute features of sentences against a query, in memory """
+
+    def __init__(self, features, argv=(), stemmer='krovetz', path=None):
+        self.features = get_features(features, argv)
+        self.stemmer = get_stemmer(stemmer)
+        self.path = path
+
+    @property
+    def names(self):
+        """ The names of the features (the columns of the scores) """
+        return [str(feature) for feature in self.features]
+
+    def score(self, query, sentences):
+        """ Return the matrix of the feature values (one row per sentence) """
+        model = build_model(query, sentences, self.stemmer, path=self.path)
+        columns = []
+        for feature in self.features:
+            try:
+                feature.check(model)
+            except AssertionError:
+                raise ValueError('{} needs representations not available in memory'.format(
+                    feature))
+            columns.append(feature.compute(model))
+        return np.column_stack(columns) if columns else np.zeros((len(sentences), 0))
+
+
+_SCORERS = dict()
+
+
+def score(query, sentences, features, argv=(), stemmer='krovetz', path=None):
+    """ Return the matrix of the values of the features (classnames of features or
+    feature sets) of the sentences against the query, one row per sentence """
+    key = (tuple(features), tuple(argv), stemmer, path)
+    if key not in _SCORERS:
+        _SCORERS[key] = Scorer(features, argv=argv, stemmer=stemmer, path=path)
+    return _SCORERS[key].score(query, sentences)
@@ -2,17 +2,20 @@
 Semantic features
 """
 import argparse
+import itertools
 import json
 import math
+import os
 import subprocess
 import sys
 import tempfile
 
+import numpy as np
 from gensim.models.word2vec import Word2Vec
 from . import tagme
 
 import summaryrank
-from summaryrank.util import ElapsedTimeIndicator, SaveFileLineIndicator
+from summaryrank.util import memoize, unique, ElapsedTimeIndicator, SaveFileLineIndicator
 
 class ESACosineSimilarity(summaryrank.Feature):
     """ Cosine similarity between query and sentence ESA vectors """
@@ -76,18 +79,29 @@ class ESACosineSimilarity(summaryrank.Feature):
         return math.sqrt(sum([math.exp(val + val) for val in v.values()]))
 
 
-class Word2VecSimilarity(summaryrank.Feature):
-    """ Average cosine similarity between query-sentence word vector pairs """
+@memoize
+def _load_word2vec(path):
+    """ Load a word2vec binary model with unit-length word vectors """
+    with ElapsedTimeIndicator('load ' + path + ' [{elapsed}]') as indicator:
+        word2vec = Word2Vec.load_word2vec_format(path, binary=True)
+        word2vec.init_sims(replace=True)
+    return word2vec
+
+
+class Word2VecFeature(summaryrank.Feature):
+    """ The base class for word2vec features """
 
     def __init__(self, args):
-        super(Word2VecSimilarity, self).__init__(args)
+        super(Word2VecFeature, self).__init__(args)
         self._word2vec_model = args.word2vec_model
         self._word2vec = None
 
     @classmethod
     def init_parser(cls, parser, group):
-        group.add_argument('--word2vec-model', metavar='FILE',
-                           help='the word2vec binary model')
+        # be warned, using the secret API
+        if not parser._get_option_tuples('--word2vec-model'):
+            group.add_argument('--word2vec-model', metavar='FILE',
+                               help='the word2vec binary model')
 
     @classmethod
     def check_parser_args(cls, parser, args):
@@ -96,10 +110,11 @@ class Word2VecSimilarity(summaryrank.Feature):
 
     def check(self, model):
         assert model.contains(['topics_term', 'sentences_term'])
+        self._word2vec = _load_word2vec(self._word2vec_model)
 
-        with ElapsedTimeIndicator('load ' + self._word2vec_model + ' [{elapsed}]') as indicator:
-            self._word2vec = Word2Vec.load_word2vec_format(self._word2vec_model, binary=True)
-            self._word2vec.init_sims(replace=True)
+
+class Word2VecSimilarity(Word2VecFeature):
+    """ Average cosine similarity between query-sentence word vector pairs """
 
     def compute(self, model):
         result = []
@@ -119,9 +134,82 @@ class Word2VecSimilarity(summaryrank.Feature):
         return result
 
 
+class Word2VecAlignment(Word2VecFeature):
+    """ Mean over query terms of the maximum cosine similarity to a sentence term
+
+    For each qid, the similarities between query terms and all the distinct
+    sentence terms are computed in one matrix product; each sentence then
+    reduces the columns of its own terms.
+    """
+
+    def compute(self, model):
+        result = []
+
+        queries = dict()
+        for text, m in model.load_topics('topics_term'):
+            terms = [t for t in text.split() if t in self._word2vec]
+            queries[m['qid']] = self._word2vec[terms] if terms else None
+
+        sentences_term = model.load_sentences('sentences_term')
+        for qid, group in itertools.groupby(sentences_term, lambda pair: pair[1]['qid']):
+            texts = [text for text, _ in group]
+            result.extend(self.compute_group(queries[qid], texts))
+        return result
+
+    def compute_group(self, query, texts):
+        """ Compute the scores for all the sentences of one query """
+        vocab = dict()
+        columns = []
+        for text in texts:
+            # a repeated sentence term counts once
+            columns.append(unique(vocab.setdefault(t, len(vocab))
+                                  for t in text.split() if t in self._word2vec))
+
+        if query is None or not vocab:
+            return [0] * len(texts)
+
+        words = sorted(vocab, key=vocab.get)
+        sims = np.dot(query, self._word2vec[words].T)
+        return [self.reduce(sims[:, cols]) if cols else 0 for cols in columns]
+
+    def reduce(self, sims):
+        """ Reduce a query-term by sentence-term similarity matrix to a score """
+        return float(sims.max(axis=1).mean())
+
+
+class Word2VecMaxSimilarity(Word2VecAlignment):
+    """ Maximum cosine similarity between query-sentence word vector pairs """
+
+    def reduce(self, sims):
+        return float(sims.max())
+
+
+class Word2VecTopKAlignment(Word2VecAlignment):
+    """ Mean over query terms of the top-K cosine similarities to sentence terms """
+
+    def __init__(self, args):
+        super(Word2VecTopKAlignment, self).__init__(args)
+        self.k = args.word2vec_k
+
+    @classmethod
+    def init_parser(cls, parser, group):
+        super(Word2VecTopKAlignment, cls).init_parser(parser, group)
+        group.add_argument('--word2vec-k', type=int, metavar='NUM',
+                           help='use top-ranked K sentence terms (default: %(default)s)')
+        group.set_defaults(word2vec_k=3)
+
+    def reduce(self, sims):
+        k = min(self.k, sims.shape[1])
+        return float(np.partition(sims, -k, axis=1)[:, -k:].mean())
+
+
 class TagmeOverlap(summaryrank.Feature):
     """ Jaccard coefficient between query and sentence TAGME entities """
 
+    def __init__(self, args):
+        super(TagmeOverlap, self).__init__(args)
+        self._use_ids = False
+
     @classmethod
     def jaccard(cls, a, b):
         """ Compute the Jaccard coefficient between two sets a and b """
@@ -131,6 +219,24 @@ class TagmeOverlap(summaryrank.Feature):
         set_b = set(b)
         return float(len(set_a & set_b)) / len(set_a | set_b)
 
+    @classmethod
+    def jaccard_sorted(cls, a, b):
+        """ Compute the Jaccard coefficient between two sorted arrays of unique items """
+        len_a, len_b = len(a), len(b)
+        if len_a == 0 or len_b == 0:
+            return 0
+        i, j, common = 0, 0, 0
+        while i < len_a and j < len_b:
+            if a[i] < b[j]:
+                i += 1
+            elif a[i] > b[j]:
+                j += 1
+            else:
+                common += 1
+                i += 1
+                j += 1
+        return float(common) / (len_a + len_b - common)
+
     def build_set(self, rep):
         """ Build a set out of the given TAGME representation """
         if rep.strip() == '':
@@ -138,10 +244,20 @@ class TagmeOverlap(summaryrank.Feature):
         data = json.loads(rep)
         return set(anno['id'] for anno in data['annotations'])
 
+    def build_array(self, rep):
+        """ Build a sorted array out of the given TAGME entity-id representation """
+        return [int(x) for x in rep.split()]
+
     def check(self, model):
-        assert model.contains(['topics_tagme', 'sentences_tagme'])
+        # the entity ids hold the same entities as the responses, only compacted
+        self._use_ids = model.contains(['topics_tagme_ids', 'sentences_tagme_ids'])
+        if not self._use_ids:
+            assert model.contains(['topics_tagme', 'sentences_tagme'])
 
     def compute(self, model):
+        if self._use_ids:
+            return self.compute_over_ids(model)
+
         result = []
         topics_tagme = model.load_topics('topics_tagme')
         queries = dict((m['qid'], self.build_set(rep)) for rep, m in topics_tagme)
@@ -152,6 +268,18 @@ class TagmeOverlap(summaryrank.Feature):
             result.append(self.jaccard(query, sentence))
         return result
 
+    def compute_over_ids(self, model):
+        """ Compute the feature values over the compact entity-id representations """
+        result = []
+        topics_tagme = model.load_topics('topics_tagme_ids')
+        queries = dict((m['qid'], self.build_array(rep)) for rep, m in topics_tagme)
+
+        for rep, m in model.load_sentences('sentences_tagme_ids'):
+            sentence = self.build_array(rep)
+            query = queries[m['qid']]
+            result.append(self.jaccard_sorted(query, sentence))
+        return result
+
 
 #  class TagmeAndESACosineSimilarity(ESACosineSimilarity):
         #  def initialize(self, resources):
@@ -210,6 +338,9 @@ class TagmeOverlap(summaryrank.Feature):
 FEATURES = [
     ESACosineSimilarity,
     Word2VecSimilarity,
+    Word2VecAlignment,
+    Word2VecMaxSimilarity,
+    Word2VecTopKAlignment,
     TagmeOverlap,
 ]
 
@@ -246,61 +377,52 @@ def gen_esa(argv):
                         help='store the processed data in DIR')
     parser.add_argument('-k', type=int,
                         help='number of concepts to index in a vector (default: %(default)s)')
+    parser.add_argument('--append', action='store_true',
+                        help='only process the segments missing from the representations')
     parser.add_argument('index_path',
                         help='path to a Galago index')
     parser.set_defaults(k=100)
     args = parser.parse_args(argv)
 
-    model = summaryrank.Model(args.model)
-
-    with model.open('topics_esa', 'wb') as out:
-        query_filename = None
-        with tempfile.NamedTemporaryFile(delete=False) as query_json:
-            queries = []
-            for qid, text in model.load_representation('topics_term'):
-                queries.append({'number': qid, 'text': text})
-            json.dump({'queries': queries}, query_json, indent=2)
-            query_filename = query_json.name
-
-        p = subprocess.Popen(['galago', 'batch-search', '--index={}'.format(args.index_path),
-                              '--requested={}'.format(args.k), query_filename],
-                             stdout=subprocess.PIPE)
-        with SaveFileLineIndicator('topics_esa', gap=1) as indicator:
-            esa_vectors = _get_esa_vectors(p.stdout, 'ENWIKI_')
-            vid, vector = next(esa_vectors, (None, None))
-            for qid, _ in model.load_representation('topics_term'):
-                if qid == vid:
-                    out.write(qid + '\t' + ' '.join(
-                        ['{}:{}'.format(k, v) for k, v in vector]) + '\n')
-                    vid, vector = next(esa_vectors, (None, None))
-                else:
-                    out.write(qid + '\t' + '\n')
-                indicator.update()
-
-    with model.open('sentences_esa', 'wb') as out:
-        query_filename = None
-        with tempfile.NamedTemporaryFile(delete=False) as query_json:
-            queries = []
-            for docno, id_, qid, text in model.load_representation('sentences_term'):
-                queries.append({'number': '{}:{}:{}'.format(qid, docno, id_), 'text': text})
-            json.dump({'queries': queries}, query_json, indent=2)
-            query_filename = query_json.name
-
-        p = subprocess.Popen(['galago', 'batch-search', '--index={}'.format(args.index_path),
-                              '--requested={}'.format(args.k), query_filename],
-                             stdout=subprocess.PIPE)
-        with SaveFileLineIndicator('sentences_esa', gap=1) as indicator:
-            esa_vectors = _get_esa_vectors(p.stdout, 'ENWIKI_')
-            vid, vector = next(esa_vectors, (None, None))
-            for docno, id_, qid, _ in model.load_representation('sentences_term'):
-                this_vid = '{}:{}:{}'.format(qid, docno, id_)
-                if this_vid == vid:
-                    out.write(docno + '\t' + id_ + '\t' + qid + '\t' +
-                              ' '.join(['{}:{}'.format(k, v) for k, v in vector]) + '\n')
-                    vid, vector = next(esa_vectors, (None, None))
-                else:
-                    out.write(docno + '\t' + id_ + '\t' + qid + '\t' + '\n')
-                indicator.update()
+    model = summaryrank.get_model(args.model)
+
+    for segment in model.get_segments_to_generate('topics_term', ['topics_esa'],
+                                                  append=args.append):
+        _gen_esa_segment(model, args, segment, 'topics')
+    for segment in model.get_segments_to_generate('sentences_term', ['sentences_esa'],
+                                                  append=args.append):
+        _gen_esa_segment(model, args, segment, 'sentences')
+
+
+def _gen_esa_segment(model, args, segment, kind):
+    """ Generate a segment of the ESA representation of the topics or the sentences """
+    rows = list(model.load_segment(kind + '_term', segment))
+    if kind == 'topics':
+        keys = [(qid,) for qid, _ in rows]
+        numbers = [qid for qid, _ in rows]
+    else:
+        keys = [(docno, id_, qid) for docno, id_, qid, _ in rows]
+        numbers = ['{}:{}:{}'.format(qid, docno, id_) for docno, id_, qid, _ in rows]
+
+    with tempfile.NamedTemporaryFile(delete=False) as query_json:
+        queries = [{'number': number, 'text': row[-1]} for number, row in zip(numbers, rows)]
+        json.dump({'queries': queries}, query_json, indent=2)
+        query_filename = query_json.name
+
+    p = subprocess.Popen(['galago', 'batch-search', '--index={}'.format(args.index_path),
+                          '--requested={}'.format(args.k), query_filename],
+                         stdout=subprocess.PIPE)
+    with model.writer(kind + '_esa', segment) as out, \
+            SaveFileLineIndicator(kind + '_esa', gap=1) as indicator:
+        esa_vectors = _get_esa_vectors(p.stdout, 'ENWIKI_')
+        vid, vector = next(esa_vectors, (None, None))
+        for key, number in zip(keys, numbers):
+            if number == vid:
+                out.write_row(key + (' '.join(['{}:{}'.format(k, v) for k, v in vector]),))
+                vid, vector = next(esa_vectors, (None, None))
+            else:
+                out.write_row(key + ('',))
+            indicator.update()
 
 
 def gen_tagme(argv):
@@ -313,44 +435,102 @@ def gen_tagme(argv):
 
     parser.add_argument('-m', dest='model', metavar='DIR', required=True,
                         help='store the processed data in DIR')
-    parser.add_argument('api_key',
+    parser.add_argument('--url', metavar='URL',
+                        help='URL to the TAGME tag service (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, metavar='NUM',
+                        help='number of concurrent requests (default: %(default)s)')
+    parser.add_argument('--rate', type=float, metavar='NUM',
+                        help='maximum number of requests per second (default: unlimited)')
+    parser.add_argument('--retries', type=int, metavar='NUM',
+                        help='number of retries on failed requests (default: %(default)s)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='cache the responses in DIR, which can be shared across models '
+                             '(default: $SUMMARYRANK_TAGME_CACHE)')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='annotate all the texts again rather than only the missing ones')
+    parser.add_argument('--ids-only', action='store_true',
+                        help='only convert existing TAGME representations to entity ids')
+    parser.add_argument('--append', action='store_true',
+                        help='only process the segments missing from the representations')
+    parser.add_argument('api_key', nargs='?',
                         help='TAGME API key')
+    parser.set_defaults(url=tagme.TAGME_TAG_URL, concurrency=4, retries=3,
+                        cache=os.environ.get('SUMMARYRANK_TAGME_CACHE'))
     args = parser.parse_args(argv)
 
     if not args.model:
         parser.error('must specify the model directory')
         return 1
 
-    model = summaryrank.Model(args.model)
-
-    if not args.api_key:
-        parser.error('must specify the API key')
-        return 1
-
-    topics = model.load_representation('topics_text')
-    with model.open('topics_tagme', 'wb') as out:
-        with SaveFileLineIndicator('topics_tagme', gap=1) as indicator:
-            for qid, text in topics:
-                rep = ''
-                try:
-                    res = tagme.tag(text, args.api_key)
-                    rep = res.read()
-                except Exception as e:
-                    print >>sys.stderr, qid, e
-                out.write(qid + '\t' + rep + '\n')
+    model = summaryrank.get_model(args.model)
+
+    if not args.ids_only:
+        if not args.api_key:
+            parser.error('must specify the API key')
+            return 1
+        cache = tagme.AnnotationCache(args.cache) if args.cache else None
+        client = tagme.Client(args.api_key, url=args.url, concurrency=args.concurrency,
+                              rate=args.rate, retries=args.retries, cache=cache)
+        _tag_representations(model, client, resume=not args.overwrite, append=args.append)
+
+    _convert_to_entity_ids(model, append=args.append)
+
+
+def _load_responses(model, name, maxsplit, segment):
+    """ Return the non-empty TAGME responses saved in a segment of the model """
+    if segment not in model.get_segments(name):
+        return dict()
+    return dict((tuple(row[:-1]), row[-1])
+                for row in model.load_segment(name, segment, maxsplit) if row[-1])
+
+
+def _tag_representations(model, client, resume=True, append=False):
+    """ Annotate topics and sentences with TAGME, filling only missing responses """
+    for name, repr_name, maxsplit in (('topics_text', 'topics_tagme', 1),
+                                      ('sentences_text', 'sentences_tagme', 3)):
+        for segment in model.get_segments_to_generate(name, [repr_name], append=append):
+            previous = _load_responses(model, repr_name, maxsplit, segment) if resume else dict()
+            rows = list(model.load_segment(name, segment, maxsplit))
+            responses = client.tag_many(row[-1] for row in rows
+                                        if tuple(row[:-1]) not in previous)
+
+            with model.writer(repr_name, segment) as out, \
+                    SaveFileLineIndicator(repr_name, gap=1) as indicator:
+                for row in rows:
+                    key = tuple(row[:-1])
+                    rep = previous.get(key)
+                    if rep is None:
+                        rep, error = next(responses)
+                        if error is not None:
+                            print >>sys.stderr, key, error
+                    out.write_row(key + (rep or '',))
+                    indicator.update()
+
+
+def _convert_to_entity_ids(model, append=False):
+    """ Convert TAGME representations to sorted entity ids
+
+    All the entities are kept, so that TagmeOverlap computes the same values
+    over the ids as over the TAGME responses.
+    """
+    for segment in model.get_segments_to_generate('topics_tagme', ['topics_tagme_ids'],
+                                                  append=append):
+        topics = model.load_segment('topics_tagme', segment, 1)
+        with model.writer('topics_tagme_ids', segment) as out, \
+                SaveFileLineIndicator('topics_tagme_ids') as indicator:
+            for qid, rep in topics:
+                ids = tagme.get_entity_ids(rep)
+                out.write_row((qid, ' '.join(map(str, ids))))
                 indicator.update()
 
-    sentences = model.load_representation('sentences_text')
-    with model.open('sentences_tagme', 'wb') as out:
-        with SaveFileLineIndicator('sentences_tagme', gap=1) as indicator:
-            for docno, id_, qid, text in sentences:
-                rep = ''
-                try:
-                    res = tagme.tag(text, args.api_key)
-                    rep = res.read()
-                except Exception as e:
-                    print >>sys.stderr, (docno, id_, qid), e
-                out.write('\t'.join([docno, id_, qid, rep]) + '\n')
+    for segment in model.get_segments_to_generate('sentences_tagme', ['sentences_tagme_ids'],
+                                                  append=append):
+        sentences = model.load_segment('sentences_tagme', segment, 3)
+        with model.writer('sentences_tagme_ids', segment) as out, \
+                SaveFileLineIndicator('sentences_tagme_ids') as indicator:
+            for docno, id_, qid, rep in sentences:
+                ids = tagme.get_entity_ids(rep)
+                out.write_row((docno, id_, qid, ' '.join(map(str, ids))))
                 indicator.update()
 
 
@@ -0,0 +1,371 @@
+"""
+Qid-sharded models
+
+A model can be split by qid into a number of shards, each a self-contained
+model directory, so that features can be extracted on several processes or
+machines.  The shards go into a directory along with a spec (shards.json):
+
+    SHARDS/shards.json
+    SHARDS/shard-000/...
+    SHARDS/shard-001/...
+
+The per-shard outputs are then merged back into one vector file, in the order
+that the original model would have produced.
+"""
+import argparse
+import binascii
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import summaryrank
+from summaryrank import binvec, svmlight_tools
+from summaryrank.util import SaveFileLineIndicator, unique
+
+
+SPEC = 'shards.json'
+BALANCE_METHODS = ('hash', 'size')
+HEARTBEAT_INTERVAL = 30
+
+
+def assign_shards(qids, n, sizes=None):
+    """ Return a dict of shard numbers keyed by qid
+
+    Qids are hashed into shards, or, if the sizes (numbers of sentences) are
+    given, assigned greedily to the least loaded shard, largest first.
+    """
+    if sizes is None:
+        return dict((qid, int(hashlib.md5(qid).hexdigest(), 16) % n) for qid in qids)
+
+    loads = [(0, i) for i in range(n)]
+    assignment = dict()
+    order = dict((qid, i) for i, qid in enumerate(qids))
+    for qid in sorted(qids, key=lambda qid: (-sizes.get(qid, 0), order[qid])):
+        load, i = heapq.heappop(loads)
+        assignment[qid] = i
+        heapq.heappush(loads, (load + sizes.get(qid, 0), i))
+    return assignment
+
+
+def get_shard_name(i):
+    """ Return the directory name of a shard """
+    return 'shard-{:03d}'.format(i)
+
+
+def load_spec(shard_dir):
+    """ Load the spec of a shard directory """
+    with open(os.path.join(shard_dir, SPEC)) as in_:
+        return json.load(in_)
+
+
+def shard(argv):
+    """ Split a model into qid shards """
+    parser = argparse.ArgumentParser(prog='shard')
+    parser.add_argument('-m', dest='model', metavar='DIR', required=True,
+                        help='the model to split')
+    parser.add_argument('-n', dest='shards', metavar='N', type=int, required=True,
+                        help='number of shards')
+    parser.add_argument('--balance', choices=BALANCE_METHODS, default='size',
+                        help='assign qids by hash, or balance the number of sentences '
+                        '(default: %(default)s)')
+    parser.add_argument('shard_dir',
+                        help='directory to store the shards in')
+    args = parser.parse_args(argv)
+
+    if args.shards < 1:
+        parser.error('the number of shards must be positive')
+    if os.path.exists(os.path.join(args.shard_dir, SPEC)):
+        print >>sys.stderr, 'shards already exist in {}'.format(args.shard_dir)
+        return 1
+
+    model = summaryrank.get_model(args.model)
+    qids = unique(qid for qid, _ in model.load_representation('topics_text', 1))
+    sizes = dict()
+    for row in model.load_representation('qrels', 3):
+        sizes[row[2]] = sizes.get(row[2], 0) + 1
+    assignment = assign_shards(qids, args.shards,
+                               sizes=sizes if args.balance == 'size' else None)
+
+    if not os.path.isdir(args.shard_dir):
+        os.makedirs(args.shard_dir)
+    shards = [summaryrank.get_model(os.path.join(args.shard_dir, get_shard_name(i)),
+                                    model.BACKEND)
+              for i in range(args.shards)]
+    for shard_model in shards:
+        shard_model.set_codec(model.codec)
+        shard_model.save_backend()
+
+    for name in model.list_representations():
+        column = summaryrank.base.get_key_columns(name).get('qid')
+        if column is None and model.get_files(name):
+            # shared files, such as term statistics, go into every shard
+            for shard_model in shards:
+                for path in model.get_files(name):
+                    shutil.copy(path, shard_model.path)
+            continue
+
+        writers = [shard_model.writer(name) for shard_model in shards]
+        try:
+            with SaveFileLineIndicator(name) as indicator:
+                for row in model.load_representation(name, -1 if column is None else column + 1):
+                    if column is None:
+                        for writer in writers:
+                            writer.write_row(row)
+                    elif row[column] in assignment:
+                        writers[assignment[row[column]]].write_row(row)
+                    indicator.update()
+        except BaseException:
+            # leave no partial representations that look complete
+            for writer in writers:
+                writer.discard()
+            raise
+        for writer in writers:
+            writer.close()
+
+    spec = {
+        'model': os.path.abspath(args.model),
+        'balance': args.balance,
+        'shards': [{'name': get_shard_name(i),
+                    'qids': [qid for qid in qids if assignment[qid] == i],
+                    'sentences': sum(sizes.get(qid, 0) for qid in qids if assignment[qid] == i)}
+                   for i in range(args.shards)],
+    }
+    with open(os.path.join(args.shard_dir, SPEC), 'w') as out:
+        json.dump(spec, out, indent=2)
+
+
+def _get_positions(model):
+    """ Return the positions of the (qid, 'DOCNO:ID') sentences in the model order """
+    return dict(((qrel['qid'], '{}:{}'.format(qrel['docno'], qrel['id'])), i)
+                for i, qrel in enumerate(model.load_qrels()))
+
+
+def _get_text_rows(filename, positions):
+    """ Generate the (position, line) pairs of the rows in a text vector file """
+    rows = svmlight_tools.get_rows(svmlight_tools._open(filename))
+    for line in rows:
+        qid = svmlight_tools._get_between_text(line, 'qid:', ' ')
+        docno = line.rsplit('# docno:', 1)[-1].strip()
+        try:
+            yield positions[(qid, docno)], line
+        except KeyError:
+            raise ValueError('{}: row not in the model: qid {} docno {}'.format(
+                filename, qid, docno))
+
+
+def _merge_text(filenames, positions, output):
+    """ Merge the rows of text vector files (each in model order) in one streaming pass """
+    preambles = [next(svmlight_tools.get_rows(svmlight_tools._open(filename),
+                                              with_preamble=True))
+                 for filename in filenames]
+    if any(preamble != preambles[0] for preamble in preambles):
+        raise ValueError('the vector files do not have the same features')
+
+    out = svmlight_tools.open_output(output)
+    out.writelines(preambles[0])
+    for _, line in heapq.merge(*[_get_text_rows(filename, positions)
+                                 for filename in filenames]):
+        out.write(line)
+    if out is not sys.stdout:
+        out.close()
+
+
+def _merge_arrays(filenames, positions, output):
+    """ Merge vector files of either format in memory """
+    loaded = [svmlight_tools.load_arrays(filename) for filename in filenames]
+    if any(names != loaded[0][0] for names, _ in loaded):
+        raise ValueError('the vector files do not have the same features')
+
+    arrays = svmlight_tools.concatenate_arrays([arrays for _, arrays in loaded])
+    try:
+        order = np.argsort([positions[(str(qid), str(docno))]
+                            for qid, docno in zip(arrays.qids, arrays.docnos)], kind='mergesort')
+    except KeyError as e:
+        raise ValueError('row not in the model: {}'.format(e))
+    svmlight_tools.write_arrays(output, loaded[0][0],
+                                svmlight_tools.take_arrays(arrays, order))
+
+
+def merge(argv):
+    """ Merge per-shard vector files """
+    parser = argparse.ArgumentParser(
+        prog='merge',
+        description='Merge the vector files FILE (relative to each shard directory) '
+        'into one, in the order of the original model.')
+    parser.add_argument('-o', dest='output', metavar='FILE',
+                        help='write the output to FILE (binary if FILE ends with .bvec)')
+    parser.add_argument('shard_dir',
+                        help='directory of the shards')
+    parser.add_argument('vector_file', metavar='FILE',
+                        help='vector file in each shard directory')
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.shard_dir)
+    filenames = [os.path.join(args.shard_dir, entry['name'], args.vector_file)
+                 for entry in spec['shards']]
+    missing = [filename for filename in filenames if not os.path.isfile(filename)]
+    if missing:
+        print >>sys.stderr, 'missing vector files: {}'.format(' '.join(missing))
+        return 1
+
+    positions = _get_positions(summaryrank.get_model(spec['model']))
+    try:
+        if binvec.is_binary_name(args.output) or any(binvec.is_binary(f) for f in filenames):
+            _merge_arrays(filenames, positions, args.output)
+        else:
+            _merge_text(filenames, positions, args.output)
+    except ValueError as e:
+        print >>sys.stderr, 'error: {}'.format(e)
+        return 1
+
+
+def _get_task_id(command):
+    return hashlib.sha1(json.dumps(command)).hexdigest()[:12]
+
+
+def _create_lock(path):
+    """ Create a lock file unless it exists; return true on success """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError:
+        return False
+    with os.fdopen(fd, 'w') as out:
+        print >>out, '{}\t{}\t{}\t{}'.format(socket.gethostname(), os.getpid(), time.time(),
+                                           binascii.hexlify(os.urandom(8)))
+    return True
+
+
+def _read_lock(path):
+    try:
+        with open(path) as in_:
+            return in_.read()
+    except IOError:
+        return None
+
+
+def claim(path, stale=None):
+    """ Try to claim a task by creating its lock file; return true on success
+
+    A lock file not touched for stale seconds is taken as left by a dead
+    worker, and taken over: it is first renamed aside, so that only one
+    worker gets it, and put back if it turns out to have been refreshed or
+    replaced in the meantime.
+    """
+    if _create_lock(path):
+        return True
+    if stale is None:
+        return False
+
+    content = _read_lock(path)
+    try:
+        if content is None or time.time() - os.path.getmtime(path) <= stale:
+            return False
+        aside = '{}.{}-{}'.format(path, socket.gethostname(), binascii.hexlify(os.urandom(8)))
+        os.rename(path, aside)
+    except OSError:
+        return False
+
+    if _read_lock(aside) != content or time.time() - os.path.getmtime(aside) <= stale:
+        # not the stale lock we saw; put it back unless the task is claimed again
+        try:
+            os.link(aside, path)
+        except OSError:
+            pass
+        os.remove(aside)
+        return False
+    os.remove(aside)
+    return _create_lock(path)
+
+
+def _heartbeat(path, interval, stopped):
+    """ Touch a lock file every interval seconds until stopped """
+    while not stopped.wait(interval):
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+
+def work(argv):
+    """ Run a command on the shards not yet done by other workers """
+    parser = argparse.ArgumentParser(
+        prog='work',
+        description='Run a SummaryRank command (with -m SHARD) on every shard that is not '
+        'done or claimed by another worker yet.  Workers may run concurrently on a '
+        'shared filesystem: a shard is claimed by a lock file, and marked with a '
+        'done file on success.  In the arguments, {shard} is replaced with the shard '
+        'directory.',
+        usage='%(prog)s [options] shard_dir command [args..]')
+    parser.add_argument('-j', dest='processes', metavar='N', type=int, default=1,
+                        help='run the command on up to N shards at a time (default: %(default)s)')
+    parser.add_argument('--stale', metavar='SECONDS', type=float,
+                        help='take over locks not refreshed for SECONDS (left by dead '
+                        'workers, as running ones keep refreshing theirs)')
+    parser.add_argument('shard_dir',
+                        help='directory of the shards')
+    parser.add_argument('command', nargs=argparse.REMAINDER,
+                        help='command and arguments')
+    args = parser.parse_args(argv)
+
+    if not args.command:
+        parser.error('must specify the command')
+
+    spec = load_spec(args.shard_dir)
+    task_id = _get_task_id(args.command)
+    path = os.path.dirname(os.path.dirname(os.path.abspath(summaryrank.__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([path] + filter(None, [env.get('PYTHONPATH')]))
+
+    interval = HEARTBEAT_INTERVAL if args.stale is None else \
+        min(HEARTBEAT_INTERVAL, args.stale / 4.0)
+    shard_dirs = [os.path.join(args.shard_dir, entry['name']) for entry in spec['shards']]
+    failed = []
+    lock = threading.Lock()
+
+    def _work():
+        for shard_dir in shard_dirs:
+            done_path = os.path.join(shard_dir, '.work-{}.done'.format(task_id))
+            lock_path = os.path.join(shard_dir, '.work-{}.lock'.format(task_id))
+            if os.path.exists(done_path) or not claim(lock_path, stale=args.stale):
+                continue
+
+            command = [arg.replace('{shard}', shard_dir) for arg in args.command]
+            print >>sys.stderr, '[{}] {}'.format(shard_dir, ' '.join(command))
+            # keep the lock fresh while the command runs
+            stopped = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat,
+                                         args=(lock_path, interval, stopped))
+            heartbeat.daemon = True
+            heartbeat.start()
+            try:
+                returncode = subprocess.call(
+                    [sys.executable, '-m', 'summaryrank', command[0], '-m', shard_dir] +
+                    command[1:], env=env)
+            finally:
+                stopped.set()
+                heartbeat.join()
+            if returncode == 0:
+                open(done_path, 'w').close()
+            else:
+                with lock:
+                    failed.append(shard_dir)
+            os.remove(lock_path)
+
+    threads = [threading.Thread(target=_work) for _ in range(max(1, args.processes))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if failed:
+        print >>sys.stderr, 'failed on: {}'.format(' '.join(failed))
+        return 1
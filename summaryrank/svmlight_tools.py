@@ -3,14 +3,29 @@ SVMLight tools
 """
 import sys
 import argparse
-import gzip
+import collections
+import contextlib
+import functools
+import itertools
 import math
+import multiprocessing
 import numpy as np
+import os
 import random
 import re
+import shutil
+import tempfile
+
+from multiprocessing.pool import ThreadPool
+
+from summaryrank import binvec, bgzf, compression
+from summaryrank.util import unique, prefetch, BackgroundWriter
 
 PROG = 'python svmlight_format.py'
 ID_NAME_PATTERN = re.compile(r'^#\s*(\d+)\s*:\s*(\S+.*)\s*$')
+BLOCKSIZE = 16 * 1024 * 1024
+
+VectorArrays = collections.namedtuple('VectorArrays', ['matrix', 'qids', 'rels', 'docnos'])
 
 
 class AutoHelpArgumentParser(argparse.ArgumentParser):
@@ -22,10 +37,28 @@ class AutoHelpArgumentParser(argparse.ArgumentParser):
 
 
 def _open(filename):
-    if filename.endswith('.gz'):
-        return gzip.open(filename)
+    return compression.open(filename)
+
+
+def open_output(filename):
+    """ Return an output stream for text vectors (stdout if no file name is given).
+
+    Gzip output is written as BGZF, compressed on background threads.
+    """
+    if filename is None or filename == '-':
+        return sys.stdout
+    elif filename.endswith('.gz'):
+        return BackgroundWriter(bgzf.open(filename, 'wb'))
     else:
-        return file(filename)
+        return file(filename, 'w')
+
+
+def close_output(out):
+    """ Close an output stream from open_output (only flushing stdout) """
+    if out is sys.stdout:
+        out.flush()
+    else:
+        out.close()
 
 
 def _get_between_text(s, head, tail):
@@ -91,6 +124,411 @@ def get_vectors(lines):
         yield vector, {'rel': rel, 'qid': qid, 'docno': docno}
 
 
+def get_line_blocks(iterable, blocksize=BLOCKSIZE):
+    """ Generate lists of lines (without line breaks) read in large blocks. """
+    if not hasattr(iterable, 'read'):
+        lines = (line.rstrip('\n') for line in iterable)
+        while True:
+            block = list(itertools.islice(lines, max(1, blocksize / 128)))
+            if not block:
+                break
+            yield block
+        return
+
+    remainder = ''
+    while True:
+        data = iterable.read(blocksize)
+        if not data:
+            break
+        end = data.rfind('\n')
+        if end < 0:
+            remainder += data
+            continue
+        block = (remainder + data[:end]).split('\n')
+        remainder = data[end + 1:]
+        yield block
+    if remainder:
+        yield [remainder]
+
+
+def get_preamble_and_blocks(iterable, blocksize=BLOCKSIZE):
+    """ Return the preamble and a sequence of lists of vector lines. """
+    blocks = get_line_blocks(iterable, blocksize)
+    preamble = []
+    first_block = []
+    for block in blocks:
+        i = 0
+        while i < len(block) and block[i].startswith('#'):
+            i += 1
+        preamble.extend(line + '\n' for line in block[:i])
+        if i < len(block):
+            first_block = block[i:]
+            break
+
+    def _get_blocks():
+        if first_block:
+            yield first_block
+        for block in blocks:
+            yield block
+
+    return preamble, _get_blocks()
+
+
+def parse_arrays(lines, nfeatures=None, dtype=np.float64, sparse=False):
+    """ Parse a list of vector lines in bulk.
+
+    Return a VectorArrays tuple, in which the matrix is a dense 2-D array, or
+    a CSR triple (data, indices, indptr) with 0-based feature indices when
+    sparse is True.
+    """
+    qids, rels, docnos, bodies, vector_lines = [], [], [], [], []
+    for line in lines:
+        body, _, comment = line.partition('#')
+        fields = body.split(None, 2)
+        if not fields:
+            continue
+        rels.append(fields[0])
+        qids.append(fields[1][4:])
+        docnos.append(comment.split(None, 1)[0].split(':', 1)[1])
+        bodies.append(fields[2] if len(fields) > 2 else '')
+        vector_lines.append(line)
+
+    counts = np.array([body.count(':') for body in bodies], dtype=np.int64)
+    values = np.fromstring(' '.join(bodies).replace(':', ' '), dtype=np.float64, sep=' ')
+    if len(values) != 2 * counts.sum():
+        # fromstring stops at the first malformed token; find its line
+        for line, body, count in zip(vector_lines, bodies, counts):
+            if len(np.fromstring(body.replace(':', ' '), dtype=np.float64, sep=' ')) != \
+                    2 * count or body.count(':') != len(body.split()):
+                raise ValueError('malformed vector line: {!r}'.format(line.rstrip('\n')))
+        raise ValueError('malformed vector lines')
+    indices = values[0::2].astype(np.int64) - 1
+    data = values[1::2].astype(dtype)
+
+    if sparse:
+        indptr = np.zeros(len(bodies) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        matrix = (data, indices, indptr)
+    else:
+        if nfeatures is None:
+            nfeatures = indices.max() + 1 if len(indices) else 0
+        matrix = np.zeros((len(bodies), nfeatures), dtype=dtype)
+        matrix[np.repeat(np.arange(len(bodies)), counts), indices] = data
+
+    return VectorArrays(matrix, np.array(qids), np.array(rels, dtype=np.int64),
+                        np.array(docnos))
+
+
+def get_array_chunks(blocks, nfeatures=None, dtype=np.float64, sparse=False, processes=1):
+    """ Return a sequence of VectorArrays, one per block of vector lines.
+
+    With `processes` greater than 1, blocks are parsed in worker processes
+    and the chunks are returned in the input order.
+    """
+    parse = functools.partial(parse_arrays, nfeatures=nfeatures, dtype=dtype, sparse=sparse)
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        chunks = pool.imap(parse, blocks) if pool else itertools.imap(parse, blocks)
+        for chunk in chunks:
+            if len(chunk.qids) > 0:
+                yield chunk
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def get_text_features(filename):
+    """ Return the (fid, name) pairs of the features of a text vector file.
+
+    These are the features listed in the preamble, or, for a file without
+    one, all the fids used in the data (named Unknown), found in an extra pass.
+    """
+    preamble, blocks = get_preamble_and_blocks(_open(filename))
+    features = list(get_preamble_features(preamble))
+    if features:
+        return features
+    nfeatures = 0
+    for chunk in get_array_chunks(blocks, sparse=True):
+        indices = chunk.matrix[1]
+        if len(indices):
+            nfeatures = max(nfeatures, indices.max() + 1)
+    return [(fid, 'Unknown') for fid in range(1, nfeatures + 1)]
+
+
+def concatenate_arrays(chunks, sparse=False):
+    """ Concatenate a list of VectorArrays into one. """
+    if sparse:
+        offsets = np.cumsum([0] + [len(c.matrix[0]) for c in chunks])
+        matrix = (np.concatenate([c.matrix[0] for c in chunks]),
+                  np.concatenate([c.matrix[1] for c in chunks]),
+                  np.concatenate([chunks[0].matrix[2][:1]] +
+                                 [c.matrix[2][1:] + offset for c, offset in zip(chunks, offsets)]))
+    else:
+        matrix = np.vstack([c.matrix for c in chunks])
+    return VectorArrays(matrix,
+                        np.concatenate([c.qids for c in chunks]),
+                        np.concatenate([c.rels for c in chunks]),
+                        np.concatenate([c.docnos for c in chunks]))
+
+
+def read_arrays(iterable, dtype=np.float64, sparse=False, processes=1):
+    """ Return feature descriptions and all the vectors as VectorArrays. """
+    preamble, blocks = get_preamble_and_blocks(iterable)
+    features = dict(get_preamble_features(preamble))
+    nfeatures = max(features) if features else 0
+    chunks = list(get_array_chunks(blocks, nfeatures=nfeatures, dtype=dtype,
+                                   sparse=sparse, processes=processes))
+    if not chunks:
+        chunks = [parse_arrays([], nfeatures=nfeatures, dtype=dtype, sparse=sparse)]
+    return features, concatenate_arrays(chunks, sparse=sparse)
+
+
+def load_arrays(filename, declared_only=False):
+    """ Return feature names and VectorArrays from a vector file of either format.
+
+    With declared_only, the columns of a text file not listed in its preamble
+    (e.g. fids 1 and 2 of a file cut down to fids 3 and 4) are dropped.
+    """
+    if binvec.is_binary(filename):
+        vector_file = binvec.VectorFile(filename)
+        return vector_file.features, VectorArrays(
+            vector_file.matrix, vector_file.qids, vector_file.rels, vector_file.docnos)
+
+    features, arrays = read_arrays(_open(filename))
+    if declared_only and features:
+        fids = sorted(features)
+        names = [features[fid] for fid in fids]
+        return names, arrays._replace(matrix=arrays.matrix[:, [fid - 1 for fid in fids]])
+
+    names = [features.get(fid, 'Unknown') for fid in range(1, arrays.matrix.shape[1] + 1)]
+    return names, arrays
+
+
+def take_arrays(arrays, index):
+    """ Return a subset of rows from VectorArrays. """
+    return VectorArrays(arrays.matrix[index], arrays.qids[index],
+                        arrays.rels[index], arrays.docnos[index])
+
+
+def get_qid_ranges(qids):
+    """ Return a list of (qid, begin, end) for the runs of identical qids. """
+    if len(qids) == 0:
+        return []
+    bounds = [0] + list(np.nonzero(qids[1:] != qids[:-1])[0] + 1) + [len(qids)]
+    return [(qids[b], b, e) for b, e in zip(bounds[:-1], bounds[1:])]
+
+
+class ArrayWriter(object):
+    """ A writer of VectorArrays chunks into a vector file of either format
+
+    The output is binary if the file name ends with '.bvec', and SVMLight
+    text otherwise (or on stdout if no file name is given).  Feature IDs can
+    be customized for text output; binary output is always numbered from 1.
+    """
+
+    def __init__(self, filename, features, fids=None, dtype=np.float64,
+                 sparse=False, precision=None):
+        self.fids = fids or range(1, len(features) + 1)
+        self.sparse = sparse
+        self.precision = precision
+        if binvec.is_binary_name(filename):
+            self._writer = binvec.Writer(filename, features, dtype=dtype)
+            self._out = None
+        else:
+            self._writer = None
+            self._out = open_output(filename)
+            print >>self._out, '# Features in use'
+            for fid, name in zip(self.fids, features):
+                print >>self._out, '# {}: {}'.format(fid, name)
+
+    def write(self, arrays):
+        """ Write a chunk of rows """
+        if self._writer:
+            self._writer.write(arrays.matrix, arrays.qids, arrays.rels, arrays.docnos)
+            return
+        for i in range(0, len(arrays.qids), 10000):
+            chunk = take_arrays(arrays, slice(i, i + 10000))
+            write_vectors_columnwise(self._out, chunk.qids, chunk.rels, chunk.docnos,
+                                     chunk.matrix.T.tolist(), fids=self.fids,
+                                     sparse=self.sparse, precision=self.precision)
+
+    def close(self):
+        """ Close the output """
+        if self._writer:
+            self._writer.close()
+        elif self._out is not sys.stdout:
+            self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+
+def write_arrays(filename, features, arrays, fids=None, dtype=np.float64):
+    """ Write feature names and VectorArrays into a vector file of either format. """
+    with ArrayWriter(filename, features, fids=fids, dtype=dtype) as writer:
+        writer.write(arrays)
+
+
+class VectorIndex(object):
+    """ A qid index of byte ranges over an (uncompressed) SVMLight file """
+
+    HEADER = '# summaryrank-index 1'
+
+    def __init__(self, size, mtime, data_offset, ranges):
+        self.size = size
+        self.mtime = mtime
+        self.data_offset = data_offset
+        self.ranges = ranges
+
+    @property
+    def qids(self):
+        """ Return the qids in order of appearance """
+        return unique(qid for qid, _, _ in self.ranges)
+
+    def get_ranges(self, qids):
+        """ Return the (offset, length) ranges of the given qids in file order """
+        selected = set(qids)
+        return [(offset, length) for qid, offset, length in self.ranges if qid in selected]
+
+    def get_ranges_by_qid(self):
+        """ Return a dict of the (offset, length) ranges in file order keyed by qid """
+        ranges = dict()
+        for qid, offset, length in self.ranges:
+            ranges.setdefault(qid, []).append((offset, length))
+        return ranges
+
+    def is_valid_for(self, filename):
+        """ Return true if the index is up to date with the file """
+        stat = os.stat(filename)
+        return self.size == stat.st_size and self.mtime == stat.st_mtime
+
+    def save(self, path):
+        """ Save the index """
+        with file(path, 'w') as out:
+            print >>out, '{}\t{}\t{!r}\t{}'.format(
+                self.HEADER, self.size, self.mtime, self.data_offset)
+            for qid, offset, length in self.ranges:
+                print >>out, '{}\t{}\t{}'.format(qid, offset, length)
+
+    @classmethod
+    def load(cls, path):
+        """ Load a saved index """
+        with file(path) as in_:
+            header, size, mtime, data_offset = next(in_).rstrip('\n').split('\t')
+            if header != cls.HEADER:
+                raise ValueError('not an index file: {}'.format(path))
+            ranges = []
+            for line in in_:
+                qid, offset, length = line.rstrip('\n').split('\t')
+                ranges.append((qid, int(offset), int(length)))
+        return cls(int(size), float(mtime), int(data_offset), ranges)
+
+    @classmethod
+    def build(cls, filename):
+        """ Build the index in one streaming pass """
+        stat = os.stat(filename)
+        data_offset = None
+        ranges = []
+        offset = 0
+        with _open(filename) as in_:
+            for block in get_line_blocks(in_):
+                for line in block:
+                    length = len(line) + 1
+                    if data_offset is None:
+                        if line.startswith('#'):
+                            offset += length
+                            continue
+                        data_offset = offset
+                    if line:
+                        qid = _get_between_text(line, 'qid:', ' ')
+                        if ranges and ranges[-1][0] == qid:
+                            ranges[-1][2] += length
+                        else:
+                            ranges.append([qid, offset, length])
+                    offset += length
+            size = in_.tell()
+
+        # the last line may come without a line break
+        if ranges and ranges[-1][1] + ranges[-1][2] > size:
+            ranges[-1][2] = size - ranges[-1][1]
+        if data_offset is None:
+            data_offset = min(offset, size)
+        return cls(stat.st_size, stat.st_mtime, data_offset,
+                   [tuple(r) for r in ranges])
+
+
+def is_plain(filename):
+    """ Return true if the file is an uncompressed SVMLight file """
+    return filename != '-' and os.path.isfile(filename) and \
+        not filename.endswith(('.gz', '.bz2')) and not binvec.is_binary(filename)
+
+
+def is_indexable(filename):
+    """ Return true if the file supports random access through an index
+
+    Besides uncompressed files, these are BGZF files, which are read through
+    their block index.
+    """
+    if filename.endswith('.gz'):
+        return os.path.isfile(filename) and bgzf.is_bgzf(filename)
+    return is_plain(filename)
+
+
+def get_index(filename, save=True):
+    """ Return the up-to-date index of the vector file, building it if necessary """
+    path = filename + '.idx'
+    if os.path.isfile(path):
+        index = VectorIndex.load(path)
+        if index.is_valid_for(filename):
+            return index
+    index = VectorIndex.build(filename)
+    if save:
+        try:
+            index.save(path)
+        except IOError:
+            pass
+    return index
+
+
+@contextlib.contextmanager
+def spooled(filename):
+    """ Provide the name of an uncompressed copy of the vector file
+
+    The file itself is used if it is indexable; otherwise it is decompressed
+    into a temporary file, which is removed afterwards.
+    """
+    if is_indexable(filename):
+        yield filename
+        return
+
+    fd, path = tempfile.mkstemp(prefix='summaryrank-', suffix='.txt')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(_open(filename), out, BLOCKSIZE)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def copy_ranges(in_, out, ranges, bufsize=1024 * 1024):
+    """ Copy byte ranges of whole lines from a seekable input to the output """
+    for offset, length in ranges:
+        in_.seek(offset)
+        data = ''
+        while length > 0:
+            data = in_.read(min(bufsize, length))
+            if not data:
+                break
+            out.write(data)
+            length -= len(data)
+        # the last line of the file may come without a line break
+        if data and not data.endswith('\n'):
+            out.write('\n')
+
+
 def write_preamble(out, features):
     """ Print preamble """
     print >>out, '# Features in use'
@@ -98,16 +536,67 @@ def write_preamble(out, features):
         print >>out, '# {}: {}'.format(fid, cls)
 
 
-def write_vectors_columnwise(out, qids, rels, docnos, columns):
-    """ Print feature vectors, assuming columnwise input """
+def _get_row_template(fids, sparse=False, precision=None):
+    """ Return a %-template of the features of a row (or of one feature if sparse) """
+    value = '%.{}g'.format(precision) if precision is not None else '%s'
+    if sparse:
+        return '%d:' + value
+    return ' '.join('{}:{}'.format(fid, value) for fid in fids)
+
+
+def write_vectors_columnwise(out, qids, rels, docnos, columns, fids=None,
+                             sparse=False, precision=None, bufsize=10000):
+    """ Print feature vectors, assuming columnwise input
+
+    With sparse, zero-valued features are left out; with precision, values
+    are written with that many significant digits.
+    """
     nrows = len(qids)
     assert nrows == len(rels) == len(docnos)
     assert all([len(column) == nrows for column in columns])
+    fids = fids or range(1, len(columns) + 1)
+    columns = [column.tolist() if isinstance(column, np.ndarray) else column
+               for column in columns]
+    template = _get_row_template(fids, sparse=sparse, precision=precision)
+
+    for begin in range(0, nrows, bufsize):
+        end = min(begin + bufsize, nrows)
+        rows = zip(*[column[begin:end] for column in columns]) if columns \
+            else [()] * (end - begin)
+        if sparse:
+            bodies = [' '.join([template % pair for pair in zip(fids, row) if pair[1] != 0])
+                      for row in rows]
+        else:
+            bodies = [template % row for row in rows]
+        lines = ['%s qid:%s %s # docno:%s' % head_body for head_body in
+                 zip(rels[begin:end], qids[begin:end], bodies, docnos[begin:end])]
+        out.write('\n'.join(lines) + '\n')
+
+
+def add_text_output_arguments(parser):
+    """ Add the --sparse and --precision options of text output to the parser """
+    parser.add_argument('--sparse', action='store_true',
+                        help='leave out zero-valued features in text output')
+    parser.add_argument('--precision', metavar='N', type=int,
+                        help='write values with N significant digits in text output')
+
+
+def _parse_fields(fields):
+    """ Return a set of field numbers given in the form 1,3-5 """
+    selector = set()
+    for comp in fields.split(','):
+        if comp.find('-') >= 0:
+            l, u = map(int, comp.split('-'))
+            selector.update(range(l, u + 1))
+        else:
+            selector.add(int(comp))
+    return selector
+
 
-    for i in range(nrows):
-        row_values = [column[i] for column in columns]
-        row = ' '.join(['{}:{}'.format(fid, val) for fid, val in enumerate(row_values, 1)])
-        print >>out, '{} qid:{} {} # docno:{}'.format(rels[i], qids[i], row, docnos[i])
+def _uses_arrays(args, input_names):
+    """ Return true if the binary code path is called for """
+    return binvec.is_binary_name(getattr(args, 'output', None)) or \
+        any(binvec.is_binary(name) for name in input_names)
 
 
 def describe(argv):
@@ -117,12 +606,90 @@ def describe(argv):
                         help='the input vector file')
     args = parser.parse_args(argv)
 
+    if binvec.is_binary(args.vector_file):
+        features = binvec.VectorFile(args.vector_file).features
+        write_preamble(sys.stdout, features)
+        return
+
     rows = get_rows(_open(args.vector_file), with_preamble=True)
     preamble = next(rows)
     for line in preamble:
         print line,
 
 
+class _RangeReader(object):
+    """ A file-like reader limited to a byte range of a seekable file """
+    def __init__(self, in_, offset, length):
+        in_.seek(offset)
+        self.in_ = in_
+        self.remaining = length
+
+    def read(self, size):
+        data = self.in_.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+
+def get_line_ranges(filename, offset, parts):
+    """ Split the file from offset into about parts (offset, length) ranges of whole lines """
+    size = os.path.getsize(filename)
+    bounds = [offset]
+    with file(filename, 'rb') as in_:
+        for i in range(1, parts):
+            in_.seek(max(bounds[-1], offset + (size - offset) * i / parts))
+            in_.readline()
+            if in_.tell() < size:
+                bounds.append(in_.tell())
+    bounds.append(size)
+    return [(b, e - b) for b, e in zip(bounds[:-1], bounds[1:]) if e > b]
+
+
+def _write_block(out, lines):
+    """ Write a list of lines in one go """
+    if lines:
+        out.write('\n'.join(lines) + '\n')
+
+
+def _cut_line(line, trans):
+    """ Keep the selected raw fid:value tokens of a vector line, renumbered by trans """
+    body, _, comment = line.partition('#')
+    fields = body.split()
+    parts = fields[:2]
+    for token in fields[2:]:
+        fid, _, val = token.partition(':')
+        if fid in trans:
+            parts.append(trans[fid] + ':' + val)
+    return ' '.join(parts) + ' #' + comment
+
+
+def _cut_range(job):
+    """ Cut a byte range of a vector file into a temporary file """
+    filename, offset, length, trans, output = job
+    with file(filename, 'rb') as in_, file(output, 'wb') as out:
+        for block in get_line_blocks(_RangeReader(in_, offset, length)):
+            _write_block(out, [_cut_line(line, trans) for line in block if line])
+    return output
+
+
+def _cut_parallel(filename, data_offset, trans, out, processes):
+    """ Cut line-aligned parts of an uncompressed file in worker processes """
+    tmpdir = tempfile.mkdtemp(prefix='summaryrank-cut-')
+    try:
+        jobs = [(filename, offset, length, trans, os.path.join(tmpdir, '{}.txt'.format(i)))
+                for i, (offset, length) in enumerate(
+                    get_line_ranges(filename, data_offset, processes))]
+        pool = multiprocessing.Pool(processes)
+        try:
+            for output in pool.imap(_cut_range, jobs):
+                with file(output, 'rb') as in_:
+                    shutil.copyfileobj(in_, out, 1024 * 1024)
+                os.remove(output)
+        finally:
+            pool.terminate()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
 def cut(argv):
     """ Cut and print a select subset of features """
     parser = AutoHelpArgumentParser(prog='cut')
@@ -130,18 +697,15 @@ def cut(argv):
                         help='select only these fields')
     parser.add_argument('--renumbering', action='store_true',
                         help='renumber the feature IDs')
+    parser.add_argument('-j', dest='processes', metavar='N', type=int, default=1,
+                        help='cut N parts of an uncompressed input in parallel')
+    parser.add_argument('-o', dest='output', metavar='FILE',
+                        help='write the output to FILE (binary if FILE ends with .bvec)')
     parser.add_argument('vector_file',
                         help='the input vector file')
     args = parser.parse_args(argv)
 
-    selector = set()
-    if args.fields:
-        for comp in args.fields.split(','):
-            if comp.find('-') >= 0:
-                l, u = map(int, comp.split('-'))
-                selector.update(range(l, u + 1))
-            else:
-                selector.add(int(comp))
+    selector = _parse_fields(args.fields) if args.fields else set()
 
     if len(selector) == 0:
         print >>sys.stderr, 'must specify a list of fields'
@@ -152,31 +716,106 @@ def cut(argv):
     if args.renumbering:
         mapped.update((fid, i) for i, fid in enumerate(fids, 1))
 
-    rows = get_rows(_open(args.vector_file), with_preamble=True)
-    preamble = next(rows)
-    for line in get_preamble_lines(preamble, selector, mapped):
-        print line,
+    if _uses_arrays(args, [args.vector_file]):
+        names, arrays = load_arrays(args.vector_file)
+        fids = [fid for fid in fids if fid <= len(names)]
+        index = [fid - 1 for fid in fids]
+        write_arrays(args.output, [names[i] for i in index],
+                     arrays._replace(matrix=arrays.matrix[:, index]),
+                     fids=[mapped[fid] for fid in fids])
+        return
+
+    trans = dict((str(fid), str(mapped[fid])) for fid in fids)
+    preamble, blocks = get_preamble_and_blocks(_open(args.vector_file))
+    out = open_output(args.output)
+    try:
+        for line in get_preamble_lines(preamble, selector, mapped):
+            out.write(line)
+
+        if args.processes > 1 and is_plain(args.vector_file):
+            data_offset = sum(len(line) for line in preamble)
+            _cut_parallel(args.vector_file, data_offset, trans, out, args.processes)
+        else:
+            for block in blocks:
+                _write_block(out, [_cut_line(line, trans) for line in block if line])
+    finally:
+        close_output(out)
+
+
+def _join_arrays(args):
+    """ Join vector files of either format in memory """
+    names_list, arrays_list = zip(*[load_arrays(name, declared_only=True)
+                                       for name in args.vector_files])
+    first = arrays_list[0]
+    index_list = [np.arange(len(first.qids))]
+
+    if args.align:
+        keys = [zip(arrays.qids, arrays.docnos) for arrays in arrays_list]
+        positions = [dict((key, i) for i, key in enumerate(k)) for k in keys[1:]]
+        selected = [i for i, key in enumerate(keys[0])
+                    if all(key in position for position in positions)]
+        _report_missing(len(keys[0]) - len(selected))
+        index_list = [np.array(selected, dtype=np.int64)]
+        index_list.extend(np.array([position[keys[0][i]] for i in selected], dtype=np.int64)
+                          for position in positions)
+    else:
+        for arrays in arrays_list[1:]:
+            if not (np.array_equal(arrays.qids, first.qids) and
+                    np.array_equal(arrays.docnos, first.docnos)):
+                print >>sys.stderr, 'vector files must have the same rows in the same order ' \
+                                    '(use --align to match rows by qid and docno)'
+                return 1
+            index_list.append(index_list[0])
 
-    for vector, metadata in get_vectors(rows):
-        row = ' '.join(['{}:{}'.format(mapped[fid], vector[fid]) for fid in fids])
-        print '{} qid:{} {} # docno:{}'.format(
-            metadata['rel'], metadata['qid'], row, metadata['docno'])
+    names = [name for names in names_list for name in names]
+    matrix = np.hstack([arrays.matrix[index] for arrays, index in zip(arrays_list, index_list)])
+    write_arrays(args.output, names, take_arrays(first, index_list[0])._replace(matrix=matrix))
 
 
-def join(argv):
-    """ Merge multiple sets of features """
-    parser = AutoHelpArgumentParser(prog='join')
-    parser.add_argument('vector_files', metavar='vector_file', type=str, nargs='+',
-                        help='input vector files')
-    args = parser.parse_args(argv)
+def _report_missing(count):
+    """ Report the number of rows dropped in an aligned join """
+    if count > 0:
+        print >>sys.stderr, 'warning: dropped {} rows not found in every vector file'.format(count)
 
-    if len(args.vector_files) < 2:
-        print >>sys.stderr, 'must specify at least two vector files'
-        return 1
 
-    rows_list = [get_rows(_open(name), with_preamble=True) for name in args.vector_files]
-    preamble_list = [next(rows) for rows in rows_list]
-    features_list = [get_preamble_features(preamble) for preamble in preamble_list]
+def _split_raw_line(line):
+    """ Split a vector line into (head, feature tokens, comment) without parsing values """
+    body, _, comment = line.partition('#')
+    fields = body.split()
+    return fields[:2], fields[2:], comment
+
+
+def _renumber_tokens(tokens, trans):
+    """ Renumber raw fid:value tokens according to a mapping of fid strings """
+    result = []
+    for token in tokens:
+        fid, _, val = token.partition(':')
+        result.append(trans[fid] + ':' + val)
+    return result
+
+
+def _get_raw_lines(name):
+    """ Return the preamble and the vector lines, read and decompressed on a separate thread """
+    preamble, blocks = get_preamble_and_blocks(_open(name))
+    return preamble, itertools.chain.from_iterable(prefetch(blocks))
+
+
+def _load_aligned(name, trans):
+    """ Return a dict of renumbered raw tokens keyed by (qid, docno) """
+    _, lines = _get_raw_lines(name)
+    result = dict()
+    for line in lines:
+        if not line:
+            continue
+        head, tokens, comment = _split_raw_line(line)
+        result[(head[1], comment.split(None, 1)[0])] = ' '.join(_renumber_tokens(tokens, trans))
+    return result
+
+
+def _join_text(args, out):
+    """ Join text vector files line by line into out """
+    inputs = [_get_raw_lines(name) for name in args.vector_files]
+    features_list = [get_preamble_features(preamble) for preamble, _ in inputs]
 
     trans_list = []
     fid_to_name = []
@@ -186,31 +825,96 @@ def join(argv):
         for fid, name in features:
             new_fid += 1
             fid_to_name.append((new_fid, name))
-            trans[fid] = new_fid
+            trans[str(fid)] = str(new_fid)
         trans_list.append(trans)
 
-    print '# Features in use'
+    print >>out, '# Features in use'
     for fid, name in fid_to_name:
-        print '# {}: {}'.format(fid, name)
+        print >>out, '# {}: {}'.format(fid, name)
+
+    lines = (line for line in inputs[0][1] if line)
+    buf = []
+    if args.align:
+        # hash the other inputs by (qid, docno), each loaded on its own thread
+        pool = ThreadPool(len(inputs) - 1)
+        others = pool.map(lambda i: _load_aligned(args.vector_files[i], trans_list[i]),
+                          range(1, len(inputs)))
+        pool.close()
+
+        missing = 0
+        for line in lines:
+            head, tokens, comment = _split_raw_line(line)
+            key = (head[1], comment.split(None, 1)[0])
+            if not all(key in other for other in others):
+                missing += 1
+                continue
+            parts = head + _renumber_tokens(tokens, trans_list[0])
+            parts.extend(other[key] for other in others)
+            buf.append(' '.join(parts) + ' #' + comment)
+            if len(buf) >= 10000:
+                out.write('\n'.join(buf) + '\n')
+                buf = []
+        _report_missing(missing)
+    else:
+        others = [(line for line in lines_ if line) for _, lines_ in inputs[1:]]
+        for row in itertools.izip_longest(lines, *others):
+            if not all(row):
+                print >>sys.stderr, 'vector files have different numbers of rows'
+                return 1
+            parts = []
+            keys = []
+            for i, line in enumerate(row):
+                head, tokens, comment = _split_raw_line(line)
+                keys.append((head[0], head[1], comment.split(None, 1)[0]))
+                parts.extend(_renumber_tokens(tokens, trans_list[i]))
+            if keys.count(keys[0]) != len(keys):
+                print >>sys.stderr, 'rows do not match: {} ' \
+                                    '(use --align to match rows by qid and docno)'.format(keys)
+                return 1
+            _, _, comment = _split_raw_line(row[0])
+            buf.append(' '.join(list(keys[0][:2]) + parts) + ' #' + comment)
+            if len(buf) >= 10000:
+                out.write('\n'.join(buf) + '\n')
+                buf = []
+
+    if buf:
+        out.write('\n'.join(buf) + '\n')
 
-    vectors_list = [get_vectors(rows) for rows in rows_list]
-    while True:
-        vm_list = [next(vectors, None) for vectors in vectors_list]
-        if not all(vm_list):
-            assert not any(vm_list)
-            break
 
-        m_list = [m for _, m in vm_list]
-        assert m_list.count(m_list[0]) == len(m_list)
+def join(argv):
+    """ Merge multiple sets of features """
+    parser = AutoHelpArgumentParser(prog='join')
+    parser.add_argument('--align', action='store_true',
+                        help='match rows by qid and docno rather than by position')
+    parser.add_argument('-o', dest='output', metavar='FILE',
+                        help='write the output to FILE (binary if FILE ends with .bvec)')
+    parser.add_argument('vector_files', metavar='vector_file', type=str, nargs='+',
+                        help='input vector files')
+    args = parser.parse_args(argv)
+
+    if len(args.vector_files) < 2:
+        print >>sys.stderr, 'must specify at least two vector files'
+        return 1
+
+    if _uses_arrays(args, args.vector_files):
+        return _join_arrays(args)
+
+    out = open_output(args.output)
+    try:
+        return _join_text(args, out)
+    finally:
+        close_output(out)
 
-        metadata = m_list[0]
-        v_list = [v for v, _ in vm_list]
-        buf = []
-        for i in range(len(v_list)):
-            for fid in sorted(v_list[i]):
-                buf.append('{}:{}'.format(trans_list[i][fid], v_list[i][fid]))
-        print '{} qid:{} {} # docno:{}'.format(
-            metadata['rel'], metadata['qid'], ' '.join(buf), metadata['docno'])
+
+def _get_qid_indexes(arrays):
+    """ Return the qids in order of appearance and a dict of row indexes per qid """
+    qids, indexes = [], dict()
+    for qid, begin, end in get_qid_ranges(arrays.qids):
+        if qid not in indexes:
+            qids.append(qid)
+            indexes[qid] = []
+        indexes[qid].append(np.arange(begin, end))
+    return qids, dict((qid, np.concatenate(index)) for qid, index in indexes.items())
 
 
 def shuffle(argv):
@@ -218,6 +922,8 @@ def shuffle(argv):
     parser = AutoHelpArgumentParser(prog='shuffle')
     parser.add_argument('-seed',
                         help='use a custom seed instead of the system default')
+    parser.add_argument('-o', dest='output', metavar='FILE',
+                        help='write the output to FILE (binary if FILE ends with .bvec)')
     parser.add_argument('vector_file',
                         help='input vector file')
     args = parser.parse_args(argv)
@@ -225,25 +931,101 @@ def shuffle(argv):
     if args.seed is not None:
         random.seed(args.seed)
 
-    # scan through to get all the qids, have everything buffered
-    rows = get_rows(_open(args.vector_file), with_preamble=True)
-    preamble = next(rows)
+    if _uses_arrays(args, [args.vector_file]):
+        names, arrays = load_arrays(args.vector_file)
+        qids, indexes = _get_qid_indexes(arrays)
+        qids = sorted(qids)
+        random.shuffle(qids)
+        with ArrayWriter(args.output, names) as writer:
+            for qid in qids:
+                writer.write(take_arrays(arrays, indexes[qid]))
+        return
+
+    # compressed input is spooled to a temporary file, so that only the index
+    # is held in memory
+    with spooled(args.vector_file) as path:
+        index = get_index(path, save=(path == args.vector_file))
+        ranges = index.get_ranges_by_qid()
+        qids = sorted(ranges)
+        random.shuffle(qids)
+
+        out = open_output(args.output)
+        try:
+            with _open(path) as in_:
+                copy_ranges(in_, out, [(0, index.data_offset)])
+                for qid in qids:
+                    copy_ranges(in_, out, ranges[qid])
+        finally:
+            close_output(out)
+
+
+def _assign_folds(qids, k, randomized=False):
+    """ Return a dict of fold numbers (the lowest being 0) keyed by qid """
+    qids = list(qids)
+    if randomized:
+        random.shuffle(qids)
+
+    fold_number = dict()
+    fold_size = int(math.ceil(float(len(qids)) / k))
+    for i in range(k):
+        fold_number.update(
+            [(qid, i) for qid in qids[i * fold_size:(i + 1) * fold_size]])
+    return fold_number
 
-    buf = dict()
-    for line in rows:
-        qid = _get_between_text(line, 'qid:', ' ')
-        if qid not in buf:
-            buf[qid] = []
-        buf[qid].append(line)
 
-    qids = sorted(buf)
-    random.shuffle(qids)
+def _split_arrays(args, prefix):
+    """ Split a vector file of either format into folds """
+    names, arrays = load_arrays(args.vector_file)
+    qids, indexes = _get_qid_indexes(arrays)
+    fold_number = _assign_folds(qids, args.k, randomized=args.random)
 
-    # produce output
-    print ''.join(preamble),
-    for qid in qids:
-        for line in buf[qid]:
-            print line,
+    folds = [[qid for qid in qids if fold_number[qid] == k] for k in range(args.k)]
+    for k in range(args.k):
+        index = np.concatenate([indexes[qid] for qid in folds[k]] or [[]]).astype(np.int64)
+        write_arrays('{}.fold-{}_test{}'.format(prefix, k + 1, binvec.EXTENSION),
+                     names, take_arrays(arrays, np.sort(index)))
+        if args.complete:
+            rest = [qid for i in range(args.k) if i != k for qid in folds[i]]
+            index = np.concatenate([indexes[qid] for qid in rest] or [[]]).astype(np.int64)
+            write_arrays('{}.fold-{}_training{}'.format(prefix, k + 1, binvec.EXTENSION),
+                         names, take_arrays(arrays, np.sort(index)))
+
+
+def _split_indexed(args, prefix, path):
+    """ Split an indexed vector file into folds by seeking to the qid ranges
+
+    Each test fold is read from the input once; the training sets are then
+    formed by concatenating the other test folds, in parallel.
+    """
+    index = get_index(path, save=(path == args.vector_file))
+    fold_number = _assign_folds(index.qids, args.k, randomized=args.random)
+
+    test_files = ['{}.fold-{}_test'.format(prefix, k + 1) for k in range(args.k)]
+    with _open(path) as in_:
+        for k, name in enumerate(test_files):
+            qids = [qid for qid in index.qids if fold_number[qid] == k]
+            with file(name, 'wb') as out:
+                copy_ranges(in_, out, [(0, index.data_offset)])
+                copy_ranges(in_, out, index.get_ranges(qids))
+
+    if not args.complete:
+        return
+
+    def _write_training(k):
+        with file('{}.fold-{}_training'.format(prefix, k + 1), 'wb') as out:
+            with file(test_files[k], 'rb') as in_:
+                copy_ranges(in_, out, [(0, index.data_offset)])
+            for i, name in enumerate(test_files):
+                if i != k:
+                    with file(name, 'rb') as in_:
+                        size = os.path.getsize(name)
+                        copy_ranges(in_, out, [(index.data_offset, size - index.data_offset)])
+
+    pool = ThreadPool(args.k)
+    try:
+        pool.map(_write_training, range(args.k))
+    finally:
+        pool.close()
 
 
 def split(argv):
@@ -262,96 +1044,225 @@ def split(argv):
     parser.set_defaults(k=5)
     args = parser.parse_args(argv)
 
+    if binvec.is_binary(args.vector_file):
+        prefix = args.prefix or args.vector_file
+        if prefix.endswith(binvec.EXTENSION):
+            prefix = prefix[:-len(binvec.EXTENSION)]
+        return _split_arrays(args, prefix)
+
     prefix = args.prefix or args.vector_file
 
-    # Scan through to get all qids
-    rows = get_rows(_open(args.vector_file))
+    # compressed input is spooled to a temporary file, so that only the index
+    # is held in memory
+    with spooled(args.vector_file) as path:
+        _split_indexed(args, prefix, path)
 
-    seen_qids = set()
-    for line in rows:
-        seen_qids.add(_get_between_text(line, 'qid:', ' '))
 
-    qids = list(seen_qids)
-    if args.random:
-        random.shuffle(qids)
+def normalize_minmax(matrix):
+    """ Min-max normalize the columns of a matrix, mapping constant columns to 0 """
+    min_values = matrix.min(axis=0)
+    gaps = matrix.max(axis=0) - min_values
+    gaps[gaps == 0] = np.inf
+    return (matrix - min_values) / gaps
 
-    # Assign fold numbers, the lowest being 0 internally
-    fold_number = dict()
-    fold_size = int(math.ceil(float(len(qids)) / args.k))
-    for k in range(args.k):
-        fold_number.update(
-            [(qid, k) for qid in qids[k * fold_size:(k + 1) * fold_size]])
 
-    # Second pass
-    rows = get_rows(_open(args.vector_file), with_preamble=True)
-    preamble = next(rows)
+def normalize_zscore(matrix):
+    """ Standardize the columns of a matrix, mapping constant columns to 0 """
+    stds = matrix.std(axis=0)
+    stds[stds == 0] = np.inf
+    return (matrix - matrix.mean(axis=0)) / stds
 
-    test_files = ['{}.fold-{}_test'.format(prefix, k + 1) for k in range(args.k)]
-    test_outputs = [file(name, "w") for name in test_files]
-    for output in test_outputs:
-        output.writelines(preamble)
 
-    if args.complete:
-        training_files = ['{}.fold-{}_training'.format(prefix, k + 1) for k in range(args.k)]
-        training_outputs = [file(name, "w") for name in training_files]
-        for output in training_outputs:
-            output.writelines(preamble)
+def normalize_sum(matrix):
+    """ Divide the columns of a matrix by their sums of absolute values """
+    sums = np.abs(matrix).sum(axis=0)
+    sums[sums == 0] = np.inf
+    return matrix / sums
 
-    full_set = set(range(args.k))
 
-    if args.complete:
-        for line in rows:
-            qid = _get_between_text(line, 'qid:', ' ')
-            test_outputs[fold_number[qid]].write(line)
-            for fold in full_set - set([fold_number[qid]]):
-                training_outputs[fold].write(line)
-    else:
-        for line in rows:
-            qid = _get_between_text(line, 'qid:', ' ')
-            test_outputs[fold_number[qid]].write(line)
+def normalize_rank(matrix):
+    """ Replace values with their ranks in the column scaled to [0, 1] (ties averaged),
+    mapping constant columns to 0 """
+    result = np.zeros(matrix.shape, dtype=np.float64)
+    if len(matrix) < 2:
+        return result
+    for j in range(matrix.shape[1]):
+        column = matrix[:, j]
+        values = np.sort(column)
+        if values[0] == values[-1]:
+            continue
+        ranks = np.searchsorted(values, column, 'left') + \
+            np.searchsorted(values, column, 'right') - 1
+        result[:, j] = ranks / (2.0 * (len(column) - 1))
+    return result
+
+
+NORMALIZERS = collections.OrderedDict([
+    ('minmax', normalize_minmax),
+    ('zscore', normalize_zscore),
+    ('sum', normalize_sum),
+    ('rank', normalize_rank),
+])
+
+
+def normalize_groups(matrix, qids, method='minmax'):
+    """ Return the matrix normalized within each run of rows with the same qid """
+    normalizer = NORMALIZERS[method]
+    result = np.empty(matrix.shape, dtype=np.float64)
+    for _, begin, end in get_qid_ranges(np.asarray(qids)):
+        result[begin:end] = normalizer(np.asarray(matrix[begin:end], dtype=np.float64))
+    return result
+
+
+def iter_groups(chunks, get_keys=None):
+    """ Regroup a sequence of VectorArrays chunks into runs of rows with the same key
+
+    The keys of a chunk's rows are given by get_keys(chunk), and default to the qids.
+    """
+    get_keys = get_keys or (lambda chunk: chunk.qids)
+    pending, pending_key = [], None
+    for chunk in chunks:
+        for key, begin, end in get_qid_ranges(get_keys(chunk)):
+            if pending and pending_key != key:
+                yield concatenate_arrays(pending)
+                pending = []
+            pending.append(take_arrays(chunk, slice(begin, end)))
+            pending_key = key
+    if pending:
+        yield concatenate_arrays(pending)
+
+
+def iter_whole_groups(chunks, get_keys=None):
+    """ Re-cut a sequence of VectorArrays chunks so that no run of rows with the
+    same key (see iter_groups) straddles two chunks """
+    get_keys = get_keys or (lambda chunk: chunk.qids)
+    pending = []
+    for chunk in chunks:
+        keys = get_keys(chunk)
+        if len(keys) == 0:
+            continue
+        if pending and get_keys(pending[-1])[-1] != keys[0]:
+            yield concatenate_arrays(pending)
+            pending = []
+        _, begin, _ = get_qid_ranges(keys)[-1]
+        if begin > 0 and pending:
+            yield concatenate_arrays(pending + [take_arrays(chunk, slice(0, begin))])
+            pending = []
+        elif begin > 0:
+            yield take_arrays(chunk, slice(0, begin))
+        pending.append(take_arrays(chunk, slice(begin, None)))
+    if pending:
+        yield concatenate_arrays(pending)
 
 
-# FIXME
 def normalize(argv):
     """ Normalize feature values. """
     parser = AutoHelpArgumentParser(prog='normalize')
-    parser.add_argument('-m',
-                        help='normalizaion method name')
+    parser.add_argument('-m', dest='method', choices=NORMALIZERS.keys(), default='minmax',
+                        help='normalization method (default: minmax)')
+    parser.add_argument('-o', dest='output', metavar='FILE',
+                        help='write the output to FILE (binary if FILE ends with .bvec)')
+    add_text_output_arguments(parser)
     parser.add_argument('vector_file',
                         help='input vector file')
     args = parser.parse_args(argv)
 
-    def get_vector_groups(rows):
-        qid = None
-        group = dict()
-        for vector, m in get_vectors(rows):
-            if m['qid'] != qid:
-                if group:
-                    yield qid, group
-                qid = m['qid']
-                group = dict.fromkeys(vector, [])
-            for fid, val in vector.items():
-                group[fid].append(val)
-        if group:
-            yield qid, group
-
-    # first pass over data to collect means
-    rows = get_rows(_open(args.vector_file))
-    # means = dict()
-    min_values, gaps = dict(), dict()
-    for qid, group in get_vector_groups(rows):
-        # means[qid] = dict((fid, np.mean(values)) for fid, values in group)
-        min_values[qid] = {fid: min(values) for fid, values in group.items()}
-        gaps[qid] = {fid: max(values) - min(values) for fid, values in group.items()}
-
-    # second pass
-    rows = get_rows(_open(args.vector_file))
-    preamble = next(rows)
-    print ''.join(preamble),
-    for vector, m in get_vectors(rows):
-        buf = []
-        for fid in sorted(vector):
-            new_value = float(vector[fid] - min_values[m['qid']][fid]) / gaps[m['qid']][fid]
-            buf.append('{}:{}'.format(fid, new_value))
-        row = ' '.join(buf)
-        print '{} qid:{} {} # docno:{}'.format(m['rel'], m['qid'], row, m['docno'])
+    # the values of each run of rows with the same qid are normalized together,
+    # so only one query group is held in memory at a time
+    if binvec.is_binary(args.vector_file):
+        names, arrays = load_arrays(args.vector_file)
+        fids = None
+        groups = (take_arrays(arrays, slice(begin, end))
+                  for _, begin, end in get_qid_ranges(arrays.qids))
+    else:
+        features = dict(get_text_features(args.vector_file))
+        fids = sorted(features)
+        names = [features[fid] for fid in fids]
+        _, blocks = get_preamble_and_blocks(_open(args.vector_file))
+        chunks = get_array_chunks(blocks, nfeatures=max(fids) if fids else 0)
+        groups = (group._replace(matrix=group.matrix[:, [fid - 1 for fid in fids]])
+                  for group in iter_groups(chunks))
+
+    normalizer = NORMALIZERS[args.method]
+    with ArrayWriter(args.output, names, fids=fids,
+                     sparse=args.sparse, precision=args.precision) as writer:
+        for group in groups:
+            matrix = normalizer(np.asarray(group.matrix, dtype=np.float64))
+            writer.write(group._replace(matrix=matrix))
+
+
+def convert(argv):
+    """ Convert vector files between SVMLight text and binary format """
+    parser = AutoHelpArgumentParser(prog='convert')
+    parser.add_argument('--dtype', choices=('float32', 'float64'),
+                        help='floating-point type of binary output (default: %(default)s)')
+    parser.add_argument('vector_file',
+                        help='input vector file')
+    parser.add_argument('output',
+                        help='output file (binary if it ends with .bvec)')
+    parser.set_defaults(dtype='float64')
+    args = parser.parse_args(argv)
+
+    if binvec.is_binary_name(args.output):
+        preamble, blocks = get_preamble_and_blocks(_open(args.vector_file))
+        features = dict(get_preamble_features(preamble))
+        nfeatures = max(features) if features else 0
+        names = [features.get(fid, 'Unknown') for fid in range(1, nfeatures + 1)]
+        with ArrayWriter(args.output, names, dtype=args.dtype) as writer:
+            for chunk in get_array_chunks(blocks, nfeatures=nfeatures):
+                writer.write(chunk)
+    else:
+        names, arrays = load_arrays(args.vector_file)
+        write_arrays(args.output, names, arrays)
+
+
+def select(argv):
+    """ Select the vectors of a given set of queries """
+    parser = AutoHelpArgumentParser(prog='select')
+    parser.add_argument('-q', dest='qids', metavar='QIDS', required=True,
+                        help='comma-separated list of qids')
+    parser.add_argument('-o', dest='output', metavar='FILE',
+                        help='write the output to FILE (binary if FILE ends with .bvec)')
+    parser.add_argument('vector_file',
+                        help='input vector file')
+    args = parser.parse_args(argv)
+
+    qids = [qid.strip() for qid in args.qids.split(',') if qid.strip()]
+
+    if _uses_arrays(args, [args.vector_file]):
+        names, arrays = load_arrays(args.vector_file)
+        mask = np.in1d(arrays.qids, qids)
+        write_arrays(args.output, names, take_arrays(arrays, mask))
+        return
+
+    out = open_output(args.output)
+    try:
+        if is_indexable(args.vector_file):
+            index = get_index(args.vector_file)
+            with _open(args.vector_file) as in_:
+                copy_ranges(in_, out, [(0, index.data_offset)])
+                copy_ranges(in_, out, index.get_ranges(qids))
+            return
+
+        selected = set(qids)
+        rows = get_rows(_open(args.vector_file), with_preamble=True)
+        out.writelines(next(rows))
+        for line in rows:
+            if _get_between_text(line, 'qid:', ' ') in selected:
+                out.write(line)
+    finally:
+        close_output(out)
+
+
+def index(argv):
+    """ Build the qid index of a vector file """
+    parser = AutoHelpArgumentParser(prog='index')
+    parser.add_argument('vector_file',
+                        help='input vector file (uncompressed or BGZF)')
+    args = parser.parse_args(argv)
+
+    if not is_indexable(args.vector_file):
+        print >>sys.stderr, 'only uncompressed or BGZF SVMLight files can be indexed'
+        return 1
+
+    VectorIndex.build(args.vector_file).save(args.vector_file + '.idx')
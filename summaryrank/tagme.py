@@ -1,24 +1,249 @@
 """
 TAGME restful API
 """
+import email.utils
+import hashlib
+import httplib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
 import urllib
 import urllib2
+import urlparse
+
+from multiprocessing.pool import ThreadPool
 
 
 TAGME_TAG_URL = 'http://tagme.di.unipi.it/tag'
 
+TAGME_OPTIONS = ('lang', 'tweet', 'include_abstract', 'include_categories',
+                 'include_all_spots', 'long_text', 'epsilon')
 
-def tag(text, key, **kwargs):
-    """ Run the TAGME tag service and return a response object """
+
+class TagmeError(Exception):
+    """ An error response from the TAGME service """
+
+    def __init__(self, status, reason, retry_after=None):
+        super(TagmeError, self).__init__('HTTP Error {}: {}'.format(status, reason))
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def is_retryable(self):
+        """ True for server errors and rate limiting (429), but no other client errors """
+        return self.status >= 500 or self.status == 429
+
+
+def parse_retry_after(value):
+    """ Return the number of seconds in a Retry-After header (seconds or HTTP date) """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, email.utils.mktime_tz(date) - time.time())
+
+
+def _make_params(text, key, **kwargs):
+    """ Return the request parameters """
     param = {'text': text, 'key': key}
-    for attr in ('lang', 'tweet', 'include_abstract', 'include_categories',
-                 'include_all_spots', 'long_text', 'epsilon'):
+    for attr in TAGME_OPTIONS:
         if attr in kwargs and kwargs[attr] is not None:
             val = kwargs[attr]
             param[attr] = str(val).lower() if isinstance(val, bool) else str(val)
     # FIXME: dirty fix
     for k, v in param.items():
         param[k] = unicode(v, 'utf8').encode('utf8')
-    data = urllib.urlencode(param)
+    return param
+
+
+def tag(text, key, **kwargs):
+    """ Run the TAGME tag service and return a response object """
+    data = urllib.urlencode(_make_params(text, key, **kwargs))
     request = urllib2.Request(TAGME_TAG_URL, data)
     return urllib2.urlopen(request)
+
+
+class RateLimiter(object):
+    """ A thread-safe limiter on the number of calls per second """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """ Block until the next call is allowed """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AnnotationCache(object):
+    """ An on-disk cache of TAGME responses keyed by the text and request options """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def get_key(cls, text, options):
+        """ Return the content hash of the text and request options """
+        digest = hashlib.sha1(json.dumps(sorted(options.items())))
+        digest.update('\0')
+        digest.update(text)
+        return digest.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def get(self, key):
+        """ Return the cached response, or None if not found """
+        try:
+            with open(self._get_path(key), 'rb') as in_:
+                return in_.read()
+        except IOError:
+            return None
+
+    def put(self, key, response):
+        """ Store the response """
+        path = self._get_path(key)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not os.path.isdir(dirname):
+                    raise
+        # write then rename, so that concurrent readers never see partial data
+        fd, tmpname = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as out:
+            out.write(response)
+        os.rename(tmpname, path)
+
+
+class Client(object):
+    """ A concurrent TAGME client over persistent HTTP connections """
+
+    def __init__(self, key, url=TAGME_TAG_URL, concurrency=4, rate=None,
+                 retries=3, backoff=1.0, timeout=60, cache=None, **kwargs):
+        self.key = key
+        self.cache = cache
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.options = kwargs
+
+        parts = urlparse.urlsplit(url)
+        self._connection_class = (httplib.HTTPSConnection if parts.scheme == 'https'
+                                  else httplib.HTTPConnection)
+        self._netloc = parts.netloc
+        self._path = parts.path or '/'
+        self._limiter = RateLimiter(rate)
+        self._local = threading.local()
+
+    def _get_connection(self):
+        """ Return the connection owned by the current thread """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connection_class(self._netloc, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _close_connection(self):
+        """ Drop the connection owned by the current thread """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _request(self, text):
+        """ Issue one request and return the response body """
+        body = urllib.urlencode(_make_params(text, self.key, **self.options))
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        connection = self._get_connection()
+        try:
+            connection.request('POST', self._path, body, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (httplib.HTTPException, socket.error):
+            self._close_connection()
+            raise
+        if response.will_close:
+            self._close_connection()
+        if response.status != 200:
+            raise TagmeError(response.status, response.reason,
+                             parse_retry_after(response.getheader('Retry-After')))
+        return data
+
+    def tag(self, text):
+        """ Return the TAGME response for the text, consulting the cache first """
+        if self.cache is None:
+            return self._tag(text)
+
+        key = self.cache.get_key(text, self.options)
+        response = self.cache.get(key)
+        if response is None:
+            response = self._tag(text)
+            self.cache.put(key, response)
+        return response
+
+    def _tag(self, text):
+        """ Request the TAGME response for the text, retrying with exponential backoff
+
+        A Retry-After header (as sent with 429 or 503) is honoured when it asks
+        for a longer wait than the backoff.
+        """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            self._limiter.wait()
+            wait = delay
+            try:
+                return self._request(text)
+            except (TagmeError, httplib.HTTPException, socket.error) as e:
+                # client errors (e.g., an invalid key) are not worth retrying
+                if isinstance(e, TagmeError) and not e.is_retryable:
+                    raise
+                if attempt == self.retries:
+                    raise
+                if isinstance(e, TagmeError) and e.retry_after is not None:
+                    wait = max(delay, e.retry_after)
+            time.sleep(wait)
+            delay *= 2
+
+    def _safe_tag(self, text):
+        """ Return a (response, error) pair """
+        try:
+            return self.tag(text), None
+        except Exception as e:
+            return None, e
+
+    def tag_many(self, texts):
+        """ Generate (response, error) pairs for the texts, in the given order """
+        pool = ThreadPool(self.concurrency)
+        try:
+            for result in pool.imap(self._safe_tag, texts):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def get_entity_ids(response, rho=None):
+    """ Return the sorted list of entity ids in a TAGME response """
+    if response.strip() == '':
+        return []
+    data = json.loads(response)
+    return sorted(set(anno['id'] for anno in data['annotations']
+                      if rho is None or anno.get('rho', 0) >= rho))
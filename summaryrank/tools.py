@@ -32,3 +32,18 @@ def split(argv):
 def normalize(argv):
     """ Normalize feature values """
     return svmlight_tools.normalize(argv)
+
+
+def convert(argv):
+    """ Convert vector files between SVMLight text and binary format """
+    return svmlight_tools.convert(argv)
+
+
+def select(argv):
+    """ Select the vectors of a given set of queries """
+    return svmlight_tools.select(argv)
+
+
+def index(argv):
+    """ Build the qid index of a vector file """
+    return svmlight_tools.index(argv)
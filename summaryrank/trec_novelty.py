@@ -1,11 +1,15 @@
 """
-Tools for parsing and importing WebAP data
+Tools for parsing and importing TREC Novelty Track data
 """
 import argparse
+import collections
+import multiprocessing
 import re
+import sys
 import tarfile
 
 import summaryrank
+import summaryrank.compression
 
 
 IMPORTER_DESCRIPTION = r'''
@@ -32,30 +36,61 @@ def import_trec_novelty(argv):
 
     parser.add_argument('-m', dest='model', metavar='DIR', required=True,
                         help='store the processed data in DIR')
+    parser.add_argument('--codec', type=summaryrank.compression.codec_argument,
+                        help='compress the model files with CODEC, e.g., gzip:6, bgzf, '
+                        'bz2 or none (default: gzip)')
+    parser.add_argument('--append', action='store_true',
+                        help='add the topics that are not in the model yet as a new segment')
+    parser.add_argument('--backend', choices=summaryrank.base.BACKENDS.keys(),
+                        help='store the representations as files or in an SQLite database '
+                        '(default: as the model already does, or files)')
+    parser.add_argument('-j', dest='processes', metavar='N', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='parse the topic files in N processes (default: %(default)s)')
     parser.add_argument('query_file',
                         help='query file, in TREC format')
     parser.add_argument('corpus_file',
-                        help='corpus file, a tarball as distributed by TREC')
+                        help='corpus file, a tarball as distributed by TREC '
+                        '(.tar, .tgz or .tar.gz)')
     parser.add_argument('qrels_file',
                         help='relevance judgment file')
     args = parser.parse_args(argv)
 
-    model = summaryrank.Model(args.model)
+    model = summaryrank.get_model(args.model, args.backend)
+    if args.codec:
+        model.set_codec(args.codec)
 
     # process and save query topics
-    topics = get_topics(summaryrank.open(args.query_file))
+    try:
+        segment, topics = model.start_import(get_topics(summaryrank.open(args.query_file)),
+                                             append=args.append)
+    except ValueError as e:
+        parser.error(str(e))
+    if not topics:
+        print >>sys.stderr, 'no new topics to import'
+        return
     qids = [m['qid'] for _, m in topics]
-    model.save_topics(topics)
+    model.save_topics(topics, segment)
 
     # process corpus data and save sentences
-    qrels = get_qrels_set(summaryrank.open(args.qrels_file))
-    sentences = get_sentences(tarfile.open(args.corpus_file, 'r:gz'),
-                              qids=qids, qrels=qrels, charset='latin-1')
-    model.save_sentences_qrels(sentences, qids=set(qids))
+    qrels = get_qrels(summaryrank.open(args.qrels_file))
+    corpus = open_corpus(args.corpus_file)
+    sentences = get_sentences(corpus, qids=qids, qrels=qrels, charset='latin-1',
+                              processes=args.processes)
+    model.save_sentences_qrels(sentences, qids=set(qids), segment=segment)
+
+
+def open_corpus(filename):
+    """ Open the corpus tarball (possibly compressed, as in .tgz) for reading in one pass """
+    return tarfile.open(fileobj=summaryrank.open(filename), mode='r|*')
 
 
 SENTENCE_PATTERN = re.compile(r'<s docid="(.*?)" num="(.*?)">\s*(.*)</s>')
 
+# the same pattern matched at the start of any line of a whole file
+_MULTILINE_SENTENCE_PATTERN = re.compile(
+    r'^<s docid="(.*?)" num="(.*?)">[^\S\n]*(.*)</s>', re.MULTILINE)
+
 
 def get_topics(iterable):
     """ Get TREC description topics. """
@@ -85,31 +120,75 @@ def get_topics(iterable):
     return result
 
 
-def get_sentences(tarball, qids, qrels, charset=None):
-    """ Get sentences from TRECTEXT data. """
-    names = set(tarball.getnames())
+def get_member_names(qid):
+    """ Return the names that the sentence file of a topic may have in the tarball """
+    # the second one is a hack for Novelty Track 2004 data
+    return ['{}.docs_text'.format(qid), '{}.doc_text'.format(qid)[1:]]
+
+
+def parse_sentences(data, qid, relevant, charset=None):
+    """ Return the (sentence, metadata) pairs in the sentence file of a topic """
+    result = []
+    for m in _MULTILINE_SENTENCE_PATTERN.finditer(data):
+        docno, sid, sentence = m.groups()
+        if charset:
+            sentence = sentence.decode(charset)
+        rel = int((docno, sid) in relevant)
+        result.append((sentence, {'qid': qid, 'docno': docno, 'id': sid, 'rel': str(rel)}))
+    return result
+
+
+def _parse_member(job):
+    """ Parse a sentence file (in a worker process) """
+    return parse_sentences(*job)
+
+
+def get_sentences(tarball, qids, qrels, charset=None, processes=None):
+    """ Get sentences from TRECTEXT data.
+
+    The tarball is read in one pass (it can be opened in stream mode), while
+    the sentence files are parsed in worker processes; the sentences are then
+    generated in the order of qids.
+    """
+    names = dict()
     for qid in qids:
-        filename = '{}.docs_text'.format(qid)
-        if filename not in names:
-            # a hack for Novelty Track 2004 data
-            alt = '{}.doc_text'.format(qid)[1:]
-            if alt in names:
-                filename = alt
-            else:
-                print >>sys.stderr, 'warning: cannot find {}'.format(filename)
+        for name in get_member_names(qid):
+            names.setdefault(name, qid)
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        results = collections.defaultdict(dict)
+        for member in tarball:
+            if member.name not in names or not member.isfile():
                 continue
+            qid = names[member.name]
+            job = (tarball.extractfile(member).read(), qid, qrels.get(qid, set()), charset)
+            if pool:
+                results[qid][member.name] = pool.apply_async(_parse_member, (job,))
+            else:
+                results[qid][member.name] = _parse_member(job)
 
-        in_ = tarball.extractfile(filename)
-        for line in in_:
-            m = re.match(SENTENCE_PATTERN, line)
-            if m:
-                sentence = m.group(3).decode(charset) if charset else m.group(3)
-                metadata = {'qid': qid, 'docno': m.group(1), 'id': m.group(2)}
-                rel = int((metadata['qid'], metadata['docno'], metadata['id']) in qrels)
-                metadata['rel'] = str(rel)
+        for qid in qids:
+            found = [name for name in get_member_names(qid) if name in results[qid]]
+            if not found:
+                print >>sys.stderr, 'warning: cannot find {}'.format(get_member_names(qid)[0])
+                continue
+            result = results.pop(qid)[found[0]]
+            for sentence, metadata in result if pool is None else result.get():
                 yield sentence, metadata
+        if pool:
+            pool.close()
+    finally:
+        if pool:
+            pool.terminate()
 
 
-def get_qrels_set(iterable):
-    """ Get TREC Novelty Track qrels """
-    return set([tuple(re.split(r'[ :]', line.strip(), maxsplit=2)) for line in iterable])
+def get_qrels(iterable):
+    """ Get TREC Novelty Track qrels as sets of relevant (docno, id) keyed by qid """
+    qrels = collections.defaultdict(set)
+    for line in iterable:
+        fields = re.split(r'[ :]', line.strip(), maxsplit=2)
+        if len(fields) == 3:
+            qrels[fields[0]].add(tuple(fields[1:]))
+    return dict(qrels)
@@ -2,11 +2,15 @@
 The utility package
 """
 import argparse
+import atexit
+import collections
 import functools
 import os
+import Queue
 import sys
 import threading
 import time
+import weakref
 
 
 def unique(seq):
@@ -39,6 +43,202 @@ def memoize(obj):
     return memoizer
 
 
+class LRUCache(object):
+    """ A bounded, thread-safe mapping that evicts the least recently used items """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """ Return the value for key and mark it as recently used """
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self._data[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+
+def prefetch(iterable, maxsize=4):
+    """ Iterate over iterable in a background thread, buffering up to maxsize items. """
+    queue = Queue.Queue(maxsize)
+    done = object()
+
+    def _produce():
+        try:
+            for item in iterable:
+                queue.put((item, None))
+        except Exception as e:
+            queue.put((None, e))
+        queue.put((done, None))
+
+    thread = threading.Thread(target=_produce)
+    thread.daemon = True
+    thread.start()
+
+    while True:
+        item, error = queue.get()
+        if error is not None:
+            raise error
+        if item is done:
+            break
+        yield item
+
+
+# the writers not closed yet, to be closed when the interpreter exits
+_OPEN_WRITERS = weakref.WeakSet()
+
+
+@atexit.register
+def _close_writers():
+    for writer in list(_OPEN_WRITERS):
+        writer.close()
+
+
+class BackgroundWriter(object):
+    """ A file-like wrapper that writes to the underlying file on a background thread
+
+    Writes are collected into chunks of about bufsize bytes, which are handed
+    over to the thread (e.g., to be compressed) through a bounded queue.  The
+    file is closed (at the latest) when the interpreter exits.  An error from
+    the thread is raised on the next write and on close(), and again on every
+    later one, since the data after it is not written.
+    """
+
+    def __init__(self, fileobj, bufsize=1024 * 1024, maxsize=8):
+        self.fileobj = fileobj
+        self.bufsize = bufsize
+        self.softspace = 0
+        self.closed = False
+        self._buffer, self._buffered = [], 0
+        self._queue = Queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._consume)
+        self._thread.daemon = True
+        self._thread.start()
+        _OPEN_WRITERS.add(self)
+
+    def _consume(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if self._error is None:
+                try:
+                    self._write(data)
+                except Exception as e:
+                    self._error = e
+
+    def _write(self, data):
+        self.fileobj.write(data)
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def _flush_buffer(self):
+        if self._buffer:
+            self._queue.put(''.join(self._buffer))
+            self._buffer, self._buffered = [], 0
+
+    def write(self, data):
+        """ Write a string """
+        self._check()
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.bufsize:
+            self._flush_buffer()
+
+    def writelines(self, lines):
+        """ Write a sequence of strings """
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """ Hand the buffered data over to the thread """
+        self._flush_buffer()
+
+    def close(self):
+        """ Write out everything and close the underlying file """
+        if self.closed:
+            self._check()
+            return
+        self.closed = True
+        _OPEN_WRITERS.discard(self)
+        self._flush_buffer()
+        self._queue.put(None)
+        self._thread.join()
+        self.fileobj.close()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+
+class RowWriter(BackgroundWriter):
+    """ A BackgroundWriter of tab-delimited rows
+
+    Rows are handed over to the thread in batches of batch_size, and are
+    joined into lines there as well.
+    """
+
+    def __init__(self, fileobj, batch_size=10000, maxsize=8):
+        super(RowWriter, self).__init__(fileobj, maxsize=maxsize)
+        self.batch_size = batch_size
+        self._rows = []
+
+    def _write(self, data):
+        if isinstance(data, list):
+            data = ''.join(['\t'.join(row) + '\n' for row in data])
+        self.fileobj.write(data)
+
+    def _flush_rows(self):
+        if self._rows:
+            self._queue.put(self._rows)
+            self._rows = []
+
+    def _flush_buffer(self):
+        self._flush_rows()
+        super(RowWriter, self)._flush_buffer()
+
+    def write(self, data):
+        """ Write a string """
+        self._flush_rows()
+        super(RowWriter, self).write(data)
+
+    def write_row(self, row):
+        """ Write a sequence of strings as a tab-delimited line """
+        self._check()
+        if self._buffer:
+            super(RowWriter, self)._flush_buffer()
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._flush_rows()
+
+    def write_rows(self, rows):
+        """ Write a sequence of rows """
+        for row in rows:
+            self.write_row(row)
+
+
 def set_stdout_unbuffered():
     """ Set stdout unbuffered. """
     sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
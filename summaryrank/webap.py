@@ -2,13 +2,23 @@
 Tools for parsing and importing WebAP data
 """
 import argparse
+import collections
 import json
 import lxml.etree
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+from StringIO import StringIO
 
 import summaryrank
+import summaryrank.compression
 
 
 RELEVANCE_LABELS = ('NONE', 'FAIR', 'GOOD', 'EXCEL', 'PERFECT')
+METADATA_TAGS = ('DOCNO', 'TARGET_QID', 'ORIGINAL_DOCNO')
+CHUNK_SIZE = 4 * 1024 * 1024
 
 IMPORTER_DESCRIPTION = r'''
 Import WebAP data and store query/corpus in tab-delimited CSV format.
@@ -37,22 +47,45 @@ def import_webap(argv):
 
     parser.add_argument('-m', dest='model', metavar='DIR', required=True,
                         help='store the processed data in DIR')
+    parser.add_argument('--codec', type=summaryrank.compression.codec_argument,
+                        help='compress the model files with CODEC, e.g., gzip:6, bgzf, '
+                        'bz2 or none (default: gzip)')
+    parser.add_argument('--append', action='store_true',
+                        help='add the topics that are not in the model yet as a new segment')
+    parser.add_argument('--backend', choices=summaryrank.base.BACKENDS.keys(),
+                        help='store the representations as files or in an SQLite database '
+                        '(default: as the model already does, or files)')
+    parser.add_argument('-j', dest='processes', metavar='N', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='parse the corpus in N processes (default: %(default)s)')
     parser.add_argument('query_file',
                         help='query file, in JSON format')
     parser.add_argument('corpus_file',
                         help='corpus file, modified TRECTEXT format')
     args = parser.parse_args(argv)
 
-    model = summaryrank.Model(args.model)
+    model = summaryrank.get_model(args.model, args.backend)
+    if args.codec:
+        model.set_codec(args.codec)
 
     # process and save query topics
-    topics = get_topics(summaryrank.open(args.query_file))
+    try:
+        segment, topics = model.start_import(get_topics(summaryrank.open(args.query_file)),
+                                             append=args.append)
+    except ValueError as e:
+        parser.error(str(e))
+    if not topics:
+        print >>sys.stderr, 'no new topics to import'
+        return
     qids = [m['qid'] for _, m in topics]
-    model.save_topics(topics)
+    model.save_topics(topics, segment)
 
     # process corpus data and save sentences
-    sentences = get_sentences(summaryrank.open(args.corpus_file))
-    model.save_sentences_qrels(sentences, qids=set(qids))
+    if args.processes > 1 and summaryrank.compression.detect_codec(args.corpus_file) == 'none':
+        sentences = get_sentences_parallel(args.corpus_file, processes=args.processes)
+    else:
+        sentences = get_sentences(summaryrank.open(args.corpus_file))
+    model.save_sentences_qrels(sentences, qids=set(qids), segment=segment)
 
 
 def get_topics(iterable):
@@ -65,28 +98,99 @@ def get_sentences(iterable):
     """ Generate a sequence of (sentence, metadata) pairs. """
     label_to_rel = dict([(label, rel) for rel, label in enumerate(RELEVANCE_LABELS)])
 
-    context = lxml.etree.iterparse(iterable, events=('start', 'end'))
-    rel = None
-    for action, elem in context:
-        if action == 'start':
-            if elem.tag in label_to_rel:
-                rel = label_to_rel[elem.tag]
-            elif elem.tag == 'DOC':
-                metadata = dict.fromkeys(('DOCNO', 'TARGET_QID', 'ORIGINAL_DOCNO'))
-                sentence_count = 0
-        elif action == 'end':
-            if elem.tag == 'SENTENCE':
-                sentence_count += 1
-                yield (unicode(elem.text),
-                       {'id': str(sentence_count),
-                        'rel': str(rel),
-                        'docno': metadata['DOCNO'],
-                        'qid': metadata['TARGET_QID'],
-                        'original_docno': metadata['ORIGINAL_DOCNO']})
-            elif elem.tag in label_to_rel:
-                rel = None
-            elif elem.tag == 'DOC' or elem.tag == 'ROOT':
-                pass
-            else:
-                metadata[elem.tag] = elem.text
+    # only the end events of the elements of interest reach Python
+    context = lxml.etree.iterparse(iterable, events=('end',),
+                                   tag=('SENTENCE', 'DOC') + METADATA_TAGS)
+    metadata = dict.fromkeys(METADATA_TAGS)
+    sentence_count = 0
+    for _, elem in context:
+        if elem.tag == 'SENTENCE':
+            sentence_count += 1
+            label = next(elem.iterancestors(*RELEVANCE_LABELS), None)
+            yield (unicode(elem.text),
+                   {'id': str(sentence_count),
+                    'rel': str(label_to_rel[label.tag] if label is not None else None),
+                    'docno': metadata['DOCNO'],
+                    'qid': metadata['TARGET_QID'],
+                    'original_docno': metadata['ORIGINAL_DOCNO']})
+        elif elem.tag == 'DOC':
+            metadata = dict.fromkeys(METADATA_TAGS)
+            sentence_count = 0
+            # drop the parsed documents from the tree as well
             elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        else:
+            metadata[elem.tag] = elem.text
+
+
+def get_doc_chunks(filename, chunk_size=CHUNK_SIZE):
+    """ Split a corpus file into byte ranges of whole documents
+
+    Return the text before the first document (the XML declaration and the
+    root start tag), the matching root end tag, and a list of (offset, length)
+    ranges, each of at least chunk_size bytes (except the last) and starting
+    at a <DOC> tag.
+    """
+    with open(filename, 'rb') as in_:
+        if os.fstat(in_.fileno()).st_size == 0:
+            return '', '', []
+        data = mmap.mmap(in_.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            begin = data.find('<DOC>')
+            end = data.rfind('</DOC>')
+            if begin < 0 or end < begin:
+                return '', '', []
+            end += len('</DOC>')
+            header = data[:begin]
+
+            ranges = []
+            offset = begin
+            while offset < end:
+                next_offset = data.find('<DOC>', offset + chunk_size, end)
+                if next_offset < 0:
+                    next_offset = end
+                ranges.append((offset, next_offset - offset))
+                offset = next_offset
+        finally:
+            data.close()
+
+    root = re.findall(r'<([A-Za-z_][\w.:-]*)', header)
+    footer = '</{}>'.format(root[-1]) if root else ''
+    return header, footer, ranges
+
+
+def _parse_chunk(job):
+    """ Parse the sentences of a chunk of documents (in a worker process) """
+    filename, header, footer, offset, length = job
+    with open(filename, 'rb') as in_:
+        in_.seek(offset)
+        data = in_.read(length)
+    return list(get_sentences(StringIO(header + data + footer)))
+
+
+def get_sentences_parallel(filename, processes=None, chunk_size=CHUNK_SIZE):
+    """ Generate the same (sentence, metadata) pairs as get_sentences()
+
+    The corpus file (uncompressed) is split into chunks of documents, which
+    are parsed in worker processes and put back in order.
+    """
+    header, footer, ranges = get_doc_chunks(filename, chunk_size)
+    jobs = [(filename, header, footer, offset, length) for offset, length in ranges]
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes)
+    try:
+        # keep a bounded number of chunks in flight
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(pool.apply_async(_parse_chunk, (job,)))
+            if len(pending) > 2 * processes:
+                for sentence in pending.popleft().get():
+                    yield sentence
+        while pending:
+            for sentence in pending.popleft().get():
+                yield sentence
+        pool.close()
+    finally:
+        pool.terminate()
@@ -9,11 +9,17 @@ class TestModule(unittest2.TestCase):
         import summaryrank
 
     def test_main(self):
-        original_stdout = sys.stdout
+        import summaryrank.__main__
+        original_argv, original_stdout = sys.argv[:], sys.stdout
         sys.stdout = StringIO()
 
         try:
             sys.argv[1:] = []
-            import summaryrank.__main__
+            summaryrank.__main__.main()
+            output = sys.stdout.getvalue()
         finally:
-            sys.stdout = original_stdout
+            sys.argv[:], sys.stdout = original_argv, original_stdout
+
+        self.assertIn('usage: summaryrank', output)
+        for name, _ in summaryrank.__main__.GENERAL_FUNCTIONS:
+            self.assertIn('  {} '.format(name), output)
@@ -0,0 +1,187 @@
+#pylint: skip-file
+import unittest2
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import summaryrank
+
+
+TOPICS = [(u'first topic', {'qid': '701'}), (u'second topic', {'qid': '702'})]
+
+SENTENCES = [(u'a sentence', {'qid': '701', 'docno': 'D1', 'id': '1', 'rel': '1'}),
+             (u'another one', {'qid': '702', 'docno': 'D2', 'id': '1', 'rel': '0'})]
+
+
+class TestModelSegments(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.model = summaryrank.Model(os.path.join(self.tmpdir, 'model'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _import(self, topics, append=False):
+        segment, topics = self.model.start_import(topics, append=append)
+        if topics:
+            qids = set(m['qid'] for _, m in topics)
+            self.model.save_topics(topics, segment)
+            self.model.save_sentences_qrels(SENTENCES, qids=qids, segment=segment)
+        return segment, topics
+
+    def test_append(self):
+        self.assertTupleEqual(self._import(TOPICS[:1]), (0, TOPICS[:1]))
+        self.assertTupleEqual(self._import(TOPICS, append=True), (1, TOPICS[1:]))
+        self.assertTupleEqual(self._import(TOPICS, append=True), (2, []))
+
+        for name in summaryrank.Model.IMPORT_NAMES:
+            self.assertListEqual(self.model.get_segments(name), [0, 1])
+        self.assertListEqual(list(self.model.load_topics()), TOPICS)
+        self.assertListEqual([m['qid'] for m in self.model.load_qrels()], ['701', '702'])
+        self.assertTrue(self.model.contains(['topics_text', 'sentences_text']))
+
+        # a regular import starts over, generated representations included
+        self.model.save_representation('topics_term', [('701', 'first topic')], segment=0)
+        self.model.save_representation('sentences_term', [('D1', '1', '701', 'a sentence')])
+        self.model.save_representation('freq_stats', [('a', '1')])
+        self.assertTupleEqual(self._import(TOPICS[1:]), (0, TOPICS[1:]))
+        self.assertListEqual(self.model.get_segments('topics_text'), [0])
+        self.assertListEqual(list(self.model.load_topics()), TOPICS[1:])
+        self.assertListEqual(self.model.get_segments('topics_term'), [])
+        self.assertListEqual(self.model.get_segments('sentences_term'), [])
+        self.assertListEqual(self.model.get_segments('freq_stats'), [0])
+
+    def test_segments_to_generate(self):
+        self._import(TOPICS[:1])
+        self._import(TOPICS, append=True)
+        self.model.save_representation('topics_term', [('701', 'first topic')], segment=0)
+        self.model.save_representation('topics_term', [('703', 'stale')], segment=5)
+
+        self.assertListEqual(
+            self.model.get_segments_to_generate('topics_text', ['topics_term'], append=True),
+            [1])
+        self.assertListEqual(
+            self.model.get_segments_to_generate('topics_text', ['topics_term']), [0, 1])
+        self.assertListEqual(self.model.get_segments('topics_term'), [0])
+
+    def test_interrupted_writer(self):
+        self.model.save_representation('topics_tagme', [('701', 'saved')])
+        with self.assertRaises(KeyboardInterrupt):
+            with self.model.writer('topics_tagme') as out:
+                out.write_row(('701', 'saved'))
+                out.write_row(('702', 'partial'))
+                raise KeyboardInterrupt
+        self.assertListEqual(list(self.model.load_representation('topics_tagme')),
+                             [['701', 'saved']])
+        self.assertListEqual(os.listdir(self.model.path), ['topics_tagme.gz'])
+
+    def test_update_manifest(self):
+        # concurrent updates from several processes are all kept
+        self.model.set_codec('bz2')
+        processes = [multiprocessing.Process(target=_update_manifest, args=(self.model.path, i))
+                     for i in range(8)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        manifest = self.model.load_manifest()
+        self.assertEqual(manifest['codec'], 'bz2')
+        self.assertDictEqual(manifest['hashes'], dict(('key{}'.format(i), 20) for i in range(8)))
+
+
+def _update_manifest(path, i):
+    model = summaryrank.Model(path)
+    for count in range(1, 21):
+        model.update_manifest(
+            lambda manifest: manifest.setdefault('hashes', dict()).update({'key{}'.format(i): count}))
+
+
+class TestSQLiteModel(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.model = summaryrank.SQLiteModel(os.path.join(self.tmpdir, 'db'))
+        self.files = summaryrank.Model(os.path.join(self.tmpdir, 'files'))
+        for model in (self.model, self.files):
+            for topics, append in ((TOPICS[:1], False), (TOPICS, True)):
+                segment, topics = model.start_import(topics, append=append)
+                model.save_topics(topics, segment)
+                model.save_sentences_qrels(
+                    SENTENCES, qids=set(m['qid'] for _, m in topics), segment=segment)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_as_files(self):
+        self.assertIsInstance(summaryrank.get_model(self.model.path), summaryrank.SQLiteModel)
+        self.assertNotIsInstance(summaryrank.get_model(self.files.path), summaryrank.SQLiteModel)
+        self.assertListEqual(self.model.list_files(), [])
+
+        for name in summaryrank.Model.IMPORT_NAMES:
+            self.assertListEqual(self.model.get_segments(name), self.files.get_segments(name))
+            self.assertListEqual(list(self.model.load_representation(name)),
+                                 list(self.files.load_representation(name)))
+            self.assertEqual(self.model.hash_representation(name),
+                             self.files.hash_representation(name))
+        self.assertListEqual(self.model.list_representations(),
+                             self.files.list_representations())
+
+        # appending with another backend is refused
+        files = summaryrank.Model(self.model.path)
+        self.assertRaises(ValueError, files.start_import, TOPICS, append=True)
+
+    def test_lookup(self):
+        for model in (self.model, self.files):
+            self.assertListEqual(list(model.lookup('sentences_text', docno='D2', id_='1')),
+                                 [['D2', '1', '702', 'another one']])
+            self.assertListEqual(list(model.lookup('topics_text', qid='701', maxsplit=1)),
+                                 [['701', 'first topic']])
+            self.assertListEqual(list(model.lookup('qrels', qid='703')), [])
+            self.assertRaises(ValueError, list, model.lookup('topics_text', docno='D1'))
+
+            model.qids = set(['702'])
+            self.assertListEqual([m['qid'] for m in model.load_qrels()], ['702'])
+            self.assertListEqual(list(model.load_topics()), TOPICS[1:])
+            self.assertListEqual(list(model.lookup('qrels', qid='701')), [])
+            self.assertEqual(len(list(model.load_segment('topics_text', 0))), 1)
+
+    def test_rewrite(self):
+        stamp = self.model.get_stamp('topics_text')
+        self.model.save_representation('topics_text', [('704', 'other topic')], segment=1)
+        self.assertNotEqual(self.model.get_stamp('topics_text'), stamp)
+        self.assertListEqual(list(self.model.load_representation('topics_text')),
+                             [['701', 'first topic'], ['704', 'other topic']])
+
+        self.model.remove_segments('topics_text', keep=[1])
+        self.assertListEqual(self.model.get_segments('topics_text'), [1])
+        self.assertListEqual(list(self.model.load_representation('topics_text')),
+                             [['704', 'other topic']])
+        self.assertIsNone(self.model.get_stamp('topics_term'))
+
+    def test_rewrite_all(self):
+        # versions are not reused after removing all the segments
+        model = summaryrank.SQLiteModel(os.path.join(self.tmpdir, 'other'))
+        model.save_representation('topics_text', [('701', 'first topic')])
+        stamp = model.get_stamp('topics_text')
+        model.remove_segments('topics_text')
+        model.save_representation('topics_text', [('701', 'changed topic')])
+        self.assertNotEqual(model.get_stamp('topics_text'), stamp)
+
+    def test_interrupted_writer(self):
+        writer = self.model.writer('topics_text')
+        writer.write_row(('701', 'changed topic'))
+        # the old segment stays until the writer is closed
+        self.assertListEqual(list(self.model.load_segment('topics_text', 0)),
+                             [['701', 'first topic']])
+        writer.close()
+        self.assertListEqual(list(self.model.load_segment('topics_text', 0)),
+                             [['701', 'changed topic']])
+
+        stamp = self.model.get_stamp('topics_text')
+        with self.assertRaises(KeyboardInterrupt):
+            with self.model.writer('topics_text') as writer:
+                writer.write_row(('701', 'partial'))
+                raise KeyboardInterrupt
+        self.assertListEqual(list(self.model.load_segment('topics_text', 0)),
+                             [['701', 'changed topic']])
+        self.assertEqual(self.model.get_stamp('topics_text'), stamp)
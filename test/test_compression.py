@@ -0,0 +1,94 @@
+#pylint: skip-file
+import unittest2
+import gzip
+import os
+import shutil
+import tempfile
+
+import summaryrank
+from summaryrank import bgzf, compression
+
+
+DATA = ''.join('{}\tsentence number {}\n'.format(i, i * i) for i in range(50000))
+
+
+class TestBgzf(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'data.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        for threads in [1, 3]:
+            with bgzf.open(self.path, 'wb', threads=threads) as out:
+                for line in DATA.splitlines(True):
+                    out.write(line)
+            self.assertTrue(bgzf.is_bgzf(self.path))
+            self.assertGreater(len(DATA), 2 * bgzf.BLOCK_SIZE)
+
+            with bgzf.open(self.path, threads=threads) as in_:
+                self.assertListEqual(list(in_), DATA.splitlines(True))
+            with gzip.open(self.path) as in_:
+                self.assertEqual(in_.read(), DATA)
+
+    def test_seek(self):
+        with bgzf.open(self.path, 'wb') as out:
+            out.write(DATA)
+        index = bgzf.get_index(self.path)
+        self.assertEqual(index.size, len(DATA))
+        self.assertTrue(os.path.isfile(self.path + '.gzi'))
+        loaded = bgzf.BlockIndex.load(self.path + '.gzi', self.path)
+        self.assertListEqual(loaded.offsets, index.offsets)
+        self.assertEqual(loaded.size, index.size)
+
+        with bgzf.open(self.path, threads=2) as in_:
+            for offset in [bgzf.BLOCK_SIZE * 2 + 5, 10, bgzf.BLOCK_SIZE - 3, len(DATA) - 20]:
+                in_.seek(offset)
+                self.assertEqual(in_.read(1000), DATA[offset:offset + 1000])
+                self.assertEqual(in_.tell(), min(offset + 1000, len(DATA)))
+            in_.seek(-7, os.SEEK_END)
+            self.assertEqual(in_.read(), DATA[-7:])
+
+    def test_corrupted(self):
+        with bgzf.open(self.path, 'wb') as out:
+            out.write(DATA)
+        with open(self.path, 'r+b') as f:
+            f.seek(100)
+            f.write('garbage')
+        with bgzf.open(self.path) as in_:
+            self.assertRaises(Exception, in_.read)
+
+
+class TestCodecs(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_codec(self):
+        self.assertEqual(compression.parse_codec('gzip'), ('gzip', 9))
+        self.assertEqual(compression.parse_codec('bgzf:3'), ('bgzf', 3))
+        self.assertEqual(compression.parse_codec('none'), ('none', None))
+        for spec in ['zip', 'gzip:0', 'gzip:x', 'none:1']:
+            self.assertRaises(ValueError, compression.parse_codec, spec)
+
+    def test_model_codec(self):
+        model = summaryrank.Model(os.path.join(self.tmpdir, 'model'))
+        model.save_representation('topics_text', [('701', 'first topic')])
+        self.assertEqual(model.codec, 'gzip')
+        self.assertTrue(model.get_path('topics_text').endswith('.gz'))
+
+        for codec in ['none', 'bz2', 'bgzf:1']:
+            model.set_codec(codec)
+            self.assertEqual(summaryrank.Model(model.path).codec, codec)
+            self.assertListEqual(list(model.load_topics()), [('first topic', {'qid': '701'})])
+            model.save_representation('topics_text', [('702', 'second topic')])
+            self.assertListEqual(model.list_files(),
+                                 ['topics_text' + compression.get_extension(codec)])
+            self.assertEqual(compression.detect_codec(model.get_path('topics_text')),
+                             codec.split(':')[0])
+            self.assertListEqual(list(model.load_topics()), [('second topic', {'qid': '702'})])
+            model.save_representation('topics_text', [('701', 'first topic')])
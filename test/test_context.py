@@ -0,0 +1,51 @@
+#pylint: skip-file
+import unittest2
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from summaryrank import context, features, svmlight_tools
+
+
+class TestContext(unittest2.TestCase):
+    def test_get_context_names(self):
+        self.assertListEqual(context.get_context_names(['A'], k=2, aggregates=['max']), [
+            'SentenceBefore[A]', 'SentenceAfter[A]',
+            'SentenceBefore2[A]', 'SentenceAfter2[A]', 'WindowMax2[A]'])
+
+    def test_context_matrix(self):
+        matrix = np.array([[1.0, 10.0], [2.0, 20.0], [3.0, 30.0], [4.0, 40.0]])
+        result = context.context_matrix(matrix, k=1)
+        self.assertListEqual(result[:, :2].tolist(), [[0, 2], [1, 3], [2, 4], [3, 0]])
+        self.assertListEqual(result[:, 2:].tolist(), [[0, 20], [10, 30], [20, 40], [30, 0]])
+
+    def test_doc_boundaries(self):
+        matrix = np.array([[1.0], [2.0], [3.0], [4.0], [5.0]])
+        doc_ids = context.get_doc_ids(['D1:1', 'D1:2', 'D1:3', 'D2:1', 'D2:2'])
+        result = context.context_matrix(matrix, k=2, aggregates=['mean', 'max'],
+                                        doc_ids=doc_ids)
+        self.assertListEqual(result.tolist(), [
+            [0, 2, 0, 3, 2, 3],
+            [1, 3, 0, 0, 2, 3],
+            [2, 0, 1, 0, 2, 3],
+            [0, 5, 0, 0, 4.5, 5],
+            [4, 0, 0, 0, 4.5, 5],
+        ])
+
+    def test_contextualize_without_preamble(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'vectors.txt')
+            output = os.path.join(tmpdir, 'output.txt')
+            with open(path, 'w') as out:
+                out.write('0 qid:701 1:18 2:0.1 # docno:D1:1\n'
+                          '1 qid:701 1:33 2:0.2 # docno:D1:2\n')
+            features.contextualize(['-o', output, path])
+            names, arrays = svmlight_tools.load_arrays(output)
+            self.assertListEqual(names, ['SentenceBefore[Unknown]', 'SentenceAfter[Unknown]'] * 2)
+            self.assertListEqual(arrays.matrix.tolist(),
+                                 [[0, 33, 0, 0.2], [18, 0, 0.1, 0]])
+        finally:
+            shutil.rmtree(tmpdir)
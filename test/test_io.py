@@ -1,8 +1,12 @@
 #pylint: skip-file
 import unittest2
+import os
+import shutil
+import tempfile
 from StringIO import StringIO
 
-from summaryrank.io import SVMLight
+from summaryrank import binvec
+from summaryrank.io import SVMLight, BinaryVectors
 
 
 class TestSVMLight(unittest2.TestCase):
@@ -50,3 +54,68 @@ class TestSVMLight(unittest2.TestCase):
         features, vectors = SVMLight.parse(StringIO(self.data))
         self.assertEqual(features, self.features_truth)
         self.assertEqual(list(vectors), self.vectors_truth)
+
+    def test_parse_arrays(self):
+        features, arrays = SVMLight.parse_arrays(StringIO(self.data))
+        self.assertEqual(features, self.features_truth)
+        self.assertEqual(arrays.matrix.shape, (6, 6))
+        for i, (vector, metadata) in enumerate(self.vectors_truth):
+            self.assertListEqual(list(arrays.matrix[i]), [vector[fid] for fid in range(1, 7)])
+            self.assertEqual(arrays.qids[i], metadata['qid'])
+            self.assertEqual(arrays.rels[i], metadata['rel'])
+            self.assertEqual(arrays.docnos[i], metadata['docno'])
+
+    def test_iter_arrays(self):
+        _, dense = SVMLight.parse_arrays(StringIO(self.data))
+        features, chunks = SVMLight.iter_arrays(StringIO(self.data), sparse=True, blocksize=100)
+        chunks = list(chunks)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(len(chunk.qids) for chunk in chunks), 6)
+
+        _, sparse = SVMLight.parse_arrays(StringIO(self.data), sparse=True)
+        data, indices, indptr = sparse.matrix
+        self.assertEqual(len(indptr), 7)
+        for i in range(6):
+            row = dict(zip(indices[indptr[i]:indptr[i + 1]], data[indptr[i]:indptr[i + 1]]))
+            self.assertEqual(row, dict(enumerate(dense.matrix[i])))
+
+    def test_parse_arrays_processes(self):
+        _, arrays = SVMLight.parse_arrays(StringIO(self.data))
+        _, chunks = SVMLight.iter_arrays(StringIO(self.data), blocksize=100, processes=2)
+        chunks = list(chunks)
+        self.assertGreater(len(chunks), 1)
+        self.assertListEqual(
+            [list(row) for chunk in chunks for row in chunk.matrix],
+            [list(row) for row in arrays.matrix])
+
+
+class TestBinaryVectors(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_and_load(self):
+        path = os.path.join(self.tmpdir, 'vectors.bvec')
+        columns = [[18, 33, 3], [0.002257, 0.004515, 0.934884]]
+        qrels = [{'qid': '701', 'docno': 'GX268-35-11839875-701', 'id': '1', 'rel': 0},
+                 {'qid': '701', 'docno': 'GX268-35-11839875-701', 'id': '2', 'rel': 2},
+                 {'qid': '702', 'docno': 'GX267-05-8546339-702', 'id': '201', 'rel': 1}]
+        BinaryVectors.write_columnwise(path, ['SentenceLength', 'SentenceLocation'],
+                                       columns, qrels)
+        self.assertTrue(binvec.is_binary(path))
+
+        features, arrays = BinaryVectors.load(path)
+        self.assertListEqual(features, ['SentenceLength', 'SentenceLocation'])
+        self.assertListEqual(arrays.matrix.tolist(), map(list, zip(*columns)))
+        self.assertListEqual(list(arrays.qids), ['701', '701', '702'])
+        self.assertListEqual(list(arrays.rels), [0, 2, 1])
+        self.assertEqual(arrays.docnos[2], 'GX267-05-8546339-702:201')
+
+    def test_empty(self):
+        path = os.path.join(self.tmpdir, 'empty.bvec')
+        BinaryVectors.write_columnwise(path, ['SentenceLength'], [[]], [])
+        features, arrays = BinaryVectors.load(path)
+        self.assertEqual(arrays.matrix.shape, (0, 1))
+        self.assertEqual(len(arrays.qids), 0)
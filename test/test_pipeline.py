@@ -0,0 +1,120 @@
+#pylint: skip-file
+import unittest2
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+import summaryrank
+from summaryrank import pipeline
+
+
+QUERIES = '{"queries": [{"number": "701", "text": "first topic"}]}'
+
+CORPUS = '''<?xml version="1.0" encoding="UTF-8"?>
+<ROOT>
+<DOC>
+<DOCNO>GX000-00-0-701</DOCNO>
+<TARGET_QID>701</TARGET_QID>
+<ORIGINAL_DOCNO>GX000-00-0</ORIGINAL_DOCNO>
+<TEXT>
+<GOOD>
+<SENTENCE>a sentence</SENTENCE>
+</GOOD>
+</TEXT>
+</DOC>
+</ROOT>
+'''
+
+
+def _make_spec(steps, model=None):
+    return StringIO(json.dumps({'model': model, 'steps': steps}))
+
+
+class TestPipelineSpec(unittest2.TestCase):
+    def test_dependencies(self):
+        _, steps = pipeline.load_spec(_make_spec([
+            {'name': 'features', 'command': 'extract', 'inputs': ['topics_term', 'topics_esa'],
+             'stdout': 'features.txt'},
+            {'name': 'esa', 'command': 'gen_esa', 'inputs': ['topics_term'],
+             'outputs': ['topics_esa']},
+            {'name': 'term', 'command': 'gen_term', 'inputs': ['topics_text'],
+             'outputs': ['topics_term']},
+        ]))
+        self.assertListEqual(steps[0].output_files, ['features.txt'])
+        ordered, dependencies = pipeline.get_dependencies(steps)
+        self.assertListEqual([step.name for step in ordered], ['term', 'esa', 'features'])
+        self.assertDictEqual(dependencies,
+                             {'term': set(), 'esa': {'term'}, 'features': {'term', 'esa'}})
+
+    def test_invalid(self):
+        _, steps = pipeline.load_spec(_make_spec([
+            {'name': 'a', 'command': 'gen_term', 'inputs': ['x'], 'outputs': ['y']},
+            {'name': 'b', 'command': 'gen_term', 'inputs': ['y'], 'outputs': ['x']},
+        ]))
+        self.assertRaises(ValueError, pipeline.get_dependencies, steps)
+
+        _, steps = pipeline.load_spec(_make_spec([
+            {'name': 'a', 'command': 'gen_term', 'outputs': ['x']},
+            {'name': 'b', 'command': 'gen_term', 'outputs': ['x']},
+        ]))
+        self.assertRaises(ValueError, pipeline.get_dependencies, steps)
+        self.assertRaises(ValueError, pipeline.load_spec, _make_spec([{'name': 'a'}]))
+
+
+class TestPipelineRunner(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queries = os.path.join(self.tmpdir, 'queries.json')
+        self.corpus = os.path.join(self.tmpdir, 'corpus.trectext')
+        with open(self.queries, 'w') as out:
+            out.write(QUERIES)
+        with open(self.corpus, 'w') as out:
+            out.write(CORPUS)
+        self.model = summaryrank.Model(os.path.join(self.tmpdir, 'model'))
+        _, self.steps = pipeline.load_spec(_make_spec([
+            {'name': 'import', 'command': 'import_webap',
+             'args': ['-j', '1', self.queries, self.corpus],
+             'input_files': [self.queries, self.corpus],
+             'outputs': ['topics_text', 'sentences_text', 'qrels']},
+        ]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run(self):
+        self.assertListEqual(pipeline.Runner(self.model, self.steps).run(), [])
+        record = self.model.load_manifest()['representations']['topics_text']
+        self.assertEqual(record['step'], 'import')
+        self.assertEqual(record['sha1'], hashlib.sha1('701\tfirst topic\n').hexdigest())
+        self.assertItemsEqual(record['inputs'],
+                              ['file:' + self.queries, 'file:' + self.corpus])
+
+        # nothing has changed, even though the corpus file has been touched
+        os.utime(self.corpus, None)
+        runner = pipeline.Runner(self.model, self.steps)
+        runner._start = None  # running a step would fail
+        self.assertListEqual(runner.run(), [])
+
+        with open(self.queries, 'w') as out:
+            out.write(QUERIES.replace('first', 'changed'))
+        runner = pipeline.Runner(self.model, self.steps, dry_run=True)
+        runner._start = None
+        self.assertListEqual(runner.run(), [])
+        self.assertListEqual(pipeline.Runner(self.model, self.steps).run(), [])
+        self.assertListEqual(list(self.model.load_topics()), [('changed topic', {'qid': '701'})])
+
+    def test_no_outputs(self):
+        self.assertListEqual(pipeline.Runner(self.model, self.steps).run(), [])
+        _, steps = pipeline.load_spec(_make_spec([
+            {'name': 'help', 'command': 'import_webap', 'args': ['--help'],
+             'inputs': ['topics_text']},
+        ]))
+        runner = pipeline.Runner(self.model, self.steps + steps)
+        started = []
+        runner._start = lambda step, results: started.append(step.name) or \
+            results.put((step, 0, 0, 0))
+        self.assertListEqual(runner.run(), [])
+        self.assertListEqual(started, ['help'])
@@ -0,0 +1,90 @@
+#pylint: skip-file
+import unittest2
+
+from summaryrank.resources import ESARedisStrings
+from summaryrank.util import LRUCache
+
+
+class StandInRedis(object):
+    """ An in-process stand-in for the redis commands in use """
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append(('GET', key))
+        return self.data.get(key)
+
+    def exists(self, key):
+        self.calls.append(('EXISTS', key))
+        return key in self.data
+
+    def mget(self, keys):
+        self.calls.append(('MGET', tuple(keys)))
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return StandInPipeline(self)
+
+    def info(self):
+        return {'loading': 0}
+
+
+class StandInPipeline(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def mget(self, keys):
+        self.commands.append(keys)
+
+    def execute(self):
+        return [self.redis.mget(keys) for keys in self.commands]
+
+
+class TestESARedisStrings(unittest2.TestCase):
+    def setUp(self):
+        self.data = dict(('s{}'.format(i), '{}:-1.5 {}:-2.5 7:-3.0'.format(i, i + 1))
+                         for i in range(25))
+        self.redis = StandInRedis(self.data)
+
+    def test_get_many(self):
+        esa = ESARedisStrings(client=self.redis, k=2, chunk_size=10)
+        keys = ['s{}'.format(i) for i in range(25)] + ['missing', 's3']
+        vectors = esa.get_many(keys)
+        self.assertEqual(len(vectors), len(keys))
+        self.assertListEqual(vectors[3], [(3, -1.5), (4, -2.5)])
+        self.assertIsNone(vectors[25])
+        self.assertListEqual(vectors[26], vectors[3])
+        self.assertListEqual([cmd for cmd, _ in self.redis.calls], ['MGET'] * 3)
+
+        # cached vectors incur no round trips
+        self.redis.calls = []
+        self.assertTrue('s7' in esa)
+        self.assertListEqual(esa['s7'], [(7, -1.5), (8, -2.5)])
+        self.assertListEqual(esa.get_many(['s1', 's2']), [esa['s1'], esa['s2']])
+        self.assertListEqual(self.redis.calls, [])
+
+    def test_contains(self):
+        esa = ESARedisStrings(client=self.redis, cache_size=2)
+        self.assertTrue('s1' in esa)
+        self.assertFalse('missing' in esa)
+        self.assertListEqual(esa['s1'], [(1, -1.5), (2, -2.5), (7, -3.0)])
+        self.assertListEqual(self.redis.calls, [('GET', 's1'), ('GET', 'missing')])
+        self.assertEqual(esa.get('missing', 'default'), 'default')
+        with self.assertRaises(KeyError):
+            esa['missing']
+
+
+class TestLRUCache(unittest2.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertIsNone(cache.get('b'))
@@ -0,0 +1,82 @@
+#pylint: skip-file
+import unittest2
+import gzip
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import summaryrank
+from summaryrank import features, mk, scoring
+
+
+QUERY = u'Solar panels on the roof'
+
+SENTENCES = [u'Solar panels convert sunlight.',
+             u'The roof was repaired last year.',
+             u'Nothing to see here.']
+
+FREQ_STATS = '__INDEX__\t1000\t100\nsolar\t5\t3\npanel\t8\t4\nroof\t10\t6\n'
+
+
+class TestMemoryModel(unittest2.TestCase):
+    def test_rows(self):
+        model = summaryrank.MemoryModel()
+        model.save_representation('topics_text', [('701', 'a\ttab'), ('702', 'b')])
+        with model.writer('topics_text', segment=1) as out:
+            out.write_row(('703', 'c'))
+
+        self.assertListEqual(model.get_segments('topics_text'), [0, 1])
+        self.assertListEqual(list(model.load_segment('topics_text', 0, 1)),
+                             [['701', 'a\ttab'], ['702', 'b']])
+        self.assertListEqual(list(model.load_segment('topics_text', 0, 0)),
+                             [['701\ta\ttab'], ['702\tb']])
+        self.assertListEqual(list(model.lookup('topics_text', qid='703')), [['703', 'c']])
+        model.qids = set(['702'])
+        self.assertListEqual(list(model.load_topics()), [('b', {'qid': '702'})])
+
+        model.remove_segments('topics_text', keep=[1])
+        self.assertListEqual(model.get_segments('topics_text'), [1])
+        self.assertFalse(model.contains(['freq_stats']))
+        self.assertRaises(IOError, model.get_output_path, 'freq_stats')
+
+
+class TestScore(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with gzip.open(os.path.join(self.tmpdir, 'freq_stats.gz'), 'wb') as out:
+            out.write(FREQ_STATS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_as_model(self):
+        names = ['SentenceLength', 'SentenceLocation', 'TermOverlap', 'LanguageModelScore']
+        model = summaryrank.Model(self.tmpdir)
+        model.save_topics([(QUERY, {'qid': '1'})])
+        model.save_sentences_qrels([(text, {'qid': '1', 'docno': 'D', 'id': str(i), 'rel': '0'})
+                                    for i, text in enumerate(SENTENCES, 1)])
+        mk.generate_terms(model, mk.get_stemmer('krovetz'))
+        expected = np.column_stack([feature.compute(model)
+                                    for feature in features.get_features(names)])
+
+        scores = summaryrank.score(QUERY, SENTENCES, names, path=self.tmpdir)
+        self.assertTupleEqual(scores.shape, (3, 4))
+        self.assertTrue(np.allclose(scores, expected))
+        self.assertListEqual(scoring.Scorer(names[:3]).names, names[:3])
+
+        # without freq_stats
+        self.assertRaises(ValueError, summaryrank.score, QUERY, SENTENCES, ['LanguageModelScore'])
+
+    def test_options(self):
+        default = summaryrank.score(QUERY, SENTENCES, ['LanguageModelScore'], path=self.tmpdir)
+        other = summaryrank.score(QUERY, SENTENCES, ['LanguageModelScore'],
+                                  argv=['--lm-mu', '100'], path=self.tmpdir)
+        self.assertFalse(np.allclose(default, other))
+        self.assertRaises(ValueError, summaryrank.score, QUERY, SENTENCES, ['SentenceLength'],
+                          argv=['--lm-mu', '100'])
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,116 @@
+#pylint: skip-file
+import unittest2
+import argparse
+import json
+import random
+
+import numpy as np
+
+import summaryrank
+from summaryrank import semantic, tagme
+from summaryrank.semantic import TagmeOverlap, Word2VecAlignment, Word2VecMaxSimilarity, \
+    Word2VecTopKAlignment
+
+
+class FakeWord2Vec(object):
+    """ Random unit-length word vectors for a fixed vocabulary """
+
+    def __init__(self, words, size=8, seed=1):
+        rng = np.random.RandomState(seed)
+        vectors = rng.randn(len(words), size)
+        vectors /= np.sqrt((vectors ** 2).sum(axis=1))[:, np.newaxis]
+        self.vectors = dict(zip(words, vectors))
+
+    def __contains__(self, word):
+        return word in self.vectors
+
+    def __getitem__(self, words):
+        return np.array([self.vectors[word] for word in words])
+
+
+class TestTagmeOverlap(unittest2.TestCase):
+    def test_jaccard_sorted(self):
+        for _ in range(100):
+            a = sorted(random.sample(range(20), random.randrange(10)))
+            b = sorted(random.sample(range(20), random.randrange(10)))
+            self.assertAlmostEqual(TagmeOverlap.jaccard_sorted(a, b),
+                                   TagmeOverlap.jaccard(a, b))
+
+    def test_get_entity_ids(self):
+        response = '{"annotations": [{"id": 12, "rho": 0.3}, {"id": 5, "rho": 0.05}, ' \
+                   '{"id": 12, "rho": 0.2}]}'
+        self.assertListEqual(tagme.get_entity_ids(response), [5, 12])
+        self.assertListEqual(tagme.get_entity_ids(response, rho=0.1), [12])
+        self.assertListEqual(tagme.get_entity_ids(''), [])
+
+    def test_same_over_ids(self):
+        def response(ids):
+            annotations = [{'id': i, 'rho': 0.05 * k} for k, i in enumerate(ids)]
+            return json.dumps({'annotations': annotations})
+
+        model = summaryrank.MemoryModel()
+        model.save_representation('topics_tagme', [('1', response([3, 7, 9]))])
+        model.save_representation('sentences_tagme', [
+            ('D', str(i), '1', response(ids) if ids else '')
+            for i, ids in enumerate([[3], [9, 7, 1, 3], [], [2, 4], [7, 7, 5]], 1)])
+
+        feature = TagmeOverlap(argparse.Namespace())
+        feature.check(model)
+        expected = feature.compute(model)
+        self.assertGreater(len(set(expected)), 2)
+
+        semantic._convert_to_entity_ids(model)
+        feature.check(model)
+        self.assertTrue(feature._use_ids)
+        self.assertListEqual(feature.compute(model), expected)
+
+
+class TestWord2Vec(unittest2.TestCase):
+    def setUp(self):
+        self.word2vec = FakeWord2Vec(['a', 'b', 'c', 'd', 'e', 'f'])
+        self.query = self.word2vec[['a', 'b']]
+        self.texts = ['c d e', 'a x c', 'x y', '', 'd d d f', 'b a f e c']
+
+    def _get_feature(self, cls):
+        feature = cls(argparse.Namespace(word2vec_model='fake', word2vec_k=2))
+        feature._word2vec = self.word2vec
+        return feature
+
+    def _compute_naive(self, reduce_sims):
+        # one sentence at a time, over each query-sentence term pair
+        result = []
+        for text in self.texts:
+            terms = sorted(set(t for t in text.split() if t in self.word2vec))
+            if not terms:
+                result.append(0)
+                continue
+            result.append(reduce_sims([[float(np.dot(q, self.word2vec[[t]][0])) for t in terms]
+                                       for q in self.query]))
+        return result
+
+    def _assert_scores(self, cls, reduce_sims):
+        scores = self._get_feature(cls).compute_group(self.query, self.texts)
+        expected = self._compute_naive(reduce_sims)
+        self.assertEqual(len(scores), len(expected))
+        for score, value in zip(scores, expected):
+            self.assertAlmostEqual(score, value, places=6)
+
+    def test_alignment(self):
+        self._assert_scores(Word2VecAlignment,
+                            lambda sims: np.mean([max(row) for row in sims]))
+
+    def test_max_similarity(self):
+        self._assert_scores(Word2VecMaxSimilarity,
+                            lambda sims: max(max(row) for row in sims))
+
+    def test_topk_alignment(self):
+        self._assert_scores(Word2VecTopKAlignment,
+                            lambda sims: np.mean([sorted(row)[-2:] for row in sims]))
+        # a repeated sentence term does not fill the top-K
+        feature = self._get_feature(Word2VecTopKAlignment)
+        self.assertAlmostEqual(feature.compute_group(self.query, ['d d d f'])[0],
+                               feature.compute_group(self.query, ['d f'])[0])
+
+    def test_no_query_terms(self):
+        feature = self._get_feature(Word2VecAlignment)
+        self.assertListEqual(feature.compute_group(None, self.texts), [0] * len(self.texts))
@@ -0,0 +1,125 @@
+#pylint: skip-file
+import unittest2
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import summaryrank
+from summaryrank import shard, svmlight_tools
+
+
+TOPICS = [('first topic', {'qid': '701'}), ('second topic', {'qid': '702'}),
+          ('third topic', {'qid': '703'})]
+
+SENTENCES = [
+    (u'a sentence', {'qid': '701', 'docno': 'D1', 'id': '1', 'rel': '1'}),
+    (u'another one', {'qid': '701', 'docno': 'D1', 'id': '2', 'rel': '1'}),
+    (u'more words', {'qid': '702', 'docno': 'D2', 'id': '1', 'rel': '1'}),
+    (u'even more', {'qid': '703', 'docno': 'D3', 'id': '1', 'rel': '1'}),
+    (u'and more', {'qid': '703', 'docno': 'D3', 'id': '2', 'rel': '1'}),
+    (u'the last', {'qid': '703', 'docno': 'D3', 'id': '3', 'rel': '1'}),
+]
+
+
+def _write_vectors(path, qrels):
+    with open(path, 'w') as out:
+        print >>out, '# Features in use'
+        print >>out, '# 1: SentenceLength'
+        for qrel in qrels:
+            print >>out, '{} qid:{} 1:{} # docno:{}:{}'.format(
+                qrel['rel'], qrel['qid'], qrel['id'], qrel['docno'], qrel['id'])
+
+
+class TestShard(unittest2.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.model = summaryrank.Model(os.path.join(self.path, 'model'))
+        self.model.save_topics(TOPICS)
+        self.model.save_sentences_qrels(SENTENCES)
+        self.model.save_representation('freq_stats', [('words', '1')])
+        self.shard_dir = os.path.join(self.path, 'shards')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_assign_shards(self):
+        qids = ['701', '702', '703']
+        assignment = shard.assign_shards(qids, 2, sizes={'701': 2, '702': 1, '703': 3})
+        self.assertDictEqual(assignment, {'703': 0, '701': 1, '702': 1})
+        assignment = shard.assign_shards(qids, 2)
+        self.assertSetEqual(set(assignment), set(qids))
+        self.assertDictEqual(assignment, shard.assign_shards(qids, 2))
+
+    def test_shard_merge(self):
+        shard.shard(['-m', self.model.path, '-n', '2', self.shard_dir])
+        spec = shard.load_spec(self.shard_dir)
+        self.assertListEqual([entry['qids'] for entry in spec['shards']], [['703'], ['701', '702']])
+
+        qrels = []
+        for entry in spec['shards']:
+            model = summaryrank.Model(os.path.join(self.shard_dir, entry['name']))
+            self.assertEqual(model.codec, self.model.codec)
+            self.assertListEqual([m['qid'] for _, m in model.load_topics()], entry['qids'])
+            self.assertListEqual(list(model.load_representation('freq_stats')), [['words', '1']])
+            shard_qrels = list(model.load_qrels())
+            self.assertEqual(len(shard_qrels), entry['sentences'])
+            _write_vectors(os.path.join(model.path, 'v.txt'), shard_qrels)
+            qrels.extend(shard_qrels)
+
+        _write_vectors(os.path.join(self.path, 'expected.txt'), self.model.load_qrels())
+        output = os.path.join(self.path, 'merged.txt')
+        self.assertFalse(shard.merge(['-o', output, self.shard_dir, 'v.txt']))
+        with open(os.path.join(self.path, 'expected.txt')) as expected, open(output) as merged:
+            self.assertEqual(merged.read(), expected.read())
+
+        output = os.path.join(self.path, 'merged.bvec')
+        self.assertFalse(shard.merge(['-o', output, self.shard_dir, 'v.txt']))
+        _, arrays = svmlight_tools.load_arrays(output)
+        self.assertListEqual(list(arrays.docnos), ['D1:1', 'D1:2', 'D2:1', 'D3:1', 'D3:2', 'D3:3'])
+
+        os.remove(os.path.join(self.shard_dir, 'shard-000', 'v.txt'))
+        self.assertEqual(shard.merge([self.shard_dir, 'v.txt']), 1)
+
+    def test_interrupted_shard(self):
+        # a representation that fails to load leaves nothing behind in the shards
+        path = self.model.get_path('sentences_text')
+        with open(path, 'rb') as in_:
+            data = in_.read()
+        with open(path, 'wb') as out:
+            out.write(data[:len(data) // 2])
+        self.assertRaises(Exception, shard.shard, ['-m', self.model.path, '-n', '2',
+                                                   self.shard_dir])
+        for i in range(2):
+            model = summaryrank.Model(os.path.join(self.shard_dir, shard.get_shard_name(i)))
+            self.assertListEqual(model.get_segments('sentences_text'), [])
+            self.assertFalse(any('.tmp' in name for name in os.listdir(model.path)))
+
+    def test_claim(self):
+        path = os.path.join(self.path, 'task.lock')
+        self.assertTrue(shard.claim(path))
+        self.assertFalse(shard.claim(path))
+        self.assertFalse(shard.claim(path, stale=60))
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        self.assertTrue(shard.claim(path, stale=60))
+        self.assertFalse(shard.claim(path, stale=60))
+        self.assertListEqual(sorted(os.listdir(self.path)), ['model', 'task.lock'])
+
+    def test_heartbeat(self):
+        path = os.path.join(self.path, 'task.lock')
+        self.assertTrue(shard.claim(path))
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=shard._heartbeat, args=(path, 0.01, stopped))
+        heartbeat.start()
+        time.sleep(0.1)
+        stopped.set()
+        heartbeat.join()
+        self.assertFalse(shard.claim(path, stale=60))
+
+
+if __name__ == '__main__':
+    unittest2.main()
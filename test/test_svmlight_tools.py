@@ -0,0 +1,328 @@
+#pylint: skip-file
+import unittest2
+import gzip
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+import numpy as np
+
+from summaryrank import svmlight_tools
+
+
+DATA = r'''
+# Features in use
+# 1: SentenceLength()
+# 2: SentenceLocation()
+0 qid:701 1:18 2:0.002257 # docno:GX268-35-11839875-701:1
+1 qid:701 1:33 2:0.004515 # docno:GX268-35-11839875-701:2
+0 qid:702 1:3 2:0.934884 # docno:GX267-05-8546339-702:201
+2 qid:702 1:3 2:0.939535 # docno:GX267-05-8546339-702:202
+0 qid:701 1:17 2:0.006772 # docno:GX268-35-11839875-701:3
+0 qid:703 1:3 2:0.944186 # docno:GX267-05-8546339-703:203
+'''.lstrip()
+
+
+class TestVectorIndex(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'vectors.txt')
+        with open(self.path, 'w') as out:
+            out.write(DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_build(self):
+        index = svmlight_tools.VectorIndex.build(self.path)
+        self.assertEqual(DATA[:index.data_offset], ''.join(DATA.splitlines(True)[:3]))
+        self.assertListEqual(index.qids, ['701', '702', '703'])
+        self.assertListEqual([qid for qid, _, _ in index.ranges], ['701', '702', '701', '703'])
+        ranges = index.get_ranges_by_qid()
+        self.assertSetEqual(set(ranges), set(index.qids))
+        for qid in index.qids:
+            self.assertListEqual(ranges[qid], index.get_ranges([qid]))
+
+        out = StringIO()
+        with open(self.path, 'rb') as in_:
+            svmlight_tools.copy_ranges(in_, out, index.get_ranges(['701']))
+        self.assertListEqual(out.getvalue().splitlines(),
+                             [line for line in DATA.splitlines() if 'qid:701' in line])
+
+    def test_get_index(self):
+        index = svmlight_tools.get_index(self.path)
+        self.assertTrue(os.path.isfile(self.path + '.idx'))
+        saved = svmlight_tools.VectorIndex.load(self.path + '.idx')
+        self.assertTrue(saved.is_valid_for(self.path))
+        self.assertListEqual(saved.ranges, index.ranges)
+        self.assertEqual(saved.data_offset, index.data_offset)
+
+        with open(self.path, 'a') as out:
+            out.write('0 qid:704 1:1 2:0.5 # docno:X:1\n')
+        self.assertFalse(saved.is_valid_for(self.path))
+        self.assertListEqual(svmlight_tools.get_index(self.path).qids,
+                             ['701', '702', '703', '704'])
+
+
+JOIN_LEFT = r'''
+# Features in use
+# 1: SentenceLength()
+0 qid:701 1:18 # docno:GX268-35-11839875-701:1
+1 qid:701 1:33 # docno:GX268-35-11839875-701:2
+0 qid:702 1:3 # docno:GX267-05-8546339-702:201
+'''.lstrip()
+
+JOIN_RIGHT = r'''
+# Features in use
+# 1: SentenceLocation()
+0 qid:702 1:0.934884 # docno:GX267-05-8546339-702:201
+0 qid:701 1:0.002257 # docno:GX268-35-11839875-701:1
+'''.lstrip()
+
+
+class TestJoin(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.left = os.path.join(self.tmpdir, 'left.txt')
+        self.right = os.path.join(self.tmpdir, 'right.txt')
+        self.output = os.path.join(self.tmpdir, 'output.txt')
+        with open(self.left, 'w') as out:
+            out.write(JOIN_LEFT)
+        with open(self.right, 'w') as out:
+            out.write(JOIN_RIGHT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_align(self):
+        svmlight_tools.join(['--align', '-o', self.output, self.left, self.right])
+        with open(self.output) as in_:
+            self.assertListEqual(in_.read().splitlines(), [
+                '# Features in use',
+                '# 1: SentenceLength()',
+                '# 2: SentenceLocation()',
+                '0 qid:701 1:18 2:0.002257 # docno:GX268-35-11839875-701:1',
+                '0 qid:702 1:3 2:0.934884 # docno:GX267-05-8546339-702:201',
+            ])
+
+    def test_misaligned(self):
+        self.assertEqual(svmlight_tools.join(['-o', self.output, self.left, self.right]), 1)
+
+    def test_compressed_output(self):
+        output = self.output + '.gz'
+        svmlight_tools.join(['--align', '-o', output, self.left, self.right])
+        with gzip.open(output) as in_:
+            self.assertEqual(len(in_.read().splitlines()), 5)
+
+
+class TestSplit(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'vectors.txt.gz')
+        with gzip.open(self.path, 'wb') as out:
+            out.write(DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_split_compressed(self):
+        svmlight_tools.split(['-k', '3', '-c', self.path])
+        preamble = DATA.splitlines(True)[:3]
+        folds = [[line for line in DATA.splitlines(True) if 'qid:' + qid in line]
+                 for qid in ['701', '702', '703']]
+        for k in range(3):
+            with open('{}.fold-{}_test'.format(self.path, k + 1)) as in_:
+                self.assertListEqual(in_.readlines(), preamble + folds[k])
+            with open('{}.fold-{}_training'.format(self.path, k + 1)) as in_:
+                self.assertListEqual(in_.readlines(), preamble + [
+                    line for i in range(3) if i != k for line in folds[i]])
+        self.assertListEqual(sorted(os.listdir(self.tmpdir)),
+                             sorted(['vectors.txt.gz'] +
+                                    ['vectors.txt.gz.fold-{}_{}'.format(k, name)
+                                     for k in range(1, 4) for name in ['test', 'training']]))
+
+    def test_split_bgzf(self):
+        out = svmlight_tools.open_output(self.path)
+        out.write(DATA)
+        out.close()
+        svmlight_tools.split(['-k', '3', self.path])
+        for k, qid in enumerate(['701', '702', '703']):
+            with open('{}.fold-{}_test'.format(self.path, k + 1)) as in_:
+                self.assertListEqual(in_.readlines(), DATA.splitlines(True)[:3] + [
+                    line for line in DATA.splitlines(True) if 'qid:' + qid in line])
+        # the file is read in place rather than spooled
+        self.assertTrue(os.path.isfile(self.path + '.idx'))
+
+
+class TestSelectShuffle(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'vectors.txt')
+        self.output = os.path.join(self.tmpdir, 'output.txt.gz')
+        with open(self.path, 'w') as out:
+            out.write(DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read_output(self):
+        with gzip.open(self.output) as in_:
+            return in_.read().splitlines(True)
+
+    def test_select(self):
+        expected = DATA.splitlines(True)[:3] + [
+            line for line in DATA.splitlines(True) if 'qid:702' in line]
+        svmlight_tools.select(['-q', '702', '-o', self.output, self.path])
+        self.assertListEqual(self._read_output(), expected)
+
+        # the same without an index
+        with gzip.open(self.path + '.gz', 'wb') as out:
+            out.write(DATA)
+        svmlight_tools.select(['-q', '702', '-o', self.output, self.path + '.gz'])
+        self.assertListEqual(self._read_output(), expected)
+
+    def test_shuffle(self):
+        svmlight_tools.shuffle(['-seed', '1', '-o', self.output, self.path])
+        lines = self._read_output()
+        self.assertListEqual(lines[:3], DATA.splitlines(True)[:3])
+        self.assertItemsEqual(lines, DATA.splitlines(True))
+
+
+class TestWriteVectors(unittest2.TestCase):
+    def test_write_vectors_columnwise(self):
+        columns = [[1.0, 0.0], [0.0, 0.0], [1 / 3.0, 2.0]]
+        args = (['701', '702'], [1, 0], ['D:1', 'D:2'], columns)
+
+        out = StringIO()
+        svmlight_tools.write_vectors_columnwise(out, *args)
+        self.assertListEqual(out.getvalue().splitlines(), [
+            '1 qid:701 1:1.0 2:0.0 3:0.333333333333 # docno:D:1',
+            '0 qid:702 1:0.0 2:0.0 3:2.0 # docno:D:2',
+        ])
+
+        out = StringIO()
+        svmlight_tools.write_vectors_columnwise(out, *args, sparse=True, precision=3)
+        self.assertListEqual(out.getvalue().splitlines(), [
+            '1 qid:701 1:1 3:0.333 # docno:D:1',
+            '0 qid:702 3:2 # docno:D:2',
+        ])
+
+
+class TestParseArrays(unittest2.TestCase):
+    def test_parse_arrays(self):
+        arrays = svmlight_tools.parse_arrays(DATA.splitlines()[3:5])
+        self.assertListEqual(arrays.matrix.tolist(), [[18.0, 0.002257], [33.0, 0.004515]])
+        self.assertListEqual(arrays.docnos.tolist(),
+                             ['GX268-35-11839875-701:1', 'GX268-35-11839875-701:2'])
+
+    def test_malformed(self):
+        for bad in ('1 qid:701 1:18 2:abc # docno:D:2', '1 qid:701 1:18 2 # docno:D:2',
+                    '1 qid:701 1:18:2 # docno:D:2'):
+            lines = DATA.splitlines()[3:4] + [bad] + DATA.splitlines()[5:6]
+            with self.assertRaisesRegex(ValueError, 'docno:D:2'):
+                svmlight_tools.parse_arrays(lines)
+
+
+class TestCut(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'vectors.txt')
+        with open(self.path, 'w') as out:
+            out.write(DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_line_ranges(self):
+        ranges = svmlight_tools.get_line_ranges(self.path, 10, 4)
+        self.assertEqual(ranges[0][0], 10)
+        self.assertEqual(sum(length for _, length in ranges), len(DATA) - 10)
+        for offset, _ in ranges[1:]:
+            self.assertEqual(DATA[offset - 1], '\n')
+
+    def test_cut(self):
+        expected = [
+            '# Features in use',
+            '# 1: SentenceLocation()',
+            '0 qid:701 1:0.002257 # docno:GX268-35-11839875-701:1',
+            '1 qid:701 1:0.004515 # docno:GX268-35-11839875-701:2',
+            '0 qid:702 1:0.934884 # docno:GX267-05-8546339-702:201',
+            '2 qid:702 1:0.939535 # docno:GX267-05-8546339-702:202',
+            '0 qid:701 1:0.006772 # docno:GX268-35-11839875-701:3',
+            '0 qid:703 1:0.944186 # docno:GX267-05-8546339-703:203',
+        ]
+
+        for processes in [1, 3]:
+            output = os.path.join(self.tmpdir, 'output.txt')
+            svmlight_tools.cut(['-f', '2', '--renumbering', '-j', str(processes),
+                                '-o', output, self.path])
+            with open(output) as in_:
+                self.assertListEqual(in_.read().splitlines(), expected)
+
+        # compressed output is complete once cut returns
+        output = os.path.join(self.tmpdir, 'output.txt.gz')
+        svmlight_tools.cut(['-f', '2', '--renumbering', '-o', output, self.path])
+        with gzip.open(output) as in_:
+            self.assertListEqual(in_.read().splitlines(), expected)
+
+
+class TestNormalize(unittest2.TestCase):
+    def setUp(self):
+        self.matrix = np.array([[1.0, 5.0, 2.0],
+                                [3.0, 5.0, 2.0],
+                                [2.0, 5.0, 4.0]])
+
+    def test_normalizers(self):
+        self.assertListEqual(svmlight_tools.normalize_minmax(self.matrix).tolist(),
+                             [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.5, 0.0, 1.0]])
+        self.assertListEqual(svmlight_tools.normalize_rank(self.matrix).tolist(),
+                             [[0.0, 0.0, 0.25], [1.0, 0.0, 0.25], [0.5, 0.0, 1.0]])
+        self.assertListEqual(svmlight_tools.normalize_sum(self.matrix)[:, 0].tolist(),
+                             [1 / 6.0, 3 / 6.0, 2 / 6.0])
+        zscores = svmlight_tools.normalize_zscore(self.matrix)
+        self.assertTrue(np.allclose(zscores.mean(axis=0), 0))
+        self.assertListEqual(zscores[:, 1].tolist(), [0.0, 0.0, 0.0])
+
+    def test_constant_column(self):
+        # constant features become 0, as documented
+        for method in ('minmax', 'zscore', 'rank'):
+            result = svmlight_tools.NORMALIZERS[method](self.matrix)
+            self.assertListEqual(result[:, 1].tolist(), [0.0, 0.0, 0.0])
+
+    def test_normalize_groups(self):
+        qids = ['701', '701', '702', '702', '702']
+        matrix = np.vstack([self.matrix[:2, :], self.matrix])
+        result = svmlight_tools.normalize_groups(matrix, qids, 'minmax')
+        self.assertListEqual(result[:2].tolist(), [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+        self.assertListEqual(result[2:].tolist(),
+                             svmlight_tools.normalize_minmax(self.matrix).tolist())
+
+    def test_normalize_without_preamble(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'vectors.txt')
+            output = os.path.join(tmpdir, 'output.txt')
+            with open(path, 'w') as out:
+                out.write(''.join(DATA.splitlines(True)[3:]))
+            svmlight_tools.normalize(['-o', output, path])
+            names, arrays = svmlight_tools.load_arrays(output)
+            self.assertListEqual(names, ['Unknown', 'Unknown'])
+            self.assertListEqual(arrays.matrix[:2].tolist(), [[0.0, 0.0], [1.0, 1.0]])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_iter_groups(self):
+        chunks = [svmlight_tools.parse_arrays(DATA.splitlines()[3:5]),
+                  svmlight_tools.parse_arrays(DATA.splitlines()[5:7]),
+                  svmlight_tools.parse_arrays(DATA.splitlines()[7:])]
+        groups = list(svmlight_tools.iter_groups(chunks))
+        self.assertListEqual([group.qids.tolist() for group in groups],
+                             [['701', '701'], ['702', '702'], ['701'], ['703']])
+
+    def test_iter_whole_groups(self):
+        lines = DATA.splitlines()[3:]
+        chunks = [svmlight_tools.parse_arrays(lines[i:i + 3]) for i in range(0, len(lines), 3)]
+        chunks = list(svmlight_tools.iter_whole_groups(chunks))
+        self.assertListEqual([chunk.qids.tolist() for chunk in chunks],
+                             [['701', '701'], ['702', '702', '701'], ['703']])
@@ -0,0 +1,154 @@
+#pylint: skip-file
+import unittest2
+import json
+import shutil
+import tempfile
+import time
+import threading
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from summaryrank import tagme
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.getheader('Content-Length'))
+        params = urlparse.parse_qs(self.rfile.read(length))
+        text = params['text'][0]
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failures = server.failures.get(text, 0)
+            if failures > 0:
+                server.failures[text] = failures - 1
+
+        if params['key'][0] != 'KEY':
+            self.respond(403, 'invalid key')
+        elif failures > 0:
+            self.respond(server.failure_status, 'try again', server.retry_after)
+        else:
+            annotations = [{'id': len(word), 'title': word} for word in text.split()]
+            self.respond(200, json.dumps({'annotations': annotations}))
+
+    def respond(self, status, body, retry_after=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if retry_after is not None:
+            self.send_header('Retry-After', retry_after)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.failures = dict()
+        self.failure_status = 503
+        self.retry_after = None
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+
+class TestClient(unittest2.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/tag'.format(self.server.server_address[1])
+        self.texts = ['sentence number {}'.format('x' * i) for i in range(50)]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_tag_many(self):
+        client = tagme.Client('KEY', url=self.url, concurrency=4)
+        results = list(client.tag_many(self.texts))
+        self.assertEqual(len(results), len(self.texts))
+        for text, (rep, error) in zip(self.texts, results):
+            self.assertIsNone(error)
+            self.assertListEqual(tagme.get_entity_ids(rep),
+                                 sorted(set(len(word) for word in text.split())))
+        # connections are kept alive and reused across requests
+        self.assertLessEqual(self.server.connections, 4)
+        self.assertEqual(self.server.requests, len(self.texts))
+
+    def test_retries(self):
+        self.server.failures[self.texts[3]] = 2
+        client = tagme.Client('KEY', url=self.url, concurrency=2, retries=2, backoff=0.01)
+        results = list(client.tag_many(self.texts[:5]))
+        self.assertTrue(all(error is None for _, error in results))
+        self.assertEqual(self.server.requests, 7)
+
+        self.server.failures[self.texts[0]] = 5
+        rep, error = list(client.tag_many(self.texts[:1]))[0]
+        self.assertIsNone(rep)
+        self.assertEqual(error.status, 503)
+
+    def test_too_many_requests(self):
+        self.server.failures[self.texts[0]] = 1
+        self.server.failure_status = 429
+        self.server.retry_after = '1'
+        client = tagme.Client('KEY', url=self.url, retries=1, backoff=0.01)
+        start = time.time()
+        rep, error = list(client.tag_many(self.texts[:1]))[0]
+        self.assertIsNone(error)
+        self.assertEqual(self.server.requests, 2)
+        self.assertGreaterEqual(time.time() - start, 1)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(tagme.parse_retry_after('120'), 120)
+        self.assertEqual(tagme.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertIsNone(tagme.parse_retry_after('soon'))
+        self.assertIsNone(tagme.parse_retry_after(None))
+
+    def test_client_error(self):
+        client = tagme.Client('WRONG', url=self.url, retries=3, backoff=0.01)
+        rep, error = list(client.tag_many(self.texts[:1]))[0]
+        self.assertEqual(error.status, 403)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_rate_limit(self):
+        limiter = tagme.RateLimiter(rate=100)
+        start = time.time()
+        for _ in range(21):
+            limiter.wait()
+        self.assertGreaterEqual(time.time() - start, 0.19)
+
+    def test_cache(self):
+        cache = tagme.AnnotationCache(tempfile.mkdtemp())
+        try:
+            client = tagme.Client('KEY', url=self.url, cache=cache)
+            first = list(client.tag_many(self.texts + self.texts[:5]))
+            self.assertLessEqual(self.server.requests, len(self.texts) + 5)
+
+            requests = self.server.requests
+            client = tagme.Client('KEY', url=self.url, cache=cache)
+            second = list(client.tag_many(self.texts))
+            self.assertEqual(self.server.requests, requests)
+            self.assertListEqual(first[:len(self.texts)], second)
+
+            # different options make different keys
+            client = tagme.Client('KEY', url=self.url, cache=cache, lang='de')
+            list(client.tag_many(self.texts[:1]))
+            self.assertEqual(self.server.requests, requests + 1)
+        finally:
+            shutil.rmtree(cache.path)
@@ -0,0 +1,70 @@
+#pylint: skip-file
+import unittest2
+import os
+import shutil
+import tarfile
+import tempfile
+from StringIO import StringIO
+
+from summaryrank import trec_novelty
+
+
+DOCS = {
+    'N1.docs_text': '''<DOC docid="APW1">
+<s docid="APW1" num="1"> First sentence </s>
+<s docid="APW1" num="2">Caf\xe9 au lait</s>
+<s docid="APW1" num="3">
+not a sentence</s>
+</DOC>
+''',
+    '2.doc_text': '''<DOC docid="NYT2">
+<s docid="NYT2" num="1">Another one</s>
+</DOC>
+''',
+}
+
+QRELS = '''N1 APW1:2
+N2 NYT2:1
+'''
+
+
+class TestTRECNovelty(unittest2.TestCase):
+    def setUp(self):
+        self.data = StringIO()
+        with tarfile.open(fileobj=self.data, mode='w') as tarball:
+            for name in sorted(DOCS, reverse=True):
+                info = tarfile.TarInfo(name)
+                info.size = len(DOCS[name])
+                tarball.addfile(info, StringIO(DOCS[name]))
+
+    def test_get_qrels(self):
+        self.assertDictEqual(trec_novelty.get_qrels(StringIO(QRELS)),
+                             {'N1': {('APW1', '2')}, 'N2': {('NYT2', '1')}})
+
+    def test_get_sentences(self):
+        qrels = trec_novelty.get_qrels(StringIO(QRELS))
+        for processes in [1, 2]:
+            self.data.seek(0)
+            tarball = tarfile.open(fileobj=self.data, mode='r|')
+            sentences = list(trec_novelty.get_sentences(
+                tarball, ['N1', 'N2', 'N3'], qrels, charset='latin-1', processes=processes))
+            self.assertListEqual([s for s, _ in sentences],
+                                 [u'First sentence ', u'Caf\xe9 au lait', u'Another one'])
+            self.assertListEqual([(m['qid'], m['docno'], m['id'], m['rel']) for _, m in sentences],
+                                 [('N1', 'APW1', '1', '0'), ('N1', 'APW1', '2', '1'),
+                                  ('N2', 'NYT2', '1', '1')])
+
+    def test_open_corpus(self):
+        path = tempfile.mkdtemp()
+        try:
+            for filename, mode in (('corpus.tar', 'w'), ('corpus.tgz', 'w:gz'),
+                                   ('corpus.tar.gz', 'w:gz')):
+                filename = os.path.join(path, filename)
+                with tarfile.open(filename, mode) as tarball:
+                    self.data.seek(0)
+                    for info in tarfile.open(fileobj=self.data, mode='r|'):
+                        tarball.addfile(info, StringIO(DOCS[info.name]))
+                corpus = trec_novelty.open_corpus(filename)
+                self.assertListEqual([info.name for info in corpus], sorted(DOCS, reverse=True))
+        finally:
+            shutil.rmtree(path)
@@ -1,8 +1,14 @@
 #pylint: skip-file
 import unittest2
+import gc
 import random
+import time
+import weakref
 
-from summaryrank.util import unique, subset, CountIndicator
+from StringIO import StringIO
+
+from summaryrank import util
+from summaryrank.util import unique, subset, CountIndicator, BackgroundWriter, RowWriter
 
 class TestUtil(unittest2.TestCase):
     def test_unique(self):
@@ -28,3 +34,64 @@ class TestUtil(unittest2.TestCase):
                     if p % j == 0:
                         break
                 ind.update()
+
+    def test_BackgroundWriter(self):
+        class StandInFile(StringIO):
+            def close(self):
+                self.value = self.getvalue()
+
+        fileobj = StandInFile()
+        with BackgroundWriter(fileobj, bufsize=10) as out:
+            for i in range(1000):
+                print >>out, i,
+        self.assertEqual(fileobj.value, ' '.join(str(i) for i in range(1000)))
+
+        class BrokenFile(object):
+            def write(self, data):
+                raise IOError('disk full')
+
+            def close(self):
+                pass
+
+        out = BackgroundWriter(BrokenFile())
+        out.write('data')
+        self.assertRaises(IOError, out.close)
+        # the error sticks, as the data after it is lost
+        self.assertRaises(IOError, out.close)
+
+        out = BackgroundWriter(BrokenFile())
+        out.write('data')
+        out.flush()
+        while out._error is None:
+            time.sleep(0.01)
+        self.assertRaises(IOError, out.write, 'more')
+        self.assertRaises(IOError, out.write, 'more')
+        self.assertRaises(IOError, out.close)
+
+    def test_BackgroundWriter_released(self):
+        # closed writers (and their files) are not kept around until exit
+        fileobj = StringIO()
+        out = BackgroundWriter(fileobj)
+        self.assertIn(out, util._OPEN_WRITERS)
+        out.close()
+        self.assertNotIn(out, util._OPEN_WRITERS)
+        ref = weakref.ref(fileobj)
+        del out, fileobj
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_RowWriter(self):
+        class StandInFile(StringIO):
+            def close(self):
+                self.value = self.getvalue()
+
+        fileobj = StandInFile()
+        with RowWriter(fileobj, batch_size=7) as out:
+            out.write('# header\n')
+            for i in range(100):
+                out.write_row((str(i), 'row {}'.format(i)))
+                if i == 50:
+                    out.write('# middle\n')
+        lines = ['{}\trow {}\n'.format(i, i) for i in range(100)]
+        self.assertEqual(fileobj.value,
+                         ''.join(['# header\n'] + lines[:51] + ['# middle\n'] + lines[51:]))
@@ -1,5 +1,8 @@
 #pylint: skip-file
 import unittest2
+import os
+import shutil
+import tempfile
 from StringIO import StringIO
 
 from summaryrank import webap
@@ -74,6 +77,56 @@ class TestWebAPSimpleExample(unittest2.TestCase):
         self.assertTrue(all_the_same([s[1]['original_docno'] for s in sentences]))
 
 
+class TestWebAPParallel(unittest2.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'corpus.trectext')
+        docs = []
+        for i, qid in enumerate(['701', '701', '702', '703']):
+            docs.append('''<DOC>
+<DOCNO>GX000-00-{0}-{1}</DOCNO>
+<TARGET_QID>{1}</TARGET_QID>
+<ORIGINAL_DOCNO>GX000-00-{0}</ORIGINAL_DOCNO>
+<TEXT>
+<GOOD>
+<SENTENCE>first sentence of {0}</SENTENCE>
+<SENTENCE>caf\xc3\xa9 &amp; more</SENTENCE>
+</GOOD>
+<NONE>
+<SENTENCE>last sentence of {0}</SENTENCE>
+</NONE>
+</TEXT>
+</DOC>
+'''.format(i, qid))
+        with open(self.path, 'w') as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n<ROOT>\n')
+            out.write(''.join(docs))
+            out.write('</ROOT>\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_doc_chunks(self):
+        header, footer, ranges = webap.get_doc_chunks(self.path, chunk_size=1)
+        self.assertEqual(header, '<?xml version="1.0" encoding="UTF-8"?>\n<ROOT>\n')
+        self.assertEqual(footer, '</ROOT>')
+        self.assertEqual(len(ranges), 4)
+        with open(self.path) as in_:
+            data = in_.read()
+        for offset, length in ranges:
+            self.assertTrue(data[offset:offset + length].startswith('<DOC>'))
+            self.assertTrue(data[offset:offset + length].rstrip().endswith('</DOC>'))
+
+    def test_get_sentences_parallel(self):
+        with open(self.path) as in_:
+            expected = list(webap.get_sentences(in_))
+        self.assertEqual(len(expected), 12)
+        for chunk_size in [1, 500, 1024 * 1024]:
+            self.assertListEqual(
+                list(webap.get_sentences_parallel(self.path, processes=2, chunk_size=chunk_size)),
+                expected)
+
+
 class TestWebAPTopics(unittest2.TestCase):
     def setUp(self):
         self.data = r'''